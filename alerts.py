@@ -0,0 +1,323 @@
+import asyncio
+import bisect
+import re
+from collections import namedtuple
+
+from prices import NUMBER_PATTERN, PRICE_BOUNDS, parse_price
+
+# ====================
+# SAVED-SEARCH ALERTS
+# ====================
+# Saved searches live in the saved_searches table and, for matching, in an
+# in-memory inverted index keyed on (make, model, car_type), where None
+# means "any". Make is the first word of the car name and model the rest,
+# so "land rover defender" is keyed the same however the seller split it,
+# and an alert for "toyota land" also matches a "Toyota Land Cruiser". A
+# new ad looks up a handful of buckets; inside a bucket the alerts are
+# sorted by minimum price, so only the prefix whose minimum is at or below
+# the ad price is checked against the remaining bounds.
+#
+# A sale price and a daily rental price are not comparable, so an alert
+# with a price always has a car_type: when the user does not say "sale" or
+# "rental" it is inferred from which PRICE_BOUNDS the amounts fall in.
+
+Alert = namedtuple(
+    "Alert",
+    "id user_id query make model car_type min_price max_price min_year max_year"
+)
+_ALERT_COLUMNS = ", ".join(Alert._fields)
+
+_CAR_TYPE_RE = re.compile(r"\b(?:for\s+)?(sale|rental|rent)\b")
+# "1,500,000", "1.5m", "900k birr"; (?!\d) stops "900 2015" being read
+# as one space-separated number
+_AMOUNT = r"(" + NUMBER_PATTERN + r")(?!\d)\s*(?:birr|br|etb)?"
+_MAX_PRICE_RE = re.compile(r"(?:\b(?:under|below|max|upto|up\s+to)\b|<)\s*" + _AMOUNT)
+_MIN_PRICE_RE = re.compile(r"(?:\b(?:over|above|min|from)\b|>)\s*" + _AMOUNT)
+_YEAR = r"((?:19|20)\d{2})"
+# "from 2015" is a model year unless an amount or currency follows
+_FROM_YEAR_RE = re.compile(
+    r"\bfrom\s+" + _YEAR + r"\b(?!\s*(?:[.,]\d|k\b|m\b|mil|mln|thousand|million|birr|br\b|etb))"
+)
+_YEAR_RANGE_RE = re.compile(_YEAR + r"\s*-\s*" + _YEAR + r"\b")
+_MIN_YEAR_RE = re.compile(r"(?:\b(?:after|since)\s+)?" + _YEAR + r"\s*\+|\b(?:after|since)\s+" + _YEAR + r"\b")
+_MAX_YEAR_RE = re.compile(r"\b(?:before|until)\s+" + _YEAR + r"\b")
+_EXACT_YEAR_RE = re.compile(r"\b" + _YEAR + r"\b")
+# Amounts left over once prices and years are taken; short plain numbers
+# are part of the car name ("peugeot 308", "bmw 3 series")
+_LEFTOVER_AMOUNT_RE = re.compile(r"(?<![\w.])" + NUMBER_PATTERN)
+_WORD_RE = re.compile(r"[^\W\d_][\w-]*|\d[\w-]*", re.UNICODE)
+_YEAR_DIGITS_RE = re.compile(r"\d{4}")
+
+# First word of the makes sold in Ethiopia ("land" for Land Rover, "great"
+# for Great Wall), as split_name keys them. Alerts for other words are
+# still saved, but the user is told they may never match.
+KNOWN_MAKES = frozenset((
+    "acura", "alfa", "audi", "baic", "benz", "bmw", "byd", "cadillac", "changan",
+    "chery", "chevrolet", "citroen", "daewoo", "daihatsu", "dfsk", "dodge",
+    "dongfeng", "faw", "fiat", "ford", "foton", "geely", "gmc", "great", "haval",
+    "honda", "hyundai", "infiniti", "isuzu", "iveco", "jac", "jaguar", "jeep",
+    "jetour", "kia", "lada", "land", "lexus", "lifan", "mahindra", "mazda",
+    "mercedes", "mercedes-benz", "mg", "mini", "mitsubishi", "nissan", "opel",
+    "peugeot", "porsche", "range", "renault", "scania", "seat", "sinotruk",
+    "skoda", "ssangyong", "subaru", "suzuki", "tata", "tesla", "toyota",
+    "volkswagen", "volvo", "vw",
+))
+
+
+def split_name(make, model=None):
+    """Return (make, model) as the first word of the car name and the rest"""
+    words = f"{make or ''} {model or ''}".lower().split()
+    if not words:
+        return None, None
+    return words[0], " ".join(words[1:]) or None
+
+
+def parse_year(text):
+    """First four-digit number in a year field, or None"""
+    match = _YEAR_DIGITS_RE.search(str(text or ""))
+    return int(match.group()) if match else None
+
+
+def _amount(text):
+    parsed = parse_price(text)
+    return parsed[0] if parsed else None
+
+
+def price_car_types(*amounts):
+    """The car_types whose PRICE_BOUNDS admit every given amount"""
+    amounts = [amount for amount in amounts if amount]
+    return [
+        car_type for car_type, (low, high) in PRICE_BOUNDS.items()
+        if all(low <= amount <= high for amount in amounts)
+    ]
+
+
+def _check_price(amount, car_type, phrase):
+    """Raise ValueError unless amount is a plausible price (for car_type, if given)"""
+    if amount is not None and (price_car_types(amount) if car_type is None
+                               else car_type in price_car_types(amount)):
+        return
+    if car_type == "rental":
+        example = "\"rental under 3,000\" (Birr per day)"
+    else:
+        example = "\"under 1,500,000\" or \"under 1.5M\""
+    raise ValueError(f"\"{phrase}\" is not a price we can match. Write it in Birr, for example {example}.")
+
+
+def known_make(make):
+    return make in KNOWN_MAKES
+
+
+def describe_alert(fields):
+    """The parsed criteria in words, to show the user what was saved"""
+    parts = [" ".join(name.title() for name in (fields["make"], fields["model"]) if name) or "Any car"]
+    if fields["car_type"]:
+        parts.append("for sale" if fields["car_type"] == "sale" else "for rent")
+    unit = "Birr/day" if fields["car_type"] == "rental" else "Birr"
+    if fields["min_price"] and fields["max_price"]:
+        parts.append(f"{fields['min_price']:,}-{fields['max_price']:,} {unit}")
+    elif fields["max_price"]:
+        parts.append(f"up to {fields['max_price']:,} {unit}")
+    elif fields["min_price"]:
+        parts.append(f"from {fields['min_price']:,} {unit}")
+    if fields["min_year"] and fields["min_year"] == fields["max_year"]:
+        parts.append(f"year {fields['min_year']}")
+    elif fields["min_year"] and fields["max_year"]:
+        parts.append(f"years {fields['min_year']}-{fields['max_year']}")
+    elif fields["min_year"]:
+        parts.append(f"{fields['min_year']} or newer")
+    elif fields["max_year"]:
+        parts.append(f"{fields['max_year']} or older")
+    return ", ".join(parts)
+
+
+def parse_alert(text):
+    """Parse "toyota vitz under 1.5M 2015+" into saved-search fields.
+
+    Returns a dict with make, model, car_type, min_price, max_price,
+    min_year and max_year (None where unspecified), or None when the text
+    has no criteria at all. Raises ValueError, with a message for the user,
+    when a price is unreadable, implausible or could be either a sale or a
+    rental price, or when a number is left that is not a price or a year.
+    """
+    # Commas stay until the amounts are taken: "1,500,000" is one number
+    rest = (text or "").lower().replace("birr", " birr")
+    fields = dict.fromkeys(
+        ("make", "model", "car_type", "min_price", "max_price", "min_year", "max_year")
+    )
+
+    def take(pattern):
+        nonlocal rest
+        match = pattern.search(rest)
+        if match:
+            rest = rest[:match.start()] + " " + rest[match.end():]
+        return match
+
+    match = take(_CAR_TYPE_RE)
+    if match:
+        fields["car_type"] = "sale" if match.group(1) == "sale" else "rental"
+    match = take(_FROM_YEAR_RE)
+    if match:
+        fields["min_year"] = int(match.group(1))
+    phrases = []
+    for name, pattern in (("max_price", _MAX_PRICE_RE), ("min_price", _MIN_PRICE_RE)):
+        match = take(pattern)
+        if match:
+            fields[name] = _amount(match.group(1))
+            phrases.append(match.group(0).strip())
+            _check_price(fields[name], fields["car_type"], phrases[-1])
+    if fields["min_price"] and fields["max_price"] and fields["min_price"] > fields["max_price"]:
+        raise ValueError("The minimum price is above the maximum price.")
+    if phrases and fields["car_type"] is None:
+        car_types = price_car_types(fields["min_price"], fields["max_price"])
+        if not car_types:
+            raise ValueError(
+                f"\"{phrases[0]}\" and \"{phrases[1]}\" cannot both be sale prices "
+                f"or both daily rental prices."
+            )
+        if len(car_types) > 1:
+            raise ValueError(
+                f"Is \"{' '.join(phrases)}\" a sale price or a daily rental price? "
+                f"Add \"sale\" or \"rental\" to the alert."
+            )
+        fields["car_type"] = car_types[0]
+    rest = rest.replace(",", " ")
+    match = take(_YEAR_RANGE_RE)
+    if match:
+        fields["min_year"], fields["max_year"] = sorted(int(y) for y in match.groups())
+    match = take(_MIN_YEAR_RE) if fields["min_year"] is None else None
+    if match:
+        fields["min_year"] = int(match.group(1) or match.group(2))
+    match = take(_MAX_YEAR_RE)
+    if match:
+        fields["max_year"] = int(match.group(1)) - 1
+    if fields["min_year"] is None and fields["max_year"] is None:
+        match = take(_EXACT_YEAR_RE)
+        if match:
+            fields["min_year"] = fields["max_year"] = int(match.group(1))
+
+    for match in _LEFTOVER_AMOUNT_RE.finditer(rest):
+        digits, multiplier = match.group(1).strip(), match.group(2)
+        if multiplier or not digits.isdigit() or len(digits) > 3:
+            raise ValueError(
+                f"Not sure what \"{match.group(0).strip()}\" means. Put \"under\" or \"over\" "
+                f"before a price (\"under 1.5M\") and write years as \"2015+\" or \"2012-2016\"."
+            )
+
+    fields["make"], fields["model"] = split_name(" ".join(_WORD_RE.findall(rest)))
+
+    if all(value is None for value in fields.values()):
+        return None
+    return fields
+
+
+class AlertIndex:
+    """In-memory inverted index of saved searches"""
+
+    _NO_MIN = 0
+
+    def __init__(self):
+        self._refreshing = asyncio.Lock()
+        self._alerts = {}
+        # (make, model, car_type) -> ([min_price, ...], [Alert, ...]) sorted by min_price
+        self._buckets = {}
+
+    def __len__(self):
+        return len(self._alerts)
+
+    @staticmethod
+    def _key(alert):
+        return (alert.make, alert.model, alert.car_type)
+
+    def add(self, alert):
+        if alert.car_type is None and (alert.min_price or alert.max_price):
+            # Saved before car_type was inferred from the price
+            car_types = price_car_types(alert.min_price, alert.max_price)
+            if len(car_types) == 1:
+                alert = alert._replace(car_type=car_types[0])
+        if alert.id in self._alerts:
+            self.remove(alert.id)
+        self._alerts[alert.id] = alert
+        keys, alerts = self._buckets.setdefault(self._key(alert), ([], []))
+        min_price = alert.min_price or self._NO_MIN
+        i = bisect.bisect_right(keys, min_price)
+        keys.insert(i, min_price)
+        alerts.insert(i, alert)
+
+    def remove(self, alert_id):
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        key = self._key(alert)
+        keys, alerts = self._buckets[key]
+        i = bisect.bisect_left(keys, alert.min_price or self._NO_MIN)
+        while alerts[i].id != alert_id:
+            i += 1
+        del keys[i], alerts[i]
+        if not keys:
+            del self._buckets[key]
+        return alert
+
+    def match(self, make, model, car_type, price=None, year=None):
+        """Return the alerts matching an ad; price is in birr, either may be None"""
+        words = f"{make or ''} {model or ''}".lower().split()
+        # Every word prefix of the model, so "land" and "land cruiser" both match
+        models = [None] + [" ".join(words[1:i]) for i in range(2, len(words) + 1)]
+        matched = []
+        for key_make in ((words[0], None) if words else (None,)):
+            for key_model in (models if key_make else (None,)):
+                for key_type in (car_type, None):
+                    bucket = self._buckets.get((key_make, key_model, key_type))
+                    if bucket is None:
+                        continue
+                    keys, alerts = bucket
+                    # Alerts past this point want a higher minimum than the ad price
+                    end = bisect.bisect_right(keys, price if price is not None else self._NO_MIN)
+                    for i in range(end):
+                        alert = alerts[i]
+                        # Untyped alerts whose price could be either kind only see sale ads
+                        if key_type is None and car_type == "rental" and (alert.min_price or alert.max_price):
+                            continue
+                        if alert.max_price is not None and (price is None or price > alert.max_price):
+                            continue
+                        if alert.min_year is not None and (year is None or year < alert.min_year):
+                            continue
+                        if alert.max_year is not None and (year is None or year > alert.max_year):
+                            continue
+                        matched.append(alert)
+        return matched
+
+    async def load(self, database):
+        rows = await database.fetchall(f"SELECT {_ALERT_COLUMNS} FROM saved_searches")
+        self._alerts.clear()
+        self._buckets.clear()
+        for row in rows:
+            self.add(Alert(*row))
+        return len(rows)
+
+    async def refresh(self, database, alert_id):
+        """Re-read one saved search another process added or removed"""
+        # Refreshes apply in the order they were asked for, so an alert
+        # added and removed in quick succession ends up removed
+        async with self._refreshing:
+            row = await database.fetchone(
+                f"SELECT {_ALERT_COLUMNS} FROM saved_searches WHERE id = ?", (alert_id,)
+            )
+            if row is None:
+                self.remove(alert_id)
+            else:
+                self.add(Alert(*row))
+
+
+async def save_alert(db, user_id, query, fields):
+    """Insert a saved search inside a writer transaction and return its Alert"""
+    cursor = await db.execute(
+        '''INSERT INTO saved_searches
+           (user_id, query, make, model, car_type, min_price, max_price, min_year, max_year)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        (user_id, query, fields["make"], fields["model"], fields["car_type"],
+         fields["min_price"], fields["max_price"], fields["min_year"], fields["max_year"])
+    )
+    return Alert(cursor.lastrowid, user_id, query, fields["make"], fields["model"],
+                 fields["car_type"], fields["min_price"], fields["max_price"],
+                 fields["min_year"], fields["max_year"])
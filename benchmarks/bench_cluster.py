@@ -0,0 +1,197 @@
+"""End-to-end benchmark of multi-process dispatch (WORKERS > 1).
+
+A receiver in this process long-polls a fake Bot API served on 127.0.0.1
+and routes updates by chat to N worker processes (cluster.Supervisor), each
+running the real handlers on a shared temporary SQLite database. Every
+simulated user's whole wizard, sale or rental, is queued at once, so an ad
+is only stored if the worker kept that chat's updates in order. Reports
+updates/s from the first getUpdates until every update was acknowledged.
+
+Flood limits, per-user throttling and the preview pause are lifted in the
+workers, as in bench_dispatcher.py. Compare --workers 1 with --workers N on
+a machine with N cores.
+
+    python benchmarks/bench_cluster.py [--users 400] [--workers 4]
+        [--min-updates-per-sec 200]
+"""
+import argparse
+import asyncio
+import itertools
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web  # noqa: E402
+
+from bench_dispatcher import CHANNEL_ID, RENTAL_STEPS, SALE_STEPS, TOKEN, FakeBotAPI  # noqa: E402
+
+
+class QueuedBotAPI(FakeBotAPI):
+    """FakeBotAPI that also serves queued updates from getUpdates"""
+
+    def __init__(self):
+        super().__init__()
+        self.updates = asyncio.Queue()
+        self.first_poll = None
+
+    async def handle(self, request):
+        if request.match_info["method"] != "getUpdates":
+            return await super().handle(request)
+        self.calls["getUpdates"] += 1
+        if self.first_poll is None and not self.updates.empty():
+            self.first_poll = time.perf_counter()
+        params = await request.json()
+        batch = []
+        try:
+            batch.append(await asyncio.wait_for(self.updates.get(), timeout=min(params.get("timeout", 0), 1)))
+        except asyncio.TimeoutError:
+            pass
+        while batch and len(batch) < 100 and not self.updates.empty():
+            batch.append(self.updates.get_nowait())
+        return web.json_response({"ok": True, "result": batch})
+
+
+def wizard_updates(users):
+    """Raw updates for every user's complete submission, in per-user order"""
+    update_ids = itertools.count(1)
+    for n in range(users):
+        user_id = 100000 + n
+        flow, steps = ("sale", SALE_STEPS) if n % 2 == 0 else ("rental", RENTAL_STEPS)
+        for i, (step, text) in enumerate(steps):
+            if flow == "sale" and step == "plate_partial":
+                text = f"{chr(65 + n % 26)}{n % 100:02d}"
+            update_id = next(update_ids)
+            message = {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+            }
+            if text is None:
+                message["photo"] = [{"file_id": f"photo-{user_id}-{i}", "file_unique_id": f"u{user_id}-{i}",
+                                     "width": 1280, "height": 960}]
+            else:
+                message["text"] = text
+            yield {"update_id": update_id, "message": message}
+
+
+def run_worker(index, socket_path, api_url):
+    """Worker entry point: bot.run_worker with the benchmark's patches applied"""
+    import bot
+    from aiogram.client.telegram import TelegramAPIServer
+    from sender import TokenBucket
+
+    create_app = bot.create_app
+
+    def create_bench_app(config):
+        dp = create_app(config)
+        bot.bot.session.api = TelegramAPIServer.from_base(api_url)
+        bot.send_scheduler.global_bucket = TokenBucket(1e9, 1.0)
+        bot.send_scheduler.private_limits = (1e9, 1.0, 1e9)
+        bot.send_scheduler.group_limits = (1e9, 1.0, 1e9)
+        bot.throttling.limits = {}
+        return dp
+
+    async def no_pause(delay, result=None):
+        return await asyncio.sleep(0, result)
+
+    bot.create_app = create_bench_app
+    bot.asyncio = types.SimpleNamespace(**{**vars(asyncio), "sleep": no_pause})
+    asyncio.run(bot.run_worker(index, socket_path))
+
+
+async def run(args):
+    logging.basicConfig(level=args.log_level)
+    import bot
+    from aiogram.client.telegram import TelegramAPIServer
+    from cluster import Supervisor, poll_updates
+    from config import Config
+
+    api = QueuedBotAPI()
+    api_runner, base_url = await api.start()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_cluster_"), "car_broker.db")
+    config = Config(bot_token=TOKEN, admin_channel=CHANNEL_ID, db_path=db_path,
+                    workers=args.workers, log_file="", log_level=args.log_level)
+    bot.create_app(config)
+    bot.bot.session.api = TelegramAPIServer.from_base(base_url)
+    await bot.database.open()
+    await bot.init_db()
+
+    def command(index, socket_path):
+        return [sys.executable, os.path.abspath(__file__), "--worker", str(index),
+                "--socket", socket_path, "--api", base_url]
+
+    supervisor = Supervisor(args.workers, command, config)
+    await supervisor.start()
+
+    updates = list(wizard_updates(args.users))
+    for update in updates:
+        api.updates.put_nowait(update)
+    poller = asyncio.create_task(poll_updates(
+        f"{base_url}/bot{TOKEN}/getUpdates", supervisor.dispatch,
+        allowed_updates=bot.dp.resolve_used_update_types(), timeout=1
+    ))
+
+    deadline = time.perf_counter() + args.timeout
+    while time.perf_counter() < deadline:
+        stats = supervisor.stats()
+        if supervisor.dispatched == len(updates) and not any(w["unfinished_updates"] for w in stats):
+            break
+        await asyncio.sleep(0.01)
+    elapsed = time.perf_counter() - (api.first_poll or time.perf_counter())
+    stats = supervisor.stats()
+
+    poller.cancel()
+    await asyncio.gather(poller, return_exceptions=True)
+    await supervisor.stop()
+    ads = (await bot.database.fetchone("SELECT COUNT(*) FROM cars"))[0]
+    await bot.send_scheduler.close()
+    await bot.fsm_storage.close()
+    await bot.database.close()
+    await bot.bot.session.close()
+    await api_runner.cleanup()
+
+    rate = len(updates) / elapsed if elapsed else 0.0
+    print(f"\nworkers: {args.workers}  users: {args.users}  ads stored: {ads}")
+    print(f"updates: {len(updates)} in {elapsed:.2f}s -> {rate:.0f} updates/s")
+    for worker in stats:
+        print(f"worker {worker['worker']}: {worker['updates']} updates, "
+              f"restarts {worker['restarts']}, unfinished {worker['unfinished_updates']}")
+    print("bot API calls: " + ", ".join(f"{m}={n}" for m, n in sorted(api.calls.items())))
+
+    failures = []
+    if ads != args.users:
+        failures.append(f"expected {args.users} ads, found {ads}")
+    if args.min_updates_per_sec is not None and rate < args.min_updates_per_sec:
+        failures.append(f"{rate:.0f} updates/s < {args.min_updates_per_sec}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=400, help="submissions to run (alternating sale/rental)")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes")
+    parser.add_argument("--min-updates-per-sec", type=float, help="fail if throughput is below this")
+    parser.add_argument("--timeout", type=float, default=300, help="give up after this many seconds")
+    parser.add_argument("--log-level", default="WARNING", help="log level in receiver and workers")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    parser.add_argument("--api", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker is not None:
+        run_worker(args.worker, args.socket, args.api)
+        return
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
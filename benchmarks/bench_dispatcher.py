@@ -0,0 +1,263 @@
+"""End-to-end benchmark: complete sale and rental submissions through the Dispatcher.
+
+Every simulated user walks the whole CarForm wizard, from "🚗 Car for Sale"
+or "🏢 Car for Rental" to "✅ Confirm & Post", as synthetic Updates fed to
+dp.feed_update. Replies go over HTTP to a fake Bot API served in-process on
+127.0.0.1, and ads land in a temporary SQLite database, so the run is fully
+offline. Reports p50/p99 latency per wizard step and overall updates/s.
+
+Telegram's flood limits (send scheduler) and per-user throttling are lifted,
+otherwise the run would only measure those limits. The one-second pause the
+photo step makes before the preview is skipped unless --keep-ux-delay is
+given. Logging runs at WARNING unless --log-level says otherwise.
+
+    python benchmarks/bench_dispatcher.py [--users 200] [--concurrency 50]
+        [--max-p99-ms 250] [--min-updates-per-sec 100] [--log-level INFO]
+
+With thresholds given it exits with status 1 when one is missed, so CI can
+flag regressions.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import types
+from collections import Counter, defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web  # noqa: E402
+
+TOKEN = "123456:BENCHMARKbenchmarkBENCHMARK"
+CHANNEL_ID = -1001000000001
+
+SALE_STEPS = [
+    ("start", "🚗 Car for Sale"),
+    ("make", "Toyota"),
+    ("model", "Vitz"),
+    ("year", "2015"),
+    ("color", "White"),
+    ("plate_code", "2 - Private vehicle"),
+    ("plate_partial", "A12"),
+    ("plate_region", "Addis Ababa"),
+    ("price", "1,200,000"),
+    ("phone", "0911223344"),
+    ("condition", "Used, 120,000 km, no accidents, regular service"),
+    ("photo", None),
+    ("photo", None),
+    ("photos_done", "📸 Done - Finish Adding Photos"),
+    ("confirm", "✅ Confirm & Post"),
+]
+
+RENTAL_STEPS = [
+    ("start", "🏢 Car for Rental"),
+    ("make", "Suzuki"),
+    ("model", "Dzire"),
+    ("year", "2018"),
+    ("plate_code", "1 - Taxi"),
+    ("price", "2,500"),
+    ("advance", "One month"),
+    ("warranty", "Yes, it's necessary"),
+    ("purpose", "For personal use"),
+    ("region", "Addis Ababa"),
+    ("phone", "0911223344"),
+    ("condition", "Clean, serviced, driver available"),
+    ("photo", None),
+    ("photos_done", "📸 Done - Finish Adding Photos"),
+    ("confirm", "✅ Confirm & Post"),
+]
+
+
+class FakeBotAPI:
+    """Minimal Bot API: answers every method with a plausible result"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self._message_ids = itertools.count(1)
+
+    def _message(self, chat_id, text=None):
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            chat_id = CHANNEL_ID
+        message = {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "channel"},
+        }
+        if text is not None:
+            message["text"] = text
+        return message
+
+    async def handle(self, request):
+        method = request.match_info["method"]
+        form = await request.post()
+        self.calls[method] += 1
+        if method == "sendMediaGroup":
+            result = [self._message(form.get("chat_id")) for _ in json.loads(form["media"])]
+        elif method.startswith("send") or method.startswith("copy") or method.startswith("forward"):
+            result = self._message(form.get("chat_id"), form.get("text"))
+        elif method == "getMe":
+            result = {"id": 123456, "is_bot": True, "first_name": "Bench", "username": "BenchBot"}
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, host="127.0.0.1", port=0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        return runner, f"http://127.0.0.1:{port}"
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def load_bot():
+    """Build the app against a temp database (no env or log file involved)"""
+    import bot
+    from config import Config
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench_dispatcher_"), "car_broker.db")
+    bot.create_app(Config(bot_token=TOKEN, admin_channel=CHANNEL_ID, db_path=db_path))
+    return bot
+
+
+async def run(args):
+    logging.basicConfig(level=args.log_level)
+    bot = load_bot()
+    from aiogram.client.telegram import TelegramAPIServer
+    from aiogram.types import Update
+    from sender import TokenBucket
+
+    api = FakeBotAPI()
+    api_runner, base_url = await api.start()
+    bot.bot.session.api = TelegramAPIServer.from_base(base_url)
+
+    # Measure the bot, not Telegram's flood limits or the anti-flood middleware
+    bot.send_scheduler.global_bucket = TokenBucket(1e9, 1.0)
+    bot.send_scheduler.private_limits = (1e9, 1.0, 1e9)
+    bot.send_scheduler.group_limits = (1e9, 1.0, 1e9)
+    bot.throttling.limits = {}
+    if not args.keep_ux_delay:
+        async def no_pause(delay, result=None):
+            return await asyncio.sleep(0, result)
+        bot.asyncio = types.SimpleNamespace(**{**vars(asyncio), "sleep": no_pause})
+
+    await bot.database.open()
+    await bot.init_db()
+    bot.fsm_storage.start()
+    bot.outbox.start()
+
+    update_ids = itertools.count(1)
+    latencies = defaultdict(list)
+
+    def make_update(user_id, text=None, photo=None):
+        message = {
+            "message_id": next(update_ids),
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"},
+        }
+        if photo is not None:
+            message["photo"] = [photo]
+        else:
+            message["text"] = text
+        return Update.model_validate({"update_id": message["message_id"], "message": message})
+
+    async def submit(user_id, flow, steps):
+        for i, (step, text) in enumerate(steps):
+            if text is None:
+                photo = {"file_id": f"photo-{user_id}-{i}", "file_unique_id": f"u{user_id}-{i}",
+                         "width": 1280, "height": 960}
+                update = make_update(user_id, photo=photo)
+            else:
+                update = make_update(user_id, text=text)
+            start = time.perf_counter()
+            await bot.dp.feed_update(bot.bot, update)
+            latencies[f"{flow}:{step}"].append(time.perf_counter() - start)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(n):
+        async with semaphore:
+            flow, steps = ("sale", SALE_STEPS) if n % 2 == 0 else ("rental", RENTAL_STEPS)
+            # Distinct plate per sale user so the repost check never blocks the run
+            if flow == "sale":
+                steps = [(s, f"{chr(65 + n % 26)}{n % 100:02d}" if s == "plate_partial" else t) for s, t in steps]
+            await submit(100000 + n, flow, steps)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(n) for n in range(args.users)))
+    elapsed = time.perf_counter() - started
+
+    # Channel posts are delivered by the outbox after the handler returns
+    drain_started = time.perf_counter()
+    while (await bot.database.fetchone(
+            "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'processing')"))[0]:
+        await asyncio.sleep(0.01)
+    drain = time.perf_counter() - drain_started
+
+    ads = (await bot.database.fetchone("SELECT COUNT(*) FROM cars"))[0]
+
+    await bot.outbox.stop()
+    await bot.send_scheduler.close()
+    await bot.fsm_storage.close()
+    await bot.database.close()
+    await bot.bot.session.close()
+    await api_runner.cleanup()
+
+    updates = sum(len(v) for v in latencies.values())
+    print(f"\n{'step':<22}{'n':>7}{'p50 ms':>10}{'p99 ms':>10}")
+    worst_p99 = 0.0
+    for flow, steps in (("sale", SALE_STEPS), ("rental", RENTAL_STEPS)):
+        for step in dict.fromkeys(step for step, _ in steps):
+            values = latencies[f"{flow}:{step}"]
+            p50, p99 = percentile(values, 0.50) * 1000, percentile(values, 0.99) * 1000
+            worst_p99 = max(worst_p99, p99)
+            print(f"{flow + ':' + step:<22}{len(values):>7}{p50:>10.2f}{p99:>10.2f}")
+
+    rate = updates / elapsed
+    print(f"\nusers: {args.users}  concurrency: {args.concurrency}  ads stored: {ads}")
+    print(f"updates: {updates} in {elapsed:.2f}s -> {rate:.0f} updates/s "
+          f"({args.users / elapsed:.1f} submissions/s)")
+    print(f"outbox drained {drain * 1000:.0f} ms after the last update")
+    print("bot API calls: " + ", ".join(f"{m}={n}" for m, n in sorted(api.calls.items())))
+
+    failures = []
+    if ads != args.users:
+        failures.append(f"expected {args.users} ads, found {ads}")
+    if args.max_p99_ms is not None and worst_p99 > args.max_p99_ms:
+        failures.append(f"worst step p99 {worst_p99:.1f} ms > {args.max_p99_ms} ms")
+    if args.min_updates_per_sec is not None and rate < args.min_updates_per_sec:
+        failures.append(f"{rate:.0f} updates/s < {args.min_updates_per_sec}")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--users", type=int, default=200, help="submissions to run (alternating sale/rental)")
+    parser.add_argument("--concurrency", type=int, default=50, help="users in the wizard at the same time")
+    parser.add_argument("--max-p99-ms", type=float, help="fail if any step's p99 exceeds this")
+    parser.add_argument("--min-updates-per-sec", type=float, help="fail if throughput is below this")
+    parser.add_argument("--log-level", default="WARNING", help="root log level during the run")
+    parser.add_argument("--keep-ux-delay", action="store_true", help="keep the 1s pause before the preview")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
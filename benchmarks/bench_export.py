@@ -0,0 +1,102 @@
+"""Benchmark: /export of large cars tables in constant memory.
+
+Fills a temporary, fully migrated database with synthetic ads, then runs
+export.write_export for each size and format and reports rows/s, the
+compressed file size and the peak Python memory allocated during a second,
+tracemalloc-instrumented export. The peak should not grow with the number
+of rows.
+
+    python benchmarks/bench_export.py [--rows 100000,1000000] [--formats csv,jsonl]
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from export import parse_export_args, write_export  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+MAKES = [("Toyota", "Vitz"), ("Suzuki", "Dzire"), ("Hyundai", "Atos"), ("KIA", "Stonic"), ("Toyota", "Corolla")]
+
+
+def fill(path, rows, start=0):
+    conn = sqlite3.connect(path)
+    batch = []
+    for n in range(start, rows):
+        make, model = MAKES[n % len(MAKES)]
+        car_type = "sale" if n % 3 else "rental"
+        batch.append((
+            100000 + n % 5000, f"User {n % 5000}", "0911223344", make, model, str(2005 + n % 18),
+            "White", "2", f"A{n % 1000:03d}xxx", "Addis Ababa", f"{1000000 + n:,}",
+            "Used, regular service, no accidents, new tyres", car_type, 1000000 + n, "ETB",
+            f"2024-{1 + n % 12:02d}-{1 + n % 28:02d} 12:00:00",
+        ))
+        if len(batch) == 10000:
+            _insert(conn, batch)
+            batch = []
+    if batch:
+        _insert(conn, batch)
+    conn.close()
+
+
+def _insert(conn, batch):
+    conn.executemany(
+        '''INSERT INTO cars (user_id, user_name, user_phone, make, model, year, color, plate_code,
+        plate_full, plate_region, price, condition, car_type, price_birr, price_currency, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+        batch
+    )
+    conn.commit()
+
+
+async def run(args):
+    directory = tempfile.mkdtemp(prefix="bench_export_")
+    path = os.path.join(directory, "car_broker.db")
+    database = Database(path)
+    await database.open()
+    await run_migrations(database)
+    await database.close()
+
+    print(f"{'rows':>9}{'format':>8}{'seconds':>9}{'rows/s':>9}{'file MB':>9}{'peak MB':>9}")
+    filled = 0
+    for rows in args.rows:
+        fill(path, rows, filled)
+        filled = rows
+        database = Database(path)
+        await database.open()
+        for fmt in args.formats:
+            filters = parse_export_args(fmt)
+            started = time.perf_counter()
+            out, count = await write_export(database, filters, directory=directory)
+            elapsed = time.perf_counter() - started
+            size = os.path.getsize(out)
+            os.remove(out)
+            assert count == rows, (count, rows)
+            # Second pass for memory only: tracemalloc slows the export down
+            tracemalloc.start()
+            out, _ = await write_export(database, filters, directory=directory)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            os.remove(out)
+            print(f"{rows:>9}{fmt:>8}{elapsed:>9.1f}{rows / elapsed:>9.0f}"
+                  f"{size / 1024 / 1024:>9.1f}{peak / 1024 / 1024:>9.1f}")
+        await database.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rows", type=lambda s: sorted(int(x) for x in s.split(",")), default=[100000, 1000000],
+                        help="comma-separated table sizes")
+    parser.add_argument("--formats", type=lambda s: s.split(","), default=["csv", "jsonl"])
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Startup benchmark: cold import of bot.py and create_app(), in fresh processes.
+
+Each run starts a new interpreter that imports bot (with no environment
+variables set, which must not exit or touch the network), builds the app
+from a Config and prints the startup_timings it recorded. Reports the median
+and worst of each phase, plus the interpreter's own wall time.
+
+    python benchmarks/bench_startup.py [--runs 10] [--max-import-ms 1500]
+        [--max-build-ms 100]
+
+With thresholds given it exits with status 1 when one is missed.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, os, tempfile
+import bot
+from config import Config
+bot.create_app(Config(bot_token="123456:BENCHMARKbenchmarkBENCHMARK",
+                      db_path=os.path.join(tempfile.mkdtemp(), "car_broker.db")))
+print(json.dumps(bot.startup_timings))
+"""
+
+
+def run_once():
+    env = {k: v for k, v in os.environ.items() if k not in ("BOT_TOKEN", "PYTHONDONTWRITEBYTECODE")}
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD], cwd=ROOT, env=env,
+                            capture_output=True, text=True, check=True)
+    wall = (time.perf_counter() - started) * 1000
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["process"] = wall
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-import-ms", type=float, help="fail if the median import exceeds this")
+    parser.add_argument("--max-build-ms", type=float, help="fail if the median create_app exceeds this")
+    args = parser.parse_args()
+
+    run_once()  # warm the bytecode and filesystem caches
+    runs = [run_once() for _ in range(args.runs)]
+
+    print(f"{'phase':<10}{'median ms':>12}{'max ms':>10}")
+    medians = {}
+    for phase in ("import", "build", "process"):
+        values = [r[phase] for r in runs]
+        medians[phase] = statistics.median(values)
+        print(f"{phase:<10}{medians[phase]:>12.1f}{max(values):>10.1f}")
+
+    failures = []
+    if args.max_import_ms is not None and medians["import"] > args.max_import_ms:
+        failures.append(f"import {medians['import']:.1f} ms > {args.max_import_ms} ms")
+    if args.max_build_ms is not None and medians["build"] > args.max_build_ms:
+        failures.append(f"create_app {medians['build']:.1f} ms > {args.max_build_ms} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Micro-benchmark: per-message cost of rebuilding replies vs. precompiled templates.
+
+Compares the old approach (a fresh f-string, a fresh broker phone block and a
+fresh ReplyKeyboardMarkup per reply) with the Templates registry and shared
+keyboards. Reports time and peak bytes allocated per message.
+
+    python benchmarks/bench_templates.py [iterations]
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton  # noqa: E402
+
+from keyboards import MAIN_MENU_KEYBOARD  # noqa: E402
+from templates import WELCOME, Templates, format_broker_phones  # noqa: E402
+
+BROKER_NAME = "Addis Car Hub"
+BROKER_PHONES = ["0911564697", "0913550415"]
+CHANNEL = "@AddisCarHub"
+
+AD = {
+    'car_type': 'sale', 'make': 'Toyota', 'model': 'Vitz', 'year': '2015',
+    'color': 'White', 'plate_code': '2', 'plate_full': 'A12xxx',
+    'plate_region': 'Addis Ababa', 'price': '1,200,000',
+    'condition': 'Used, 120,000 km, no accidents, regular service',
+}
+
+
+# --- before: what the handlers used to do on every request -----------------
+
+def legacy_start():
+    keyboard = ReplyKeyboardMarkup(
+        keyboard=[
+            [KeyboardButton(text="🚗 Car for Sale"),
+             KeyboardButton(text="🏢 Car for Rental")],
+            [KeyboardButton(text="📊 My Statistics"),
+             KeyboardButton(text="ℹ️ How It Works")],
+            [KeyboardButton(text="📞 Contact Agents")]
+        ],
+        resize_keyboard=True
+    )
+    return WELCOME, keyboard
+
+
+def legacy_ad():
+    data = AD
+    broker_phones_formatted = format_broker_phones(BROKER_PHONES)
+    plate_display = f"{data['plate_code']} {data.get('plate_full', '')} {data.get('plate_region', '')}"
+    return f"""🚗 *For Sale - {data['make']} {data['model']} {data['year']}*
+
+📋 *Details:*
+• Make: {data['make']}
+• Model: {data['model']}
+• Year: {data['year']}
+• Color: {data['color']}
+• Plate: {plate_display}
+• Price: *{data['price']} Birr*
+
+🔧 *Condition:*
+{data['condition']}
+
+🤝 *Brokerage Service:*
+• Verified details
+• Seller protection
+• Price negotiation assistance
+• Paperwork verification
+
+📞 *Contact Our Agents:*
+{broker_phones_formatted}
+*Telegram:* @AddisCarHubBot
+
+⚠️ *Note:* All communications through agents only.
+
+#{data['make'].replace(" ", "")} #{data['model'].replace(" ", "")}
+#CarSale #Automobile #AddisCarHub
+
+*Want to sell your car?* Use @AddisCarHubBot"""
+
+
+def legacy_contact():
+    return f"""*📞 Contact Our Team*
+
+{BROKER_NAME}
+*Agents & Hotline:*
+{format_broker_phones(BROKER_PHONES)}
+
+*Working Hours:* 9:00 AM - 6:00 PM
+*Services:* Car brokerage, verification, negotiation
+
+*For urgent matters:* Call agents directly
+
+*Note:* Hotline/Call Center (5555) coming soon!
+
+*Channel:* {CHANNEL}
+*Bot:* @AddisCarHubBot"""
+
+
+# --- after: precompiled templates and shared keyboards ---------------------
+
+TEMPLATES = Templates(BROKER_NAME, BROKER_PHONES, CHANNEL)
+
+
+def compiled_start():
+    return TEMPLATES.welcome, MAIN_MENU_KEYBOARD
+
+
+def compiled_ad():
+    return TEMPLATES.ad(AD)
+
+
+def compiled_contact():
+    return TEMPLATES.contact
+
+
+def measure(fn, iterations):
+    # Time: best of 5 rounds, so a noisy neighbour does not decide the result
+    rounds = []
+    for _ in range(5):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        rounds.append(time.perf_counter() - start)
+    per_call_us = min(rounds) / iterations * 1e6
+
+    # Peak bytes allocated by a single call (averaged)
+    samples = min(iterations, 1000)
+    total = 0
+    tracemalloc.start()
+    for _ in range(samples):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        total += tracemalloc.get_traced_memory()[1] - base
+        del result
+    tracemalloc.stop()
+    return per_call_us, total / samples
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    cases = [
+        ("start (text + keyboard)", legacy_start, compiled_start),
+        ("channel ad", legacy_ad, compiled_ad),
+        ("contact agents", legacy_contact, compiled_contact),
+    ]
+    print(f"{'message':<26}{'before µs':>11}{'after µs':>11}{'before B':>11}{'after B':>11}")
+    for name, before, after in cases:
+        b_time, b_bytes = measure(before, iterations)
+        a_time, a_bytes = measure(after, iterations)
+        print(f"{name:<26}{b_time:>11.2f}{a_time:>11.2f}{b_bytes:>11.0f}{a_bytes:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Benchmark: ad inserts/s with 1, 10 and 100 concurrent submitters.
+
+Each insert is the write process_ad makes: the cars row, its photo rows,
+the seller's users row, the global counter and a channel-post outbox row,
+in one transaction. Two setups are compared on a fresh, fully migrated database:
+
+  legacy   rollback journal, synchronous=FULL, a lock around the writer
+           connection and one COMMIT per ad (the old Database.writer)
+  group    database.Database: WAL, synchronous=NORMAL, one writer task
+           committing every queued ad in a single transaction
+
+    python benchmarks/bench_writes.py [--inserts 2000] [--levels 1,10,100]
+        [--commit-window-ms 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import aiosqlite  # noqa: E402
+
+from database import Database  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+CAR_SQL = '''INSERT INTO cars (user_id, user_name, user_phone, make, model, year, price,
+    condition, car_type, price_birr, price_currency, status)
+    VALUES (?, 'Bench', '0911223344', 'Toyota', 'Vitz', '2015', '1,200,000',
+    'Used, regular service', 'sale', 1200000, 'ETB', 'active')'''
+PHOTO_SQL = "INSERT INTO car_photos (car_id, position, file_id, file_unique_id) VALUES (?, ?, ?, ?)"
+USER_SQL = '''INSERT INTO users (user_id, full_name, phone, ads_posted) VALUES (?, 'Bench', '0911223344', 1)
+    ON CONFLICT(user_id) DO UPDATE SET ads_posted = users.ads_posted + 1'''
+COUNTER_SQL = '''INSERT INTO counters (name, value) VALUES ('total_ads', 1)
+    ON CONFLICT(name) DO UPDATE SET value = counters.value + 1'''
+OUTBOX_SQL = '''INSERT INTO outbox (car_id, kind, payload, available_at) VALUES (?, 'channel_post', ?, ?)'''
+PHOTOS = ["AgACAgQAAxkBAAIBbench"] * 3
+
+
+async def write_ad(db, n):
+    cursor = await db.execute(CAR_SQL, (n,))
+    car_id = cursor.lastrowid
+    await db.executemany(PHOTO_SQL, [(car_id, i, file_id, f"u{n}-{i}") for i, file_id in enumerate(PHOTOS)])
+    await db.execute(USER_SQL, (n % 500,))
+    await db.execute(COUNTER_SQL)
+    await db.execute(OUTBOX_SQL, (car_id, json.dumps({"car_id": car_id, "text": "ad"}), time.time()))
+    return car_id
+
+
+class LegacyWriter:
+    def __init__(self, path):
+        self.path = path
+        self.lock = asyncio.Lock()
+
+    async def open(self):
+        self.conn = await aiosqlite.connect(self.path)
+        await self.conn.execute("PRAGMA journal_mode = DELETE")
+        await self.conn.execute("PRAGMA synchronous = FULL")
+
+    async def insert(self, n):
+        async with self.lock:
+            try:
+                car_id = await write_ad(self.conn, n)
+                await self.conn.commit()
+                return car_id
+            except BaseException:
+                await self.conn.rollback()
+                raise
+
+    async def close(self):
+        await self.conn.close()
+
+
+class GroupWriter:
+    def __init__(self, path, commit_window):
+        self.database = Database(path, commit_window=commit_window)
+
+    async def open(self):
+        await self.database.open()
+
+    async def insert(self, n):
+        async with self.database.writer() as db:
+            return await write_ad(db, n)
+
+    async def close(self):
+        await self.database.close()
+
+
+async def fresh_database(directory, name):
+    path = os.path.join(directory, f"{name}.db")
+    database = Database(path)
+    await database.open()
+    await run_migrations(database)
+    await database.close()
+    # Start every run from the journal mode under test
+    async with aiosqlite.connect(path) as conn:
+        await conn.execute("PRAGMA journal_mode = DELETE")
+    return path
+
+
+async def measure(writer, inserts, submitters):
+    counter = iter(range(inserts))
+    ids = []
+
+    async def submitter():
+        for n in counter:
+            ids.append(await writer.insert(n))
+
+    await writer.open()
+    started = time.perf_counter()
+    await asyncio.gather(*(submitter() for _ in range(submitters)))
+    elapsed = time.perf_counter() - started
+    stats = writer.database.stats() if isinstance(writer, GroupWriter) else None
+    await writer.close()
+    if len(set(ids)) != inserts:
+        raise AssertionError(f"expected {inserts} distinct row ids, got {len(set(ids))}")
+    return inserts / elapsed, stats
+
+
+async def run(args):
+    directory = tempfile.mkdtemp(prefix="bench_writes_")
+    print(f"{'submitters':>10}{'legacy/s':>12}{'group/s':>12}{'speedup':>9}{'avg batch':>11}")
+    for level in args.levels:
+        legacy_path = await fresh_database(directory, f"legacy{level}")
+        group_path = await fresh_database(directory, f"group{level}")
+        legacy, _ = await measure(LegacyWriter(legacy_path), args.inserts, level)
+        group, stats = await measure(GroupWriter(group_path, args.commit_window_ms / 1000), args.inserts, level)
+        print(f"{level:>10}{legacy:>12.0f}{group:>12.0f}{group / legacy:>8.1f}x{stats['avg_batch']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--inserts", type=int, default=2000, help="ads written per run")
+    parser.add_argument("--levels", type=lambda s: [int(x) for x in s.split(",")], default=[1, 10, 100],
+                        help="comma-separated submitter counts")
+    parser.add_argument("--commit-window-ms", type=float, default=0.0,
+                        help="how long the writer keeps a batch open for more callers")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
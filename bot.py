@@ -1,336 +1,300 @@
-import os
+import time
+
+# Taken before anything else is imported, so "import" in the startup
+# timings covers aiogram and the rest of the dependency tree
+_import_started = time.perf_counter()
+
 import asyncio
 import logging
+import argparse
+import os
 import re
-import json
-from aiogram import Bot, Dispatcher, types, F
-from aiogram.filters import Command
+import signal
+import sys
+from aiogram import Bot, Dispatcher, Router, types, F
+from aiogram.filters import Command, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from aiogram.fsm.storage.memory import MemoryStorage
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-import aiosqlite
-from datetime import datetime
-from flask import Flask
-import threading
-import sys
-
-# ====================
-# ENHANCED LOGGING
-# ====================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('bot.log')
-    ]
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from config import Config, ConfigError
+from cluster import Supervisor, WorkerLink, poll_updates, webhook_receiver, worker_command
+from database import Database
+from migrations import run_migrations, run_backfills
+from web import create_web_app, start_web_server
+from sender import SendScheduler, SendSchedulerMiddleware, fan_out
+from outbox import OutboxWorker, PartialDelivery, enqueue
+from storage import SQLiteStorage
+from middlewares import AlbumMiddleware, KeyedLocks, ThrottlingMiddleware, UpdateSamplingMiddleware
+from logging_setup import setup_logging, dropped_records
+from metrics import REGISTRY, HandlerMetricsMiddleware, APIMetricsMiddleware, observe_query
+from templates import Templates
+from prices import parse_listing_price, price_columns
+from alerts import AlertIndex, describe_alert, known_make, parse_alert, parse_year, save_alert
+from duplicates import plate_fingerprint, find_duplicate, record_fingerprints
+from lifecycle import AdArchiver, CLOSED_STATUS, LIVE_STATUS, fetch_ad, set_status
+from export import MAX_UPLOAD_BYTES, parse_export_args, write_export, export_filename, describe_filters
+from search import (
+    SearchSessions, build_fts_query, search_cars, encode_cursor, decode_cursor
+)
+from keyboards import (
+    MAIN_MENU_KEYBOARD, CANCEL_MENU_KEYBOARD, START_ONLY_KEYBOARD, REMOVE_KEYBOARD,
+    PLATE_CODE_KEYBOARD, RENTAL_ADVANCED_KEYBOARD, RENTAL_WARRANTY_KEYBOARD,
+    RENTAL_PURPOSE_KEYBOARD, PHOTO_ACTIONS_KEYBOARD, CONFIRMATION_KEYBOARD
 )
-logger = logging.getLogger(__name__)
-
-# ====================
-# FLASK WEB SERVER
-# ====================
-app = Flask(__name__)
-
-@app.route('/')
-def home():
-    return """
-    <html>
-        <head>
-            <title>🚗 Addis Car Hub</title>
-            <meta name="viewport" content="width=device-width, initial-scale=1">
-            <style>
-                body {
-                    font-family: Arial, sans-serif;
-                    text-align: center;
-                    padding: 20px;
-                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-                    color: white;
-                    min-height: 100vh;
-                    display: flex;
-                    align-items: center;
-                    justify-content: center;
-                }
-                .container {
-                    background: rgba(255, 255, 255, 0.95);
-                    padding: 40px;
-                    border-radius: 15px;
-                    box-shadow: 0 10px 30px rgba(0,0,0,0.3);
-                    max-width: 600px;
-                    width: 100%;
-                }
-                h1 {
-                    color: #2c3e50;
-                    margin-bottom: 10px;
-                }
-                .status {
-                    color: #27ae60;
-                    font-weight: bold;
-                    font-size: 24px;
-                    margin: 20px 0;
-                }
-                .links {
-                    margin: 30px 0;
-                }
-                .btn {
-                    display: inline-block;
-                    background: #667eea;
-                    color: white;
-                    padding: 12px 24px;
-                    text-decoration: none;
-                    border-radius: 8px;
-                    margin: 10px;
-                    transition: 0.3s;
-                }
-                .btn:hover {
-                    background: #764ba2;
-                    transform: translateY(-3px);
-                }
-                .info {
-                    color: #333;
-                    margin: 15px 0;
-                    font-size: 14px;
-                }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>🚗 Addis Car Hub</h1>
-                <p class="status">✅ Bot and Channel are operational!</p>
-                <p style="color: #666;">Reliable car sales and rental brokerage service in Addis Ababa</p>
-                
-                <div class="links">
-                    <a href="https://t.me/AddisCarHubBot" class="btn">🤖 Our Bot</a>
-                    <a href="https://t.me/AddisCarHub" class="btn">📢 Our Channel</a>
-                </div>
-                
-                <div class="info">
-                    <p>📍 Post your car for sale or rental in 2 minutes via this bot</p>
-                    <p>✅ Verified and accurate car details only</p>
-                    <p>🤝 Brokerage service with 2-10% commission</p>
-                    <p>📞 Hotline: 5555 (Coming Soon)</p>
-                    <p>📞 Agents: 0911564697, 0913550415</p>
-                </div>
-                
-                <p style="color: #888; font-size: 12px; margin-top: 30px;">
-                    Time: """ + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + """<br>
-                    Service: Car Brokerage Bot v2.1
-                </p>
-            </div>
-        </body>
-    </html>
-    """
-
-@app.route('/health')
-def health():
-    return {"status": "healthy", "service": "Addis Car Hub Bot"}, 200
 
-def run_flask():
-    port = int(os.environ.get('PORT', 3000))
-    logger.info(f"Starting Flask server on port {port}")
-    try:
-        app.run(host='0.0.0.0', port=port, debug=False, use_reloader=False)
-    except Exception as e:
-        logger.error(f"Flask server error: {e}")
+logger = logging.getLogger(__name__)
 
 # ====================
 # TELEGRAM BOT
 # ====================
-
-# Configuration with safer JSON parsing
-def get_env_list(env_name, default):
-    """Safely get JSON list from environment variable"""
-    env_value = os.getenv(env_name)
-    if env_value:
-        try:
-            return json.loads(env_value)
-        except json.JSONDecodeError:
-            logger.warning(f"{env_name} has invalid JSON format, using default")
-            return default
-    return default
-
-def get_env_value(env_name, default):
-    """Safely get value from environment variable"""
-    return os.getenv(env_name, default)
-
-BOT_TOKEN = get_env_value("BOT_TOKEN", "")
-ADMIN_CHANNEL = get_env_value("ADMIN_CHANNEL", "@AddisCarHub")
-ADMIN_IDS = get_env_list("ADMIN_IDS", [])
-
-# UPDATED: New broker phone numbers with agent labels
-BROKER_PHONES = get_env_list("BROKER_PHONES", ["0911564697", "0913550415"])
-BROKER_NAME = get_env_value("BROKER_NAME", "Addis Car Hub")
-
-# NEW: Formatted broker phones with agent labels
-def get_formatted_broker_phones():
-    """Return formatted broker phones with agent labels and hotline"""
-    formatted = []
-    
-    # Add agents
-    if len(BROKER_PHONES) >= 1:
-        formatted.append(f"• Agent #1 - {BROKER_PHONES[0]}")
-    if len(BROKER_PHONES) >= 2:
-        formatted.append(f"• Agent #2 - {BROKER_PHONES[1]}")
-    
-    # Add remaining agents if any
-    for i in range(2, len(BROKER_PHONES)):
-        formatted.append(f"• Agent #{i+1} - {BROKER_PHONES[i]}")
-    
-    # Add hotline
-    formatted.append("• Hotline/Call Center - 5555 (Coming Soon)")
-    
-    return "\n".join(formatted)
+# Importing this module only defines handlers on `router`. The bot,
+# dispatcher, database and outbox are built by create_app(config) and kept in
+# the module globals below, which the handlers read at call time.
+
+router = Router()
+
+config = None
+templates = None
+database = None
+fsm_storage = None
+bot = None
+dp = None
+send_scheduler = None
+throttling = None
+outbox = None
+alert_index = None
+archiver = None
+# Multi-process mode (config.workers > 1): the receiver's Supervisor, or a
+# worker's connection to the receiver
+supervisor = None
+worker_link = None
+
+# Milliseconds per startup phase, filled in by create_app and run_bot
+startup_timings = {"import": round((time.perf_counter() - _import_started) * 1000, 1)}
 
 def get_broker_contact_summary():
     """Return a brief contact summary for short displays"""
-    if BROKER_PHONES:
-        return f"{BROKER_PHONES[0]}, {BROKER_PHONES[1] if len(BROKER_PHONES) > 1 else '0913550415'}"
+    phones = config.broker_phones
+    if phones:
+        return f"{phones[0]}, {phones[1] if len(phones) > 1 else '0913550415'}"
     return "0911564697, 0913550415"
 
 def get_primary_contact():
     """Return primary contact number"""
-    if BROKER_PHONES:
-        return BROKER_PHONES[0]
+    if config.broker_phones:
+        return config.broker_phones[0]
     return "0911564697"
 
-# Check for required BOT_TOKEN
-if not BOT_TOKEN:
-    logger.error("❌ Critical Error: BOT_TOKEN environment variable is not set!")
-    logger.error("Please set the BOT_TOKEN environment variable in Railway.")
-    print("="*60)
-    print("❌ Critical Error: BOT_TOKEN environment variable is not set!")
-    print("Please set the BOT_TOKEN environment variable in Railway.")
-    print("="*60)
-    exit(1)
-
-logger.info("="*60)
-logger.info("🚗 ADDIS CAR HUB - Car Sales & Rental Brokerage Bot")
-logger.info("="*60)
-logger.info(f"🤖 Bot Token: {'✅ Set' if BOT_TOKEN else '❌ Missing'}")
-logger.info(f"🤖 Bot: @AddisCarHubBot")
-logger.info(f"📢 Channel: {ADMIN_CHANNEL}")
-logger.info(f"👥 Agents: {len(BROKER_PHONES)} agents")
-logger.info(f"📞 Agent #1: 0911564697")
-logger.info(f"📞 Agent #2: 0913550415")
-logger.info(f"📞 Hotline: 5555 (Coming Soon)")
-logger.info("="*60)
-
-print("="*60)
-print("🚗 ADDIS CAR HUB - Car Sales & Rental Brokerage Bot")
-print("="*60)
-print(f"🤖 Bot Token: {'✅ Set' if BOT_TOKEN else '❌ Missing'}")
-print(f"🤖 Bot: @AddisCarHubBot")
-print(f"📢 Channel: {ADMIN_CHANNEL}")
-print(f"👥 Agents: {len(BROKER_PHONES)} agents")
-print(f"📞 Agent #1: 0911564697")
-print(f"📞 Agent #2: 0913550415")
-print(f"📞 Hotline: 5555 (Coming Soon)")
-print("="*60)
-
-# Initialize bot with error handling
-try:
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
-    logger.info("✅ Bot and Dispatcher initialized successfully")
-except Exception as e:
-    logger.error(f"❌ Failed to initialize bot: {e}")
-    print(f"❌ Failed to initialize bot: {e}")
-    exit(1)
+def publish(event):
+    """Tell the other processes about a committed change (no-op with one process)
 
-# Database setup
-DB_PATH = "car_broker.db"
+    "outbox": rows were enqueued; "alert:<id>": that saved search was added
+    or removed.
+    """
+    if worker_link is not None:
+        worker_link.publish(event)
+
+# Event-driven tasks, referenced until done so they are not garbage collected
+_event_tasks = set()
+
+async def refresh_alert(alert_id):
+    try:
+        await alert_index.refresh(database, alert_id)
+    except Exception as e:
+        logger.error(f"❌ Could not refresh alert #{alert_id}: {e}")
+
+def on_cluster_event(event):
+    if event == "outbox":
+        outbox.notify()
+    elif event.startswith("alert:") and supervisor is None:
+        # Only workers match alerts; the receiver keeps no alert index
+        task = asyncio.create_task(refresh_alert(int(event.partition(":")[2])))
+        _event_tasks.add(task)
+        task.add_done_callback(_event_tasks.discard)
+
+def log_banner(config):
+    logger.info("="*60)
+    logger.info("🚗 ADDIS CAR HUB - Car Sales & Rental Brokerage Bot")
+    logger.info("="*60)
+    logger.info(f"🤖 Bot Token: {'✅ Set' if config.bot_token else '❌ Missing'}")
+    logger.info(f"🤖 Bot: @AddisCarHubBot")
+    logger.info(f"📢 Channel: {config.admin_channel}")
+    logger.info(f"🔌 Mode: {config.bot_mode}")
+    logger.info(f"👥 Agents: {len(config.broker_phones)} agents")
+    logger.info(f"📞 Agent #1: 0911564697")
+    logger.info(f"📞 Agent #2: 0913550415")
+    logger.info(f"📞 Hotline: 5555 (Coming Soon)")
+    logger.info("="*60)
 
 async def init_db():
+    # A half-migrated schema would only fail later, far from the cause, so a
+    # failed migration stops the bot (and the deploy) here
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS cars (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    user_name TEXT,
-                    user_phone TEXT,
-                    make TEXT,
-                    model TEXT,
-                    year TEXT,
-                    color TEXT,
-                    plate_code TEXT,
-                    plate_partial TEXT,
-                    plate_full TEXT,
-                    plate_region TEXT,
-                    price TEXT,
-                    condition TEXT,
-                    car_type TEXT,
-                    photos TEXT,
-                    rental_advanced TEXT,
-                    rental_warranty TEXT,
-                    rental_purpose TEXT,
-                    rental_region TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'pending'
-                )
-            ''')
-            await db.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    full_name TEXT,
-                    phone TEXT,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    ads_posted INTEGER DEFAULT 0
-                )
-            ''')
-            await db.commit()
-        logger.info("✅ Database setup completed")
+        version = await run_migrations(database)
+        logger.info(f"✅ Database setup completed (schema version {version})")
     except Exception as e:
         logger.error(f"❌ Database setup failed: {e}")
+        raise
+
+async def record_ad_counters(db, user, phone):
+    """Bump per-user and global ad counters inside the caller's transaction"""
+    await db.execute(
+        '''INSERT INTO users (user_id, username, full_name, phone, ads_posted)
+        VALUES (?, ?, ?, ?, 1)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            full_name = excluded.full_name,
+            phone = excluded.phone,
+            ads_posted = users.ads_posted + 1''',
+        (user.id, user.username, user.full_name, phone)
+    )
+    await db.execute(
+        '''INSERT INTO counters (name, value) VALUES ('total_ads', 1)
+        ON CONFLICT(name) DO UPDATE SET value = counters.value + 1'''
+    )
+
+async def record_photos(db, car_id, photos, photo_uids):
+    """Store the ad's photos in posting order inside the caller's transaction"""
+    if photos:
+        await db.executemany(
+            "INSERT INTO car_photos (car_id, position, file_id, file_unique_id) VALUES (?, ?, ?, ?)",
+            [(car_id, position, file_id, photo_uids[position] if position < len(photo_uids) else None)
+             for position, file_id in enumerate(photos)]
+        )
 
 # ====================
 # ADMIN NOTIFICATION SYSTEM - UPDATED WITH NEW PHONES
 # ====================
 
-async def notify_admins(user_data, ad_data, car_type):
-    """Send user information to brokers"""
-    try:
-        # Format broker phones for message - UPDATED
-        broker_phones_formatted = get_formatted_broker_phones()
-        
-        # Create admin notification message - UPDATED
-        admin_msg = f"""🔔 New car advertisement added!
-
-👤 User Information:
-• Name: {user_data.get('full_name', 'N/A')}
-• Telegram ID: @{user_data.get('username', 'N/A')}
-• Phone Number: {ad_data.get('user_phone', 'N/A')}
-
-🚗 Car Information:
-• Type: {'Sale' if car_type == 'sale' else 'Rental'}
-• Make: {ad_data.get('make', 'N/A')}
-• Model: {ad_data.get('model', 'N/A')}
-• Year: {ad_data.get('year', 'N/A')}
-• Price: {ad_data.get('price', 'N/A')} Birr
-• Condition: {ad_data.get('condition', 'N/A')[:100]}...
-
-⏰ Time: {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
-
-📢 Advertisement has been posted on channel: {ADMIN_CHANNEL}
+async def notify_admins(payload):
+    """Outbox handler: send an admin notification to every listed admin"""
+    admin_ids = payload.get('admin_ids', [])
+    admin_msg = payload['text']
+    
+    # Send to all admins concurrently, capped at ADMIN_NOTIFY_CONCURRENCY
+    async def send_to_admin(admin_id):
+        await bot.send_message(chat_id=admin_id, text=admin_msg)
+    
+    failures = await fan_out(admin_ids, send_to_admin, config.admin_notify_concurrency)
+    sent = len(admin_ids) - len(failures)
+    logger.info(f"✅ Notification sent to {sent}/{len(admin_ids)} admins")
+    if failures:
+        details = "; ".join(f"{admin_id}: {e}" for admin_id, e in failures)
+        logger.error(f"❌ Failed to notify {len(failures)} admin(s): {details}")
+        # Only the admins that failed are retried
+        raise PartialDelivery(
+            {'text': admin_msg, 'admin_ids': [admin_id for admin_id, _ in failures]},
+            [(admin_id, str(e)) for admin_id, e in failures]
+        )
 
-📞 Contact Information:
-{broker_phones_formatted}
+async def post_to_channel(payload):
+    """Outbox handler: publish an ad to the channel"""
+    photos = payload.get('photos', [])
+    ad_text = payload['text']
+    chat_id = payload.get('chat_id', config.admin_channel)
+    
+    if photos:
+        media = []
+        for i, photo_id in enumerate(photos):
+            if i == 0:
+                media.append(types.InputMediaPhoto(
+                    media=photo_id, 
+                    caption=ad_text,
+                    parse_mode="Markdown"
+                ))
+            else:
+                media.append(types.InputMediaPhoto(media=photo_id))
+        sent = await bot.send_media_group(chat_id=chat_id, media=media)
+        logger.info(f"📤 Ad #{payload.get('car_id')} posted with {len(photos)} photos")
+        # The caption, and so the ad text, is on the first message of the album
+        await save_channel_post(payload, sent[0], has_media=True)
+    else:
+        sent = await bot.send_message(
+            chat_id=chat_id,
+            text=ad_text,
+            parse_mode="Markdown"
+        )
+        logger.info(f"📤 Ad #{payload.get('car_id')} text ad posted")
+        await save_channel_post(payload, sent, has_media=False)
 
-🔗 Bot: @AddisCarHubBot
-🔗 Channel: {ADMIN_CHANNEL}
-"""
-        
-        # Send to all admins
-        for admin_id in ADMIN_IDS:
-            try:
-                await bot.send_message(chat_id=admin_id, text=admin_msg)
-                logger.info(f"✅ Notification sent to admin {admin_id}")
-            except Exception as e:
-                logger.error(f"❌ Failed to send to admin {admin_id}: {e}")
+async def save_channel_post(payload, message, has_media):
+    """Remember which channel message carries the ad's text"""
+    car_id = payload.get('car_id')
+    try:
+        async with database.writer() as db:
+            await db.execute(
+                '''INSERT OR REPLACE INTO channel_posts (car_id, chat_id, message_id, has_media, posted_price)
+                VALUES (?, ?, ?, ?, COALESCE(?, (SELECT price FROM cars WHERE id = ?)))''',
+                (car_id, message.chat.id, message.message_id, int(has_media), payload.get('price'), car_id)
+            )
     except Exception as e:
-        logger.error(f"❌ Error in notify_admins: {e}")
+        # The post is out; failing the row would only post it a second time
+        logger.error(f"❌ Ad #{car_id} posted as message {message.message_id} but not recorded: {e}")
+
+async def edit_channel_post(payload):
+    """Outbox handler: bring an ad's channel post in line with its status and price"""
+    car_id = payload['car_id']
+    post = await database.fetchone(
+        "SELECT chat_id, message_id, has_media, posted_price FROM channel_posts WHERE car_id = ?",
+        (car_id,)
+    )
+    if post is None:
+        pending = await database.fetchone(
+            '''SELECT 1 FROM outbox WHERE car_id = ? AND kind = 'channel_post'
+            AND status IN ('pending', 'processing')''',
+            (car_id,)
+        )
+        if pending:
+            # Retried with backoff until the channel_post row has been delivered
+            raise LookupError(f"Ad #{car_id} is not posted yet")
+        logger.warning(f"⚠️ Ad #{car_id} has no recorded channel post, nothing to edit")
+        return
+    chat_id, message_id, has_media, posted_price = post
+    ad = await fetch_ad(database, car_id)
+    if ad is None:
+        logger.warning(f"⚠️ Ad #{car_id} no longer exists, channel post left as is")
+        return
+    text = templates.channel_post({k: '' if v is None else v for k, v in ad.items()}, posted_price)
+    try:
+        if has_media:
+            await bot.edit_message_caption(chat_id=chat_id, message_id=message_id, caption=text, parse_mode="Markdown")
+        else:
+            await bot.edit_message_text(chat_id=chat_id, message_id=message_id, text=text, parse_mode="Markdown")
+    except TelegramBadRequest as e:
+        # A repeated edit (e.g. a retry after a timeout) changes nothing
+        if "message is not modified" not in str(e):
+            raise
+    async with database.writer() as db:
+        await db.execute("UPDATE channel_posts SET edited_at = CURRENT_TIMESTAMP WHERE car_id = ?", (car_id,))
+    logger.info(f"✏️ Ad #{car_id} channel post updated ({ad['status']}, {ad['price']})")
+
+async def notify_alert_matches(payload):
+    """Outbox handler: tell every user whose saved search matched a new ad"""
+    user_ids = payload.get('user_ids', [])
+    text = payload['text']
+    
+    # The send scheduler keeps this within Telegram's global and per-chat limits
+    async def send_to_user(user_id):
+        await bot.send_message(chat_id=user_id, text=text)
+    
+    failures = await fan_out(user_ids, send_to_user, config.alert_notify_concurrency)
+    # Users who blocked the bot will never receive it; don't retry them
+    retry = [(user_id, e) for user_id, e in failures if not isinstance(e, TelegramForbiddenError)]
+    logger.info(f"🔔 Ad #{payload.get('car_id')} alert sent to {len(user_ids) - len(failures)}/{len(user_ids)} users")
+    if retry:
+        raise PartialDelivery(
+            {'car_id': payload.get('car_id'), 'text': text, 'user_ids': [user_id for user_id, _ in retry]},
+            [(user_id, str(e)) for user_id, e in retry]
+        )
+
+# Channel posts and admin notifications are written to the outbox in the same
+# transaction as the ad and delivered by the OutboxWorker pool built in create_app
+OUTBOX_HANDLERS = {
+    'channel_post': post_to_channel,
+    'admin_notification': notify_admins,
+    'alert_match': notify_alert_matches,
+    'channel_edit': edit_channel_post,
+}
 
 # State machine
 class CarForm(StatesGroup):
@@ -358,6 +322,12 @@ class CarForm(StatesGroup):
     waiting_for_rental_purpose = State()
     waiting_for_rental_region = State()
 
+# Photo upload limit per ad
+MAX_PHOTOS = 5
+
+# Serialises updates to a draft's photo list
+photo_locks = KeyedLocks()
+
 # Format plate number
 def format_plate_number(partial):
     """Format plate number: A12 → A12xxx, 546 → 54xxxx"""
@@ -379,190 +349,35 @@ def format_plate_number(partial):
         logger.error(f"Error formatting plate: {e}")
         return partial
 
-# ====================
-# KEYBOARD BUILDERS
-# ====================
-
-def get_plate_code_keyboard():
-    """Plate code selection keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="1 - Taxi")],
-            [KeyboardButton(text="2 - Private vehicle")],
-            [KeyboardButton(text="3 - Commercial/Enterprise")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
-def get_rental_advanced_keyboard():
-    """Advanced payment keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="One month")],
-            [KeyboardButton(text="Two months")],
-            [KeyboardButton(text="Three months")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
-def get_rental_warranty_keyboard():
-    """Warranty keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="Yes, it's necessary")],
-            [KeyboardButton(text="No, it's not necessary")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
-def get_rental_purpose_keyboard():
-    """Rental purpose keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="For personal use")],
-            [KeyboardButton(text="For enterprise")],
-            [KeyboardButton(text="For taxi service (Ride)")],
-            [KeyboardButton(text="For tour")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
-def get_photo_actions_keyboard():
-    """Photo actions keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="📸 Done - Finish Adding Photos")],
-            [KeyboardButton(text="⏩ Skip - No Photos")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
-def get_confirmation_keyboard():
-    """Confirmation screen keyboard"""
-    return ReplyKeyboardMarkup(
-        keyboard=[
-            [KeyboardButton(text="✅ Confirm & Post")],
-            [KeyboardButton(text="✏️ Edit Details")],
-            [KeyboardButton(text="❌ Cancel")]
-        ],
-        resize_keyboard=True,
-        one_time_keyboard=True
-    )
-
 # ====================
 # ENGLISH USER INTERFACE - UPDATED CONTACT INFO
 # ====================
 
 # Start command with enhanced error handling
-@dp.message(Command("start"))
+@router.message(Command("start"))
 async def start_command(message: types.Message):
     try:
         logger.info(f"Start command from user {message.from_user.id} (@{message.from_user.username})")
         
-        # UPDATED: Added hotline to welcome message
-        welcome_msg = """🏎️ *Welcome to Addis Car Hub!* 🤝
-
-We are reliable and efficient car brokers operating in Addis Ababa!
-
-*Why choose us?*
-✅ Accurate and verified cars only
-✅ Secure brokerage service
-✅ 2-10% commission (based on prior agreement)
-✅ All communications through us
-✅ Dedicated hotline coming soon!
-
-*Post your car in 2 minutes:*
-1. Choose for sale or rental
-2. Enter your car details
-3. Add photos
-4. It will be listed on @AddisCarHub channel!
-
-*User privacy:* We protect your personal information. All inquiries come through us.
-
-*Need help?* Call our agents or use our hotline!
-
-Choose from the options below:"""
-
-        keyboard = ReplyKeyboardMarkup(
-            keyboard=[
-                [KeyboardButton(text="🚗 Car for Sale"), 
-                 KeyboardButton(text="🏢 Car for Rental")],
-                [KeyboardButton(text="📊 My Statistics"),
-                 KeyboardButton(text="ℹ️ How It Works")],
-                [KeyboardButton(text="📞 Contact Agents")]
-            ],
-            resize_keyboard=True
-        )
-        
-        await message.answer(welcome_msg, parse_mode="Markdown", reply_markup=keyboard)
+        await message.answer(templates.welcome, parse_mode="Markdown", reply_markup=MAIN_MENU_KEYBOARD)
         logger.info(f"Start message sent to user {message.from_user.id}")
     except Exception as e:
         logger.error(f"Error in start_command: {e}")
         await message.answer("An error occurred. Please try again or contact support.")
 
 # How it works - UPDATED CONTACT INFO
-@dp.message(F.text == "ℹ️ How It Works")
+@router.message(F.text == "ℹ️ How It Works")
 async def how_it_works(message: types.Message):
     try:
-        # UPDATED: Added contact info to how it works
-        msg = f"""*🤝 How Addis Ababa Car Rental & Sales Hub Works*
-
-1. *You enter your car details* through this bot
-2. *We verify* and post it on @AddisCarHub
-3. *Buyers/renters* contact us (not directly with you)
-4. *We connect you* with serious buyers
-5. *The transaction completes* with our brokerage service
-
-*Commission:*
-• Sale: 2% of sale price
-• Rental: 10% of rental price
-
-*Benefits:*
-✅ Your privacy is protected
-✅ Verified buyers only
-✅ Assistance with price negotiation
-✅ Assistance with paperwork
-
-*Contact Options:*
-• Call our agents directly
-• Use our hotline (coming soon)
-• Message us on Telegram
-
-🚗 Start by listing your car for sale or 🏢 for rental!"""
-        
-        await message.answer(msg, parse_mode="Markdown")
+        await message.answer(templates.how_it_works, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Error in how_it_works: {e}")
 
 # Contact Broker - UPDATED TO "CONTACT AGENTS" WITH NEW PHONES
-@dp.message(F.text == "📞 Contact Agents")
+@router.message(F.text == "📞 Contact Agents")
 async def contact_broker(message: types.Message):
     try:
-        # UPDATED: Get formatted broker phones with agent labels and hotline
-        broker_phones_formatted = get_formatted_broker_phones()
-        
-        msg = f"""*📞 Contact Our Team*
-
-{BROKER_NAME}
-*Agents & Hotline:*
-{broker_phones_formatted}
-
-*Working Hours:* 9:00 AM - 6:00 PM
-*Services:* Car brokerage, verification, negotiation
-
-*For urgent matters:* Call agents directly
-
-*Note:* Hotline/Call Center (5555) coming soon!
-
-*Channel:* {ADMIN_CHANNEL}
-*Bot:* @AddisCarHubBot"""
-        
-        await message.answer(msg, parse_mode="Markdown")
+        await message.answer(templates.contact, parse_mode="Markdown")
     except Exception as e:
         logger.error(f"Error in contact_broker: {e}")
 
@@ -570,7 +385,7 @@ async def contact_broker(message: types.Message):
 # SALE CAR FLOW - ENGLISH
 # ====================
 
-@dp.message(F.text == "🚗 Car for Sale")
+@router.message(F.text == "🚗 Car for Sale")
 async def start_sale_ad(message: types.Message, state: FSMContext):
     try:
         await state.update_data(car_type="sale")
@@ -581,7 +396,7 @@ async def start_sale_ad(message: types.Message, state: FSMContext):
             "We collect your car details. All fields are required.\n\n"
             "*Step 1:* Enter car manufacturer (make):\nExample: Toyota, KIA, Honda",
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_make)
     except Exception as e:
@@ -589,7 +404,7 @@ async def start_sale_ad(message: types.Message, state: FSMContext):
         await message.answer("An error occurred. Please try again.")
 
 # Collect car make (for sale)
-@dp.message(CarForm.waiting_for_make)
+@router.message(CarForm.waiting_for_make)
 async def get_make(message: types.Message, state: FSMContext):
     try:
         await state.update_data(make=message.text)
@@ -599,7 +414,7 @@ async def get_make(message: types.Message, state: FSMContext):
         logger.error(f"Error in get_make: {e}")
 
 # Collect model (for sale)
-@dp.message(CarForm.waiting_for_model)
+@router.message(CarForm.waiting_for_model)
 async def get_model(message: types.Message, state: FSMContext):
     try:
         await state.update_data(model=message.text)
@@ -612,7 +427,7 @@ async def get_model(message: types.Message, state: FSMContext):
 # RENTAL CAR FLOW - ENGLISH
 # ====================
 
-@dp.message(F.text == "🏢 Car for Rental")
+@router.message(F.text == "🏢 Car for Rental")
 async def start_rental_ad(message: types.Message, state: FSMContext):
     try:
         await state.update_data(car_type="rental")
@@ -623,7 +438,7 @@ async def start_rental_ad(message: types.Message, state: FSMContext):
             "We collect rental details. All fields are required.\n\n"
             "*Step 1:* Enter car manufacturer (make):\nExample: Toyota, KIA, Honda",
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_make)
     except Exception as e:
@@ -635,7 +450,7 @@ async def start_rental_ad(message: types.Message, state: FSMContext):
 # ====================
 
 # Collect year (COMMON)
-@dp.message(CarForm.waiting_for_year)
+@router.message(CarForm.waiting_for_year)
 async def get_year_common(message: types.Message, state: FSMContext):
     try:
         await state.update_data(year=message.text)
@@ -654,7 +469,7 @@ async def get_year_common(message: types.Message, state: FSMContext):
                 "• 3 - Commercial/Enterprise\n"
                 "Choose from the buttons below:",
                 parse_mode="Markdown",
-                reply_markup=get_plate_code_keyboard()
+                reply_markup=PLATE_CODE_KEYBOARD
             )
             await state.set_state(CarForm.waiting_for_rental_plate_code)
     except Exception as e:
@@ -665,7 +480,7 @@ async def get_year_common(message: types.Message, state: FSMContext):
 # ====================
 
 # Collect color (sale only)
-@dp.message(CarForm.waiting_for_color)
+@router.message(CarForm.waiting_for_color)
 async def get_color(message: types.Message, state: FSMContext):
     try:
         await state.update_data(color=message.text)
@@ -677,14 +492,14 @@ async def get_color(message: types.Message, state: FSMContext):
             "• 3 - Commercial/Enterprise\n"
             "Choose from the buttons below:",
             parse_mode="Markdown",
-            reply_markup=get_plate_code_keyboard()
+            reply_markup=PLATE_CODE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_plate_code)
     except Exception as e:
         logger.error(f"Error in get_color: {e}")
 
 # Collect plate code (sale only)
-@dp.message(CarForm.waiting_for_plate_code)
+@router.message(CarForm.waiting_for_plate_code)
 async def get_plate_code_sale(message: types.Message, state: FSMContext):
     try:
         plate_code_map = {
@@ -694,7 +509,7 @@ async def get_plate_code_sale(message: types.Message, state: FSMContext):
         }
         
         if message.text not in plate_code_map:
-            await message.answer("❌ Please select from the buttons below:", reply_markup=get_plate_code_keyboard())
+            await message.answer("❌ Please select from the buttons below:", reply_markup=PLATE_CODE_KEYBOARD)
             return
         
         plate_code = plate_code_map[message.text]
@@ -709,14 +524,14 @@ async def get_plate_code_sale(message: types.Message, state: FSMContext):
             "• If plate is 123ABC → Enter: 123\n\n"
             "For privacy, we store it like this: A12xxx / 54xxxx",
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_plate_partial)
     except Exception as e:
         logger.error(f"Error in get_plate_code_sale: {e}")
 
 # Collect plate partial (sale only)
-@dp.message(CarForm.waiting_for_plate_partial)
+@router.message(CarForm.waiting_for_plate_partial)
 async def get_plate_partial(message: types.Message, state: FSMContext):
     try:
         partial = message.text.upper().strip()
@@ -738,7 +553,7 @@ async def get_plate_partial(message: types.Message, state: FSMContext):
         logger.error(f"Error in get_plate_partial: {e}")
 
 # Collect plate region (sale only)
-@dp.message(CarForm.waiting_for_plate_region)
+@router.message(CarForm.waiting_for_plate_region)
 async def get_plate_region(message: types.Message, state: FSMContext):
     try:
         await state.update_data(plate_region=message.text)
@@ -752,10 +567,24 @@ async def get_plate_region(message: types.Message, state: FSMContext):
         logger.error(f"Error in get_plate_region: {e}")
 
 # Collect price (sale only)
-@dp.message(CarForm.waiting_for_price)
+@router.message(CarForm.waiting_for_price)
 async def get_price_sale(message: types.Message, state: FSMContext):
     try:
-        await state.update_data(price=message.text)
+        parsed = parse_listing_price(message.text, 'sale')
+        if parsed is None:
+            await message.answer(
+                "❌ Please enter the full sale price in Birr, for example 1,800,000 or 1.8M "
+                "(USD prices are not accepted)"
+            )
+            return
+        
+        price_birr, price_currency, _ = price_columns(parsed)
+        await state.update_data(
+            price=message.text,
+            price_birr=price_birr,
+            price_currency=price_currency,
+            price_period=None
+        )
         await ask_for_phone(message, state)
     except Exception as e:
         logger.error(f"Error in get_price_sale: {e}")
@@ -765,7 +594,7 @@ async def get_price_sale(message: types.Message, state: FSMContext):
 # ====================
 
 # Collect plate code (rental only)
-@dp.message(CarForm.waiting_for_rental_plate_code)
+@router.message(CarForm.waiting_for_rental_plate_code)
 async def get_plate_code_rental(message: types.Message, state: FSMContext):
     try:
         plate_code_map = {
@@ -775,7 +604,7 @@ async def get_plate_code_rental(message: types.Message, state: FSMContext):
         }
         
         if message.text not in plate_code_map:
-            await message.answer("❌ Please select from the buttons below:", reply_markup=get_plate_code_keyboard())
+            await message.answer("❌ Please select from the buttons below:", reply_markup=PLATE_CODE_KEYBOARD)
             return
         
         plate_code = plate_code_map[message.text]
@@ -784,17 +613,31 @@ async def get_plate_code_rental(message: types.Message, state: FSMContext):
         await message.answer(
             "*Step 5:* Enter daily rental price in Birr:\nExample: 1,200, 1,500, 2,500, 3,000",
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_rental_price)
     except Exception as e:
         logger.error(f"Error in get_plate_code_rental: {e}")
 
 # Collect rental price
-@dp.message(CarForm.waiting_for_rental_price)
+@router.message(CarForm.waiting_for_rental_price)
 async def get_rental_price(message: types.Message, state: FSMContext):
     try:
-        await state.update_data(price=message.text)
+        parsed = parse_listing_price(message.text, 'rental')
+        if parsed is None:
+            await message.answer(
+                "❌ Please enter the price per day in Birr, for example 1,500 or 2,500 "
+                "(weekly or monthly prices and USD are not accepted)"
+            )
+            return
+        
+        price_birr, price_currency, price_period = price_columns(parsed)
+        await state.update_data(
+            price=message.text,
+            price_birr=price_birr,
+            price_currency=price_currency,
+            price_period=price_period
+        )
         
         await message.answer(
             "*Step 6:* Advance payment required:\n"
@@ -803,19 +646,19 @@ async def get_rental_price(message: types.Message, state: FSMContext):
             "• Three months\n"
             "Choose from the buttons below:",
             parse_mode="Markdown",
-            reply_markup=get_rental_advanced_keyboard()
+            reply_markup=RENTAL_ADVANCED_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_advanced_payment)
     except Exception as e:
         logger.error(f"Error in get_rental_price: {e}")
 
 # Collect advanced payment
-@dp.message(CarForm.waiting_for_advanced_payment)
+@router.message(CarForm.waiting_for_advanced_payment)
 async def get_advanced_payment(message: types.Message, state: FSMContext):
     try:
         valid_options = ["One month", "Two months", "Three months"]
         if message.text not in valid_options:
-            await message.answer("❌ Please choose from the buttons below:", reply_markup=get_rental_advanced_keyboard())
+            await message.answer("❌ Please choose from the buttons below:", reply_markup=RENTAL_ADVANCED_KEYBOARD)
             return
         
         await state.update_data(rental_advanced=message.text)
@@ -826,19 +669,19 @@ async def get_advanced_payment(message: types.Message, state: FSMContext):
             "• No, it's not necessary\n"
             "Choose from the buttons below:",
             parse_mode="Markdown",
-            reply_markup=get_rental_warranty_keyboard()
+            reply_markup=RENTAL_WARRANTY_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_warranty_needed)
     except Exception as e:
         logger.error(f"Error in get_advanced_payment: {e}")
 
 # Collect warranty needed
-@dp.message(CarForm.waiting_for_warranty_needed)
+@router.message(CarForm.waiting_for_warranty_needed)
 async def get_warranty_needed(message: types.Message, state: FSMContext):
     try:
         valid_options = ["Yes, it's necessary", "No, it's not necessary"]
         if message.text not in valid_options:
-            await message.answer("❌ Please choose from the buttons below:", reply_markup=get_rental_warranty_keyboard())
+            await message.answer("❌ Please choose from the buttons below:", reply_markup=RENTAL_WARRANTY_KEYBOARD)
             return
         
         await state.update_data(rental_warranty=message.text)
@@ -851,19 +694,19 @@ async def get_warranty_needed(message: types.Message, state: FSMContext):
             "• For tour\n"
             "Choose from the buttons below:",
             parse_mode="Markdown",
-            reply_markup=get_rental_purpose_keyboard()
+            reply_markup=RENTAL_PURPOSE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_rental_purpose)
     except Exception as e:
         logger.error(f"Error in get_warranty_needed: {e}")
 
 # Collect rental purpose
-@dp.message(CarForm.waiting_for_rental_purpose)
+@router.message(CarForm.waiting_for_rental_purpose)
 async def get_rental_purpose(message: types.Message, state: FSMContext):
     try:
         valid_options = ["For personal use", "For enterprise", "For taxi service (Ride)", "For tour"]
         if message.text not in valid_options:
-            await message.answer("❌ Please choose from the buttons below:", reply_markup=get_rental_purpose_keyboard())
+            await message.answer("❌ Please choose from the buttons below:", reply_markup=RENTAL_PURPOSE_KEYBOARD)
             return
         
         await state.update_data(rental_purpose=message.text)
@@ -872,14 +715,14 @@ async def get_rental_purpose(message: types.Message, state: FSMContext):
             "*Step 9:* Enter region where car is available for rental (city):\n"
             "Example: Addis Ababa, Adama, Hawassa",
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_rental_region)
     except Exception as e:
         logger.error(f"Error in get_rental_purpose: {e}")
 
 # Collect rental region
-@dp.message(CarForm.waiting_for_rental_region)
+@router.message(CarForm.waiting_for_rental_region)
 async def get_rental_region(message: types.Message, state: FSMContext):
     try:
         await state.update_data(rental_region=message.text)
@@ -907,7 +750,7 @@ async def ask_for_phone(message: types.Message, state: FSMContext):
         logger.error(f"Error in ask_for_phone: {e}")
 
 # Collect phone (common for both)
-@dp.message(CarForm.waiting_for_phone)
+@router.message(CarForm.waiting_for_phone)
 async def get_phone(message: types.Message, state: FSMContext):
     try:
         if not re.match(r'^09\d{8}$', message.text):
@@ -949,7 +792,7 @@ async def get_phone(message: types.Message, state: FSMContext):
         logger.error(f"Error in get_phone: {e}")
 
 # Collect condition (common for both)
-@dp.message(CarForm.waiting_for_condition)
+@router.message(CarForm.waiting_for_condition)
 async def get_condition(message: types.Message, state: FSMContext):
     try:
         await state.update_data(condition=message.text)
@@ -966,7 +809,7 @@ async def get_condition(message: types.Message, state: FSMContext):
         
         photo_prompt += "\nSend up to 5 photos\nUse buttons below when finished:"
         
-        await message.answer(photo_prompt, parse_mode="Markdown", reply_markup=get_photo_actions_keyboard())
+        await message.answer(photo_prompt, parse_mode="Markdown", reply_markup=PHOTO_ACTIONS_KEYBOARD)
         await state.update_data(photos=[])
         await state.set_state(CarForm.waiting_for_photos)
     except Exception as e:
@@ -977,53 +820,61 @@ async def get_condition(message: types.Message, state: FSMContext):
 # ====================
 
 # Handle photos - UPDATED: This handler only processes photos
-@dp.message(CarForm.waiting_for_photos, F.photo)
-async def handle_photo(message: types.Message, state: FSMContext):
+# Albums arrive here once, with every part in `album` (see AlbumMiddleware)
+@router.message(CarForm.waiting_for_photos, F.photo, flags={"throttling": "photo"})
+async def handle_photo(message: types.Message, state: FSMContext, album=None):
     try:
-        logger.info(f"User {message.from_user.id} sent a photo")
-        data = await state.get_data()
-        photos = data.get('photos', [])
+        messages = album or [message]
+        logger.debug(f"User {message.from_user.id} sent {len(messages)} photo(s)")
         
-        if len(photos) < 5:
-            photos.append(message.photo[-1].file_id)
-            await state.update_data(photos=photos)
-            remaining = 5 - len(photos)
-            
-            if remaining > 0:
-                await message.answer(
-                    f"✅ Photo added ({len(photos)}/5)\n"
-                    f"{remaining} more can be added.\n\n"
-                    f"When finished, click '📸 Done' below or send another photo.",
-                    reply_markup=get_photo_actions_keyboard()
-                )
-            else:
-                await message.answer(
-                    "📸 Maximum 5 photos reached!\n"
-                    "Click '📸 Done' below to continue.",
-                    reply_markup=get_photo_actions_keyboard()
-                )
+        # Read-modify-write of the photo list under a per-draft lock
+        async with photo_locks(state.key):
+            data = await state.get_data()
+            photos = data.get('photos', [])
+            room = max(0, MAX_PHOTOS - len(photos))
+            new_photos = [m.photo[-1] for m in messages if m.photo]
+            added = [p.file_id for p in new_photos[:room]]
+            if added:
+                photos = photos + added
+                # file_unique_id identifies the same picture across uploads (repost check)
+                photo_uids = data.get('photo_uids', []) + [p.file_unique_id for p in new_photos[:room]]
+                await state.update_data(photos=photos, photo_uids=photo_uids)
+        
+        ignored = len(new_photos) - len(added)
+        remaining = MAX_PHOTOS - len(photos)
+        
+        if added and remaining > 0:
+            added_text = "✅ Photo added" if len(added) == 1 else f"✅ {len(added)} photos added"
+            await message.answer(
+                f"{added_text} ({len(photos)}/{MAX_PHOTOS})\n"
+                f"{remaining} more can be added.\n\n"
+                f"When finished, click '📸 Done' below or send another photo.",
+                reply_markup=PHOTO_ACTIONS_KEYBOARD
+            )
         else:
+            ignored_text = f"⚠️ {ignored} photo(s) were not added.\n" if ignored else ""
             await message.answer(
-                "📸 Maximum 5 photos reached!\n"
+                f"📸 Maximum {MAX_PHOTOS} photos reached!\n"
+                f"{ignored_text}"
                 "Click '📸 Done' below to continue.",
-                reply_markup=get_photo_actions_keyboard()
+                reply_markup=PHOTO_ACTIONS_KEYBOARD
             )
     except Exception as e:
         logger.error(f"Error in handle_photo: {e}")
         await message.answer(
             "❌ Error processing photo. Please try again or skip photos.",
-            reply_markup=get_photo_actions_keyboard()
+            reply_markup=PHOTO_ACTIONS_KEYBOARD
         )
 
 # Handle photo actions (buttons) - UPDATED: This handler only processes text/buttons
-@dp.message(CarForm.waiting_for_photos)
+@router.message(CarForm.waiting_for_photos)
 async def handle_photo_actions(message: types.Message, state: FSMContext):
     try:
-        logger.info(f"User {message.from_user.id} sent text in photo state: {message.text}")
+        logger.debug(f"User {message.from_user.id} sent text in photo state: {message.text}")
         
         if message.text == "📸 Done - Finish Adding Photos":
             # User finished adding photos
-            logger.info(f"User {message.from_user.id} clicked 'Done' for photos")
+            logger.debug(f"User {message.from_user.id} clicked 'Done' for photos")
             data = await state.get_data()
             photos = data.get('photos', [])
             
@@ -1031,13 +882,13 @@ async def handle_photo_actions(message: types.Message, state: FSMContext):
                 await message.answer(
                     f"✅ You added {len(photos)} photo(s).\n"
                     "Now let's review your ad before posting...",
-                    reply_markup=ReplyKeyboardRemove()
+                    reply_markup=REMOVE_KEYBOARD
                 )
             else:
                 await message.answer(
                     "✅ No photos added.\n"
                     "Now let's review your ad before posting...",
-                    reply_markup=ReplyKeyboardRemove()
+                    reply_markup=REMOVE_KEYBOARD
                 )
             
             # Wait a moment for better UX
@@ -1046,32 +897,32 @@ async def handle_photo_actions(message: types.Message, state: FSMContext):
             
         elif message.text == "⏩ Skip - No Photos":
             # User skipped photos
-            logger.info(f"User {message.from_user.id} clicked 'Skip' for photos")
-            await state.update_data(photos=[])
+            logger.debug(f"User {message.from_user.id} clicked 'Skip' for photos")
+            await state.update_data(photos=[], photo_uids=[])
             await message.answer(
                 "✅ Skipped photos.\n"
                 "Now let's review your ad before posting...",
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=REMOVE_KEYBOARD
             )
             await asyncio.sleep(1)
             await show_confirmation(message, state)
             
         else:
             # If user sends text that's not a button
-            logger.info(f"User {message.from_user.id} sent unexpected text in photo state")
+            logger.debug(f"User {message.from_user.id} sent unexpected text in photo state")
             await message.answer(
                 "📸 Please send photos or use the buttons below:\n\n"
                 "• Send photos (up to 5)\n"
                 "• Click '📸 Done' when finished\n"
                 "• Click '⏩ Skip' to continue without photos",
-                reply_markup=get_photo_actions_keyboard()
+                reply_markup=PHOTO_ACTIONS_KEYBOARD
             )
             
     except Exception as e:
         logger.error(f"Error in handle_photo_actions: {e}")
         await message.answer(
             "❌ Error processing photo action. Please try sending photos again or use the buttons.",
-            reply_markup=get_photo_actions_keyboard()
+            reply_markup=PHOTO_ACTIONS_KEYBOARD
         )
 
 # Show confirmation screen
@@ -1109,7 +960,7 @@ async def show_confirmation(message: types.Message, state: FSMContext):
 
 📸 *Photos:* {len(photos)} photo(s) will be posted
 
-*This ad will be posted on:* {ADMIN_CHANNEL}
+*This ad will be posted on:* {config.admin_channel}
 *Agents will contact you at:* {data['user_phone']}
 
 ⚠️ *Please review carefully before posting!*"""
@@ -1136,15 +987,39 @@ async def show_confirmation(message: types.Message, state: FSMContext):
 
 📸 *Photos:* {len(photos)} photo(s) will be posted
 
-*This ad will be posted on:* {ADMIN_CHANNEL}
+*This ad will be posted on:* {config.admin_channel}
 *Agents will contact you at:* {data['user_phone']}
 
 ⚠️ *Please review carefully before posting!*"""
         
+        # Repost check: the same photo or plate already points at an ad
+        fingerprint = plate_fingerprint(data)
+        duplicate = await find_duplicate(database, fingerprint, data.get('photo_uids', []))
+        if duplicate:
+            dup_id, dup_user, dup_make, dup_model, dup_year, dup_created, dup_age, reason = duplicate
+            existing = f"ad #{dup_id} ({dup_make} {dup_model} {dup_year}, posted {str(dup_created)[:10]})"
+            if dup_user == message.from_user.id and (dup_age or 0) < config.duplicate_repost_days:
+                logger.info(f"⛔ User {message.from_user.id} blocked from reposting {existing} ({reason})")
+                await state.clear()
+                await message.answer(
+                    f"⛔ This car is already listed as your {existing} on {config.admin_channel}.\n\n"
+                    f"Reposting is possible after {config.duplicate_repost_days:g} days. "
+                    f"To change the ad, call {get_primary_contact()}.",
+                    reply_markup=START_ONLY_KEYBOARD
+                )
+                return
+            logger.info(f"⚠️ Possible duplicate of {existing} by user {message.from_user.id} ({reason})")
+            await message.answer(
+                f"⚠️ A car with the same {'photo' if reason == 'photo' else 'plate and details'} "
+                f"is already listed as {existing}.\n"
+                "Please make sure you are not posting the same car twice."
+            )
+        await state.update_data(plate_fingerprint=fingerprint)
+        
         await message.answer(
             preview_text,
             parse_mode="Markdown",
-            reply_markup=get_confirmation_keyboard()
+            reply_markup=CONFIRMATION_KEYBOARD
         )
         await state.set_state(CarForm.waiting_for_confirmation)
         
@@ -1152,15 +1027,12 @@ async def show_confirmation(message: types.Message, state: FSMContext):
         logger.error(f"Error in show_confirmation: {e}")
         await message.answer(
             "❌ Error creating preview. Please try again or contact support.",
-            reply_markup=ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text="/start")]],
-                resize_keyboard=True
-            )
+            reply_markup=START_ONLY_KEYBOARD
         )
         await state.clear()
 
 # Handle confirmation
-@dp.message(CarForm.waiting_for_confirmation)
+@router.message(CarForm.waiting_for_confirmation)
 async def handle_confirmation(message: types.Message, state: FSMContext):
     try:
         if message.text == "✅ Confirm & Post":
@@ -1169,22 +1041,17 @@ async def handle_confirmation(message: types.Message, state: FSMContext):
             await message.answer(
                 "❌ Edit feature coming soon. For now, please cancel and start again.\n\n"
                 "You can cancel and start over with updated details.",
-                reply_markup=get_confirmation_keyboard()
+                reply_markup=CONFIRMATION_KEYBOARD
             )
         elif message.text == "❌ Cancel":
             await state.clear()
             await message.answer(
                 "❌ Advertisement cancelled.\n\n"
                 "Your data has been deleted. You can start again anytime!",
-                reply_markup=ReplyKeyboardMarkup(
-                    keyboard=[
-                        [KeyboardButton(text="/start")]
-                    ],
-                    resize_keyboard=True
-                )
+                reply_markup=START_ONLY_KEYBOARD
             )
         else:
-            await message.answer("Please choose one of the options below:", reply_markup=get_confirmation_keyboard())
+            await message.answer("Please choose one of the options below:", reply_markup=CONFIRMATION_KEYBOARD)
     except Exception as e:
         logger.error(f"Error in handle_confirmation: {e}")
 
@@ -1195,173 +1062,79 @@ async def process_ad(message: types.Message, state: FSMContext):
         photos = data.get('photos', [])
         car_type = data.get('car_type', 'sale')
         
-        # UPDATED: Get formatted broker phones with agent labels and hotline
-        broker_phones_formatted = get_formatted_broker_phones()
+        ad_text = templates.ad(data)
         
-        # Format ad based on type
-        if car_type == 'sale':
-            plate_display = f"{data['plate_code']} {data.get('plate_full', '')} {data.get('plate_region', '')}"
-            
-            # UPDATED: Changed "Brokers" to "Agents" in ad text
-            ad_text = f"""🚗 *For Sale - {data['make']} {data['model']} {data['year']}*
-
-📋 *Details:*
-• Make: {data['make']}
-• Model: {data['model']}
-• Year: {data['year']}
-• Color: {data['color']}
-• Plate: {plate_display}
-• Price: *{data['price']} Birr*
-
-🔧 *Condition:*
-{data['condition']}
-
-🤝 *Brokerage Service:*
-• Verified details
-• Seller protection
-• Price negotiation assistance
-• Paperwork verification
-
-📞 *Contact Our Agents:*
-{broker_phones_formatted}
-*Telegram:* @AddisCarHubBot
-
-⚠️ *Note:* All communications through agents only.
-
-#{data['make'].replace(" ", "")} #{data['model'].replace(" ", "")} 
-#CarSale #Automobile #AddisCarHub
-
-*Want to sell your car?* Use @AddisCarHubBot"""
-        else:
-            # UPDATED RENTAL AD TEXT with new phone numbers
-            ad_text = f"""🏢 *For Rental - {data['make']} {data['model']} {data['year']}*
-
-📋 *Rental Details:*
-• Make: {data['make']}
-• Model: {data['model']}
-• Year: {data['year']}
-• Plate Code: {data.get('plate_code', '')}
-• Daily Price: *{data['price']} Birr/Day*
-• Advance Payment: {data.get('rental_advanced', '')}
-• Warranty Required: {data.get('rental_warranty', '')}
-• Rental Purpose: {data.get('rental_purpose', '')}
-• Available Region: {data.get('rental_region', '')}
-
-🔧 *Condition and Terms:*
-{data['condition']}
-
-🤝 *Brokerage Service:*
-• Verified rental
-• Contract assistance
-• Security deposit management
-• Maintenance guidance
-
-📞 *Contact Our Agents:*
-{broker_phones_formatted}
-*Telegram:* @AddisCarHubBot
-
-⚠️ *Note:* All rental arrangements through agents only.
-
-#{data['make'].replace(" ", "")} #{data['model'].replace(" ", "")} 
-#CarRental #Rental #AddisCarHub
-
-*Need to rent a car?* Use @AddisCarHubBot"""
+        # Notify admins with user info
+        user_data = {
+            'full_name': message.from_user.full_name,
+            'username': message.from_user.username or 'N/A'
+        }
+        admin_msg = templates.admin_notification(user_data, data, car_type)
         
-        # Save to database
-        async with aiosqlite.connect(DB_PATH) as db:
+        # Save the ad, its channel post and the admin notification atomically
+        async with database.writer() as db:
             if car_type == 'sale':
-                await db.execute(
+                cursor = await db.execute(
                     '''INSERT INTO cars 
                     (user_id, user_name, user_phone, make, model, year, color, plate_code, plate_partial, plate_full, plate_region, 
-                     price, condition, car_type, photos) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                     price, condition, car_type, price_birr, price_currency, price_period, status) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active')''',
                     (message.from_user.id, message.from_user.full_name, data['user_phone'], data['make'], data['model'], data['year'], 
                      data['color'], data['plate_code'], data.get('plate_partial', ''), data.get('plate_full', ''), 
                      data.get('plate_region', ''), data['price'], data['condition'], data['car_type'], 
-                     json.dumps(photos))
+                     data.get('price_birr'), data.get('price_currency'), data.get('price_period'))
                 )
             else:
-                await db.execute(
+                cursor = await db.execute(
                     '''INSERT INTO cars 
-                    (user_id, user_name, user_phone, make, model, year, plate_code, price, condition, car_type, photos,
-                     rental_advanced, rental_warranty, rental_purpose, rental_region) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                    (user_id, user_name, user_phone, make, model, year, plate_code, price, condition, car_type,
+                     rental_advanced, rental_warranty, rental_purpose, rental_region, price_birr, price_currency, price_period, status) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'active')''',
                     (message.from_user.id, message.from_user.full_name, data['user_phone'], data['make'], data['model'], data['year'], 
                      data['plate_code'], data['price'], data['condition'], data['car_type'], 
-                     json.dumps(photos), data.get('rental_advanced', ''), data.get('rental_warranty', ''), 
-                     data.get('rental_purpose', ''), data.get('rental_region', ''))
+                     data.get('rental_advanced', ''), data.get('rental_warranty', ''), 
+                     data.get('rental_purpose', ''), data.get('rental_region', ''),
+                     data.get('price_birr'), data.get('price_currency'), data.get('price_period'))
                 )
-            await db.commit()
-        
-        logger.info(f"💾 {car_type.capitalize()} ad saved: {data['make']} {data['model']} by user {message.from_user.id}")
-        
-        # Notify admins with user info
-        user_data = {
-            'full_name': message.from_user.full_name,
-            'username': message.from_user.username or 'N/A'
-        }
-        
-        # Send notification to all admins
-        await notify_admins(user_data, data, car_type)
-        
-        # Post to channel
-        if photos:
-            media = []
-            for i, photo_id in enumerate(photos):
-                if i == 0:
-                    media.append(types.InputMediaPhoto(
-                        media=photo_id, 
-                        caption=ad_text,
-                        parse_mode="Markdown"
-                    ))
-                else:
-                    media.append(types.InputMediaPhoto(media=photo_id))
-            await bot.send_media_group(chat_id=ADMIN_CHANNEL, media=media)
-            logger.info(f"📤 {car_type} ad posted with {len(photos)} photos")
-        else:
-            await bot.send_message(
-                chat_id=ADMIN_CHANNEL,
-                text=ad_text,
-                parse_mode="Markdown"
+            car_id = cursor.lastrowid
+            await record_photos(db, car_id, photos, data.get('photo_uids', []))
+            await record_ad_counters(db, message.from_user, data['user_phone'])
+            await record_fingerprints(db, car_id, data.get('plate_fingerprint'), data.get('photo_uids', []))
+            await enqueue(db, 'channel_post', {
+                'car_id': car_id,
+                'chat_id': config.admin_channel,
+                'text': ad_text,
+                'photos': photos,
+                'price': data['price']
+            }, car_id=car_id)
+            if config.admin_ids:
+                await enqueue(db, 'admin_notification', {
+                    'text': admin_msg,
+                    'admin_ids': config.admin_ids
+                }, car_id=car_id)
+            
+            # In-memory lookup, so it is cheap enough to run inside the transaction
+            matches = alert_index.match(
+                data['make'], data['model'], car_type,
+                price=data.get('price_birr'), year=parse_year(data['year'])
             )
-            logger.info(f"📤 {car_type} text ad posted")
+            alert_users = sorted({alert.user_id for alert in matches} - {message.from_user.id})
+            if alert_users:
+                await enqueue(db, 'alert_match', {
+                    'car_id': car_id,
+                    'text': templates.alert_match(data),
+                    'user_ids': alert_users
+                }, car_id=car_id)
         
-        # UPDATED: Thank you message with new contact info
-        thank_you_msg = f"""🎉 *Thank you for using Addis Car Hub!* 🚗
-
-✅ Your {data['make']} {data['model']} has been posted on @AddisCarHub channel.
-
-*What happens next?*
-1. Our agents verify the details
-2. Interested {'buyers' if car_type == 'sale' else 'renters'} contact us
-3. We connect you with serious interested parties
-4. We assist with negotiation and paperwork
-
-*Your privacy is protected:*
-• Your phone number is confidential
-• All communications go through us
-• We verify all parties
-
-*Commission:* { '2% of sale price' if car_type == 'sale' else '10% of rental price' }
-
-*Share with friends and family:*
-🤖 Bot: @AddisCarHubBot
-📢 Channel: @AddisCarHub
-
-*Need help?* Contact our agents:
-• Agent #1 - 0911564697
-• Agent #2 - 0913550415
-• Hotline - 5555 (Coming Soon)
-
-Thank you for trusting Addis Car Hub! 🙏"""
+        # Committed: the outbox workers post to the channel and notify admins
+        outbox.notify()
+        publish("outbox")
+        logger.info(f"💾 {car_type.capitalize()} ad #{car_id} saved: {data['make']} {data['model']} by user {message.from_user.id}")
         
         await message.answer(
-            thank_you_msg,
+            templates.thank_you(car_type, data['make'], data['model'], car_id),
             parse_mode="Markdown",
-            reply_markup=ReplyKeyboardMarkup(
-                keyboard=[[KeyboardButton(text="/start")]],
-                resize_keyboard=True
-            )
+            reply_markup=START_ONLY_KEYBOARD
         )
         
     except Exception as e:
@@ -1372,65 +1145,333 @@ Thank you for trusting Addis Car Hub! 🙏"""
     await state.clear()
 
 # Stats command - UPDATED WITH NEW PHONE NUMBERS
-@dp.message(F.text == "📊 My Statistics")
-@dp.message(Command("stats"))
+@router.message(F.text == "📊 My Statistics", flags={"throttling": "stats"})
+@router.message(Command("stats"), flags={"throttling": "stats"})
 async def stats_command(message: types.Message):
     try:
-        async with aiosqlite.connect(DB_PATH) as db:
+        # Counters are maintained by process_ad, so this is two primary-key lookups
+        user_info = await database.fetchone(
+            '''SELECT u.ads_posted, u.registered_at,
+                      (SELECT value FROM counters WHERE name = 'total_ads')
+               FROM users u WHERE u.user_id = ?''',
+            (message.from_user.id,)
+        )
+        
+        if user_info:
+            stats_msg = templates.stats(user_info[0], user_info[2] or 0, user_info[1])
+        else:
+            stats_msg = templates.no_stats
+        
+        await message.answer(stats_msg, parse_mode="Markdown")
+    except Exception as e:
+        logger.error(f"Error in stats_command: {e}")
+        await message.answer("Error retrieving statistics. Please try again later.")
+
+# ====================
+# LISTING SEARCH
+# ====================
+
+# Query text behind each "next page" button (callback data is capped at 64 bytes)
+search_sessions = SearchSessions()
+
+def search_page_keyboard(token, rows, has_more):
+    if not has_more:
+        return None
+    last = rows[-1]
+    return types.InlineKeyboardMarkup(inline_keyboard=[[
+        types.InlineKeyboardButton(
+            text="➡️ Next page",
+            callback_data=encode_cursor(token, last[-1], last[0])
+        )
+    ]])
+
+@router.message(Command("search"), flags={"throttling": "search"})
+async def search_command(message: types.Message, command: CommandObject):
+    try:
+        query = (command.args or "").strip()
+        fts_query = build_fts_query(query)
+        if not fts_query:
+            await message.answer(templates.search_usage, parse_mode="Markdown")
+            return
+        
+        rows, has_more = await search_cars(database, fts_query)
+        if not rows:
+            await message.answer(templates.search_empty)
+            return
+        
+        token = search_sessions.add(query, fts_query)
+        await message.answer(
+            templates.search_results(query, rows),
+            reply_markup=search_page_keyboard(token, rows, has_more)
+        )
+    except Exception as e:
+        logger.error(f"Error in search_command: {e}")
+        await message.answer("Error while searching. Please try again later.")
+
+@router.callback_query(F.data.startswith("search:"), flags={"throttling": "search"})
+async def search_next_page(callback: types.CallbackQuery):
+    try:
+        cursor = decode_cursor(callback.data)
+        session = search_sessions.get(cursor[0]) if cursor else None
+        if not session:
+            await callback.answer("This search has expired. Please run /search again.", show_alert=True)
+            return
+        
+        token, last_rank, last_id = cursor
+        query, fts_query = session
+        rows, has_more = await search_cars(database, fts_query, after=(last_rank, last_id))
+        if not rows:
+            await callback.answer("No more results.")
+            return
+        
+        await callback.message.answer(
+            templates.search_results(query, rows),
+            reply_markup=search_page_keyboard(token, rows, has_more)
+        )
+        await callback.answer()
+    except Exception as e:
+        logger.error(f"Error in search_next_page: {e}")
+        await callback.answer("Error while searching. Please try again.")
+
+# ====================
+# SAVED-SEARCH ALERTS
+# ====================
+
+@router.message(Command("alert"), flags={"throttling": "search"})
+async def alert_command(message: types.Message, command: CommandObject):
+    try:
+        query = " ".join((command.args or "").split())[:200]
+        try:
+            fields = parse_alert(query)
+        except ValueError as e:
+            await message.answer(f"❌ {e}\n\n{templates.alert_usage}", parse_mode="Markdown")
+            return
+        if not fields:
+            await message.answer(templates.alert_usage, parse_mode="Markdown")
+            return
+        
+        async with database.writer() as db:
             cursor = await db.execute(
-                "SELECT COUNT(*) FROM cars WHERE user_id = ?",
+                "SELECT COUNT(*) FROM saved_searches WHERE user_id = ?",
                 (message.from_user.id,)
             )
-            user_ads = await cursor.fetchone()
-            
-            cursor = await db.execute("SELECT COUNT(*) FROM cars")
-            total_ads = await cursor.fetchone()
-            
+            (count,) = await cursor.fetchone()
+            if count >= config.max_alerts_per_user:
+                alert = None
+            else:
+                alert = await save_alert(db, message.from_user.id, query, fields)
+        
+        if alert is None:
+            await message.answer(templates.alert_limit(config.max_alerts_per_user))
+            return
+        
+        alert_index.add(alert)
+        publish(f"alert:{alert.id}")
+        logger.info(f"🔔 Alert #{alert.id} saved by user {message.from_user.id}: {query}")
+        # Echo what was understood, so a misread alert is caught right away
+        unknown_make = fields["make"] if fields["make"] and not known_make(fields["make"]) else None
+        await message.answer(templates.alert_saved(alert.id, describe_alert(fields), unknown_make))
+    except Exception as e:
+        logger.error(f"Error in alert_command: {e}")
+        await message.answer("Error while saving the alert. Please try again later.")
+
+@router.message(Command("alerts"), flags={"throttling": "search"})
+async def alerts_command(message: types.Message):
+    try:
+        rows = await database.fetchall(
+            "SELECT id, query FROM saved_searches WHERE user_id = ? ORDER BY id",
+            (message.from_user.id,)
+        )
+        if not rows:
+            await message.answer(templates.alert_list_empty)
+            return
+        await message.answer(templates.alert_list(rows))
+    except Exception as e:
+        logger.error(f"Error in alerts_command: {e}")
+        await message.answer("Error retrieving alerts. Please try again later.")
+
+@router.message(Command("unalert"), flags={"throttling": "search"})
+async def unalert_command(message: types.Message, command: CommandObject):
+    try:
+        arg = (command.args or "").strip().lstrip("#")
+        if not arg.isdigit():
+            await message.answer("Send /unalert followed by the alert number from /alerts.")
+            return
+        
+        async with database.writer() as db:
             cursor = await db.execute(
-                "SELECT registered_at FROM users WHERE user_id = ?",
-                (message.from_user.id,)
+                "DELETE FROM saved_searches WHERE id = ? AND user_id = ?",
+                (int(arg), message.from_user.id)
             )
-            user_info = await cursor.fetchone()
+            deleted = cursor.rowcount
         
-        if user_info:
-            # UPDATED: Changed broker info to agent info with new numbers
-            stats_msg = f"""📊 *Your Statistics*
+        if not deleted:
+            await message.answer(f"Alert #{arg} was not found. Use /alerts to see yours.")
+            return
+        alert_index.remove(int(arg))
+        publish(f"alert:{int(arg)}")
+        await message.answer(f"🔕 Alert #{arg} removed.")
+    except Exception as e:
+        logger.error(f"Error in unalert_command: {e}")
+        await message.answer("Error while removing the alert. Please try again later.")
 
-• Ads posted: {user_ads[0]}
-• Total ads in system: {total_ads[0]}
-• Member since: {user_info[0][:10] if user_info[0] else 'today'}
+# ====================
+# AD STATUS UPDATES (seller or admin)
+# ====================
+# The change is saved and a 'channel_edit' outbox row queued in one
+# transaction; the outbox then edits the existing channel post instead of
+# posting a new one. Edit rows carry no car_id, so an ad can be edited any
+# number of times; each edit renders the ad's current state.
 
-*Contact Information:*
-• Channel: {ADMIN_CHANNEL}
-• Agent #1: 0911564697
-• Agent #2: 0913550415
-• Hotline: 5555 (Coming Soon)
+async def check_ad_for_update(db, user_id, car_id):
+    """Fetch a live ad `user_id` may change, inside the writer transaction.
 
-Keep posting! Every ad increases your sales/rental chances."""
-        else:
-            stats_msg = "You haven't posted any ads yet. To start, use 🚗 Car for Sale or 🏢 Car for Rental!"
+    Returns (ad, None), or (None, reason) when the ad is missing, not
+    theirs or already closed.
+    """
+    cursor = await db.execute(
+        "SELECT user_id, car_type, status, price, price_birr, price_period FROM cars WHERE id = ?",
+        (car_id,)
+    )
+    ad = await cursor.fetchone()
+    if ad is None or (ad[0] != user_id and user_id not in config.admin_ids):
+        return None, f"Ad #{car_id} was not found among your ads."
+    if ad[2] != LIVE_STATUS:
+        return None, f"Ad #{car_id} is already {ad[2]}."
+    return ad, None
+
+def channel_edit_queued(car_id, user_id, change):
+    # Committed: wake the outbox (in the receiver, too, in multi-process mode)
+    outbox.notify()
+    publish("outbox")
+    logger.info(f"✏️ Ad #{car_id} {change} by user {user_id}")
+
+@router.message(Command("sold", "rented"), flags={"throttling": "stats"})
+async def close_ad_command(message: types.Message, command: CommandObject):
+    try:
+        status = command.command.lower()
+        arg = (command.args or "").strip().lstrip("#")
+        if not arg.isdigit():
+            await message.answer(templates.ad_update_usage, parse_mode="Markdown")
+            return
+        car_id = int(arg)
         
-        await message.answer(stats_msg, parse_mode="Markdown")
+        # Replies are sent after the transaction, never while holding the writer
+        async with database.writer() as db:
+            ad, problem = await check_ad_for_update(db, message.from_user.id, car_id)
+            if ad is not None and CLOSED_STATUS.get(ad[1]) != status:
+                problem = f"Ad #{car_id} is a {ad[1]} ad; use /{CLOSED_STATUS.get(ad[1], 'sold')} instead."
+            if problem is None:
+                await set_status(db, car_id, status)
+                await enqueue(db, 'channel_edit', {'car_id': car_id})
+        
+        if problem:
+            await message.answer(problem)
+            return
+        channel_edit_queued(car_id, message.from_user.id, f"marked {status}")
+        await message.answer(f"✅ Ad #{car_id} marked as {status}. The channel post will show it shortly.")
     except Exception as e:
-        logger.error(f"Error in stats_command: {e}")
-        await message.answer("Error retrieving statistics. Please try again later.")
+        logger.error(f"Error in close_ad_command: {e}")
+        await message.answer("Error while updating the ad. Please try again later.")
+
+@router.message(Command("price"), flags={"throttling": "stats"})
+async def price_command(message: types.Message, command: CommandObject):
+    try:
+        args = (command.args or "").split(maxsplit=1)
+        if len(args) != 2 or not args[0].lstrip("#").isdigit():
+            await message.answer(templates.ad_update_usage, parse_mode="Markdown")
+            return
+        car_id, price_text = int(args[0].lstrip("#")), args[1].strip()[:50]
+        
+        async with database.writer() as db:
+            ad, problem = await check_ad_for_update(db, message.from_user.id, car_id)
+            if ad is not None:
+                _, car_type, _, old_price, old_birr, old_period = ad
+                parsed = parse_listing_price(price_text, car_type)
+                if parsed is None:
+                    example = "2,000 (per day)" if car_type == 'rental' else "1,650,000"
+                    problem = f"❌ Please enter the new price in Birr (Example: /price {car_id} {example})"
+                else:
+                    price_birr, price_currency, price_period = price_columns(parsed)
+                    # Only drops are announced on the channel; a higher price needs a new ad
+                    if old_birr is not None and (price_period != old_period or price_birr >= old_birr):
+                        problem = f"❌ The new price must be lower than the current {old_price} Birr."
+            if problem is None:
+                await db.execute(
+                    '''UPDATE cars SET price = ?, price_birr = ?, price_currency = ?, price_period = ?
+                    WHERE id = ?''',
+                    (price_text, price_birr, price_currency, price_period, car_id)
+                )
+                await enqueue(db, 'channel_edit', {'car_id': car_id})
+        
+        if problem:
+            await message.answer(problem)
+            return
+        channel_edit_queued(car_id, message.from_user.id, f"price {old_price} -> {price_text}")
+        await message.answer(f"✅ Ad #{car_id} now lists {price_text} Birr. The channel post will show the drop shortly.")
+    except Exception as e:
+        logger.error(f"Error in price_command: {e}")
+        await message.answer("Error while updating the price. Please try again later.")
+
+# ====================
+# ADMIN EXPORT
+# ====================
+
+# One export at a time: each one reads the whole cars table
+export_lock = asyncio.Lock()
+
+@router.message(Command("export"), flags={"throttling": "stats"})
+async def export_command(message: types.Message, command: CommandObject):
+    try:
+        if message.from_user.id not in config.admin_ids:
+            await message.answer("This command is only available to admins.")
+            return
+        try:
+            filters = parse_export_args(command.args)
+        except ValueError as e:
+            await message.answer(f"⚠️ {e}\n\n{templates.export_usage}")
+            return
+        if export_lock.locked():
+            await message.answer("⏳ Another export is running. Please try again in a minute.")
+            return
+        
+        async with export_lock:
+            await message.answer(f"⏳ Exporting {describe_filters(filters)}...")
+            started = time.perf_counter()
+            path, count = await write_export(database, filters)
+            try:
+                size = os.path.getsize(path)
+                if size > MAX_UPLOAD_BYTES:
+                    await message.answer(
+                        f"⚠️ The export is {size / 1024 / 1024:.0f} MB, over Telegram's 50 MB limit. "
+                        "Please narrow it with from= and to= dates."
+                    )
+                    return
+                await bot.send_document(
+                    chat_id=message.chat.id,
+                    document=types.FSInputFile(path, filename=export_filename(filters)),
+                    caption=f"📤 {count} ad(s), {describe_filters(filters)}",
+                    request_timeout=300
+                )
+            finally:
+                os.remove(path)
+        logger.info(
+            f"📤 Admin {message.from_user.id} exported {count} ads "
+            f"({size / 1024:.0f} KB) in {time.perf_counter() - started:.1f}s"
+        )
+    except Exception as e:
+        logger.error(f"Error in export_command: {e}")
+        await message.answer("Error while exporting. Please try again later.")
 
 # Cancel command - UPDATED BUTTON TEXT
-@dp.message(Command("cancel"))
+@router.message(Command("cancel"))
 async def cancel_command(message: types.Message, state: FSMContext):
     try:
         await state.clear()
         await message.answer(
             "❌ Operation cancelled.\n\n"
             "To start again, send /start or choose from the options below.",
-            reply_markup=ReplyKeyboardMarkup(
-                keyboard=[
-                    [KeyboardButton(text="🚗 Car for Sale"), 
-                     KeyboardButton(text="🏢 Car for Rental")],
-                    [KeyboardButton(text="📞 Contact Agents")]  # UPDATED: Changed from "Contact Brokers"
-                ],
-                resize_keyboard=True
-            )
+            reply_markup=CANCEL_MENU_KEYBOARD
         )
     except Exception as e:
         logger.error(f"Error in cancel_command: {e}")
@@ -1439,7 +1480,7 @@ async def cancel_command(message: types.Message, state: FSMContext):
 # ERROR HANDLER
 # ====================
 
-@dp.errors()
+@router.errors()
 async def error_handler(event: types.ErrorEvent):
     logger.error(f"Unhandled error: {event.exception}", exc_info=True)
     try:
@@ -1453,50 +1494,311 @@ async def error_handler(event: types.ErrorEvent):
 # START BOT WITH ENHANCED ERROR HANDLING
 # ====================
 
+@router.startup()
+async def on_startup():
+    # In polling mode the dispatcher asks for its first updates right after this
+    if config.bot_mode == "polling":
+        mark_ready()
+
+@router.shutdown()
+async def on_shutdown():
+    # Let in-flight outbox rows and queued sends finish before the bot
+    # session is closed; anything left is picked up again on next start
+    await outbox.stop()
+    await send_scheduler.close()
+    await fsm_storage.close()
+
+def create_app(app_config):
+    """Build the bot, dispatcher, database pool and outbox from `app_config`.
+
+    Nothing is connected or started here; run_bot() opens the database and
+    starts the workers. Call it once per process, since the handler router
+    can only be attached to one dispatcher.
+    """
+    global config, templates, database, fsm_storage, bot, dp
+    global send_scheduler, throttling, outbox, alert_index, archiver
+    started = time.perf_counter()
+    config = app_config
+    
+    # Messages are compiled once here; handlers only fill in per-request fields
+    templates = Templates(config.broker_name, config.broker_phones, config.admin_channel)
+    
+    # Shared connection pool, opened in run_bot and closed on shutdown
+    database = Database(
+        config.db_path, readers=config.db_readers, observe=observe_query,
+        cache_mb=config.db_cache_mb, mmap_mb=config.db_mmap_mb,
+        commit_window=config.db_commit_window_ms / 1000
+    )
+    # Half-filled CarForm drafts are kept in SQLite and evicted after fsm_ttl_hours
+    fsm_storage = SQLiteStorage(database, ttl=int(config.fsm_ttl_hours * 3600))
+    
+    bot = Bot(token=config.bot_token)
+    dp = Dispatcher(storage=fsm_storage)
+    
+    # Sampled per-update DEBUG logging (only active at LOG_LEVEL=DEBUG)
+    dp.update.outer_middleware(UpdateSamplingMiddleware(config.log_sample_rate))
+    
+    # Deliver each photo album to handlers as a single call
+    dp.message.outer_middleware(AlbumMiddleware())
+    
+    # Handler latency by FSM state, exported on /metrics
+    dp.message.middleware(HandlerMetricsMiddleware("message"))
+    dp.callback_query.middleware(HandlerMetricsMiddleware("callback_query"))
+    
+    # Per-user flood limits, applied once the handler (and its class) is known
+    throttling = ThrottlingMiddleware(config.throttle_limits, exempt=config.admin_ids)
+    dp.message.middleware(throttling)
+    dp.callback_query.middleware(throttling)
+    
+    # Every send/edit goes through one rate-limited queue (see sender.py). With
+    # several processes each gets an equal share of the global limit.
+    processes = config.workers + 1 if config.workers > 1 else 1
+    send_scheduler = SendScheduler(global_rate=30 / processes)
+    bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    # Registered after the scheduler, so it times the HTTP call, not the queue
+    bot.session.middleware(APIMetricsMiddleware())
+    
+    dp.include_router(router)
+    outbox = OutboxWorker(database, OUTBOX_HANDLERS, workers=config.outbox_workers)
+    # Saved searches, loaded from the database in run_bot and matched in process_ad
+    alert_index = AlertIndex()
+    archiver = AdArchiver(database, config.ad_expiry_days, interval=config.archive_interval_minutes * 60)
+    
+    startup_timings["build"] = round((time.perf_counter() - started) * 1000, 1)
+    logger.info("✅ Bot and Dispatcher initialized successfully")
+    return dp
+
+def mark_ready():
+    """Record and log the time from process start to receiving updates"""
+    startup_timings["ready"] = round((time.perf_counter() - _import_started) * 1000, 1)
+    phases = ", ".join(f"{name} {ms:.0f} ms" for name, ms in startup_timings.items() if name != "ready")
+    logger.info(f"🚀 Ready in {startup_timings['ready']:.0f} ms ({phases})")
+
+REGISTRY.gauge("bot_send_queue_depth", "Bot API sends waiting in the scheduler", lambda: send_scheduler.queue_depth)
+REGISTRY.gauge("bot_throttled_updates", "Updates dropped by per-user throttling", lambda: throttling.throttled)
+REGISTRY.gauge("bot_saved_search_alerts", "Saved searches in the alert index", lambda: len(alert_index))
+REGISTRY.gauge("bot_ads_archived", "Ads moved to cars_archive since start", lambda: archiver.archived)
+REGISTRY.gauge("bot_startup_ready_seconds", "Time from process start until updates were received",
+               lambda: startup_timings.get("ready", 0) / 1000)
+
+def health_info():
+    info = {
+        "send_queue": send_scheduler.stats(),
+        "throttling": throttling.stats(),
+        "database": database.stats(),
+        "archive": archiver.stats(),
+        "log_records_dropped": dropped_records(),
+        "startup_ms": startup_timings,
+    }
+    if supervisor is not None:
+        info["workers"] = supervisor.stats()
+    return info
+
+def metrics_text():
+    # In multi-process mode the workers' handler and API metrics are added in
+    return REGISTRY.render(supervisor.metric_snapshots() if supervisor else ())
+
+def handle_stop_signals(stop):
+    """Call `stop()` on SIGTERM or SIGINT so the process shuts down cleanly.
+
+    A second signal while shutting down falls back to the default action.
+    """
+    loop = asyncio.get_running_loop()
+    signals = (signal.SIGTERM, signal.SIGINT)
+
+    def on_signal(sig):
+        logger.info(f"🛑 Received {sig.name}, shutting down...")
+        for s in signals:
+            loop.remove_signal_handler(s)
+        stop()
+
+    for sig in signals:
+        loop.add_signal_handler(sig, on_signal, sig)
+
+async def run_webhook(app):
+    """Receive updates on config.webhook_path of the shared aiohttp server"""
+    await bot.set_webhook(
+        url=f"{config.webhook_url}{config.webhook_path}",
+        secret_token=config.webhook_secret or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        drop_pending_updates=config.drop_pending_updates
+    )
+    logger.info(f"🤖 Webhook set to {config.webhook_url}{config.webhook_path}")
+    mark_ready()
+    
+    # The aiohttp site serves updates on this loop until we are cancelled
+    await asyncio.Event().wait()
+
+async def run_polling():
+    try:
+        await bot.delete_webhook(drop_pending_updates=config.drop_pending_updates)
+        logger.info("Webhook deleted successfully")
+    except Exception as e:
+        logger.warning(f"Could not delete webhook: {e}")
+    
+    logger.info("🤖 Bot has started polling...")
+    
+    if supervisor is not None:
+        # Receiver: hand raw updates to the workers without parsing them here
+        mark_ready()
+        await poll_updates(
+            bot.session.api.api_url(token=bot.token, method="getUpdates"),
+            supervisor.dispatch,
+            allowed_updates=dp.resolve_used_update_types()
+        )
+    else:
+        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+
 async def run_bot():
+    """Open the database, start the workers and serve updates (after create_app).
+
+    Returns 1 if the bot stopped on an error, so main() can exit non-zero.
+    """
+    global supervisor
+    runner = None
+    backfills = None
+    # In polling mode aiogram installs its own handlers, which stop polling
+    handle_stop_signals(asyncio.current_task().cancel)
     try:
         logger.info("Initializing database...")
+        started = time.perf_counter()
+        await database.open()
         await init_db()
+        # Row backfills run in small batches alongside normal traffic
+        backfills = asyncio.create_task(run_backfills(database))
+        if config.workers <= 1:
+            # With several processes the workers match alerts, not the receiver
+            logger.info(f"🔔 Loaded {await alert_index.load(database)} saved-search alerts")
+        startup_timings["database"] = round((time.perf_counter() - started) * 1000, 1)
+        fsm_storage.start()
+        # In multi-process mode only the receiver runs the outbox, so channel
+        # posts keep to one process's rate limits; the archiver likewise
+        outbox.start()
+        archiver.start()
         
-        try:
-            await bot.delete_webhook(drop_pending_updates=True)
-            logger.info("Webhook deleted successfully")
-        except Exception as e:
-            logger.warning(f"Could not delete webhook: {e}")
+        if config.workers > 1:
+            supervisor = Supervisor(
+                config.workers, worker_command(os.path.abspath(__file__)), config,
+                on_event=on_cluster_event
+            )
+            await supervisor.start()
         
-        logger.info("🤖 Bot has started polling...")
-        print("🤖 Bot has started polling...")
-        print("✅ All systems are ready!")
+        # One aiohttp server on the bot's loop serves /, /health and, in
+        # webhook mode, the Telegram updates themselves
+        app = create_web_app(health_info=health_info, metrics_text=metrics_text)
+        if config.bot_mode == "webhook" and supervisor is not None:
+            app.router.add_post(
+                config.webhook_path,
+                webhook_receiver(supervisor.dispatch, secret=config.webhook_secret or None)
+            )
+        elif config.bot_mode == "webhook":
+            # Only webhook deployments need aiogram's aiohttp integration
+            from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+            # Dispatcher shutdown must run before the handler closes the session
+            setup_application(app, dp, bot=bot)
+            SimpleRequestHandler(
+                dispatcher=dp,
+                bot=bot,
+                secret_token=config.webhook_secret or None
+            ).register(app, path=config.webhook_path)
+        runner = await start_web_server(app, config.port)
         
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if config.bot_mode == "webhook":
+            await run_webhook(app)
+        else:
+            await run_polling()
         
+    except asyncio.CancelledError:
+        # Our own stop signal: clear it so the awaits below (some of which use
+        # timeouts) run normally
+        asyncio.current_task().uncancel()
     except Exception as e:
         logger.error(f"Fatal error in run_bot: {e}", exc_info=True)
-        print(f"❌ Fatal error: {e}")
+        return 1
+    finally:
+        if runner:
+            await runner.cleanup()
+        if supervisor is not None:
+            await supervisor.stop()
+            # The dispatcher never ran here, so its shutdown hook did not either
+            await on_shutdown()
+            await bot.session.close()
+        await archiver.stop()
+        if backfills and not backfills.done():
+            backfills.cancel()
+            await asyncio.gather(backfills, return_exceptions=True)
+        await database.close()
+
+async def run_worker(index, socket_path):
+    """Worker process: handle the updates the receiver routes to it"""
+    global worker_link
+    worker_link = WorkerLink(socket_path, index)
+    app_config = Config(**await worker_link.connect())
+    # Workers write their own log file; rotating one file from several
+    # processes is not safe
+    root, ext = os.path.splitext(app_config.log_file)
+    configure_logging(app_config, log_file=f"{root}.worker{index}{ext}" if app_config.log_file else None)
+    create_app(app_config)
+    # Finish the updates already started and flush drafts before exiting;
+    # the receiver gives the rest to this worker's replacement
+    handle_stop_signals(worker_link.stop)
+    try:
+        await database.open()
+        await alert_index.load(database)
+        fsm_storage.start()
+        logger.info(f"✅ Worker {index} ready (pid {os.getpid()})")
+        await worker_link.serve(
+            lambda update: dp.feed_raw_update(bot, update),
+            on_event=on_cluster_event,
+            health=lambda: {"send_queue_depth": send_scheduler.queue_depth, "throttled": throttling.throttled},
+            metrics=REGISTRY.snapshot
+        )
+    finally:
+        await send_scheduler.close()
+        await fsm_storage.close()
+        await bot.session.close()
+        await database.close()
+
+def configure_logging(app_config, log_file):
+    # Records go through a queue to a listener thread that writes stdout and a
+    # rotating, gzip-compressed log file (see logging_setup.py)
+    setup_logging(
+        level=app_config.log_level,
+        log_file=log_file,
+        json_format=app_config.log_format == "json",
+        max_bytes=app_config.log_max_bytes,
+        backup_count=app_config.log_backup_count,
+        rotate_seconds=app_config.log_rotate_hours * 3600
+    )
 
 def main():
-    # Start Flask in a separate thread
-    flask_thread = threading.Thread(target=run_flask, daemon=True)
-    flask_thread.start()
-    logger.info("Flask server thread started")
+    parser = argparse.ArgumentParser(description="Addis Car Hub bot")
+    # Set by the receiver when it starts worker processes (WORKERS > 1)
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--socket", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker is not None:
+        asyncio.run(run_worker(args.worker, args.socket))
+        return
+    
+    app_config = Config.from_env()
+    configure_logging(app_config, log_file=app_config.log_file)
+    log_banner(app_config)
+    try:
+        app_config.validate()
+    except ConfigError as e:
+        logger.error(f"❌ Critical Error: {e}")
+        sys.exit(1)
     
-    # Run the bot
-    asyncio.run(run_bot())
+    create_app(app_config)
+    # The bot and the web server share a single event loop
+    sys.exit(asyncio.run(run_bot()))
 
 if __name__ == "__main__":
-    logger.info("="*60)
-    logger.info("🚗 Addis Ababa Car Hub Bot - Starting")
-    logger.info("="*60)
-    
-    print("="*60)
-    print("🚗 Addis Ababa Car Hub Bot - Starting")
-    print("="*60)
-    
     try:
         main()
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
-        print("\n👋 Bot stopped")
     except Exception as e:
         logger.error(f"Main function error: {e}", exc_info=True)
-        print(f"❌ Main function error: {e}")
+        sys.exit(1)
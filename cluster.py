@@ -0,0 +1,448 @@
+import asyncio
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import asdict
+
+import aiohttp
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# ====================
+# MULTI-PROCESS DISPATCH
+# ====================
+# One receiver process takes updates from Telegram (polling or webhook) and
+# routes each one by chat id to one of N worker processes over a Unix socket,
+# as newline-delimited JSON. A chat always lands on the same worker, and the
+# worker runs a chat's updates one after another, so wizard steps stay in
+# order. Workers share the SQLite database (FSM drafts, ads, outbox); the
+# few in-memory caches that must agree across processes are refreshed via
+# events relayed by the receiver.
+#
+# receiver -> worker: {"op": "config"}, {"op": "update"}, {"op": "event"}, {"op": "stop"}
+# worker -> receiver: {"op": "hello"}, {"op": "done"}, {"op": "heartbeat"}, {"op": "event"}
+
+
+def _encode(message):
+    return (json.dumps(message, ensure_ascii=False, separators=(",", ":")) + "\n").encode()
+
+
+def _update_message(update):
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if field in update:
+            return update[field]
+    callback = update.get("callback_query")
+    if callback:
+        return callback.get("message")
+    return None
+
+
+def update_chat_id(update):
+    """Chat an update belongs to (the user's id for chat-less updates), or None"""
+    message = _update_message(update)
+    if message and "chat" in message:
+        return message["chat"]["id"]
+    for event in update.values():
+        if isinstance(event, dict) and "from" in event:
+            return event["from"]["id"]
+    return None
+
+
+def media_group_id(update):
+    message = _update_message(update)
+    return message.get("media_group_id") if message else None
+
+
+def partition(update, workers):
+    """Worker index for an update; the same chat always maps to the same worker"""
+    key = update_chat_id(update)
+    if key is None:
+        key = update["update_id"]
+    return key % workers
+
+
+class _Worker:
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.writer = None
+        self.started_at = 0.0
+        self.last_seen = 0.0
+        self.restarts = 0
+        self.failures = 0
+        self.dispatched = 0
+        # update_id -> encoded line, kept until the worker reports it done
+        self.inflight = OrderedDict()
+        self.health = {}
+        self.metrics = {}
+
+
+class Supervisor:
+    """Receiver side: start `workers` processes, route updates to them and
+    restart any that exit or stop sending heartbeats.
+
+    Updates are held in memory until their worker acknowledges them, so
+    the ones a crashed worker had not finished are sent again to its
+    replacement (handlers may therefore see an update twice after a crash).
+    This is best-effort: Telegram already counts them as delivered, so the
+    updates still unacknowledged when stop() gives up, or when the receiver
+    itself dies, are lost.
+    """
+
+    def __init__(
+        self, workers, command, config, on_event=None,
+        heartbeat_timeout=30.0, max_backoff=30.0, max_inflight=1000
+    ):
+        self.command = command
+        self.config = config
+        self.on_event = on_event
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_backoff = max_backoff
+        self.max_inflight = max_inflight
+        self._workers = [_Worker(i) for i in range(workers)]
+        self._socket_dir = None
+        self._server = None
+        self._tasks = []
+        self._stopping = False
+        self.dispatched = 0
+
+    @property
+    def socket_path(self):
+        return os.path.join(self._socket_dir, "workers.sock")
+
+    async def start(self):
+        self._socket_dir = tempfile.mkdtemp(prefix="carbot-")
+        self._server = await asyncio.start_unix_server(
+            self._serve, path=self.socket_path, limit=2 ** 24
+        )
+        self._tasks = [asyncio.create_task(self._supervise(w)) for w in self._workers]
+        self._tasks.append(asyncio.create_task(self._watchdog()))
+        logger.info(f"✅ Started {len(self._workers)} update workers")
+
+    async def stop(self, timeout=15.0, drain_timeout=15.0):
+        """Wait for the workers to acknowledge their updates, then ask them to exit.
+
+        Call once no more updates are dispatched. Workers that crash while
+        draining are still restarted and given their updates again.
+        """
+        deadline = time.monotonic() + drain_timeout
+        waiting = sum(len(w.inflight) for w in self._workers)
+        if waiting:
+            logger.info(f"Waiting for {waiting} unfinished update(s)...")
+        while any(w.inflight for w in self._workers) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        self._stopping = True
+        for worker in self._workers:
+            self._write(worker, {"op": "stop"})
+        processes = [w.process for w in self._workers if w.process and w.process.returncode is None]
+        if processes:
+            await asyncio.wait([asyncio.create_task(p.wait()) for p in processes], timeout=timeout)
+            for process in processes:
+                if process.returncode is None:
+                    process.kill()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._server.close()
+        await self._server.wait_closed()
+        shutil.rmtree(self._socket_dir, ignore_errors=True)
+        lost = sum(len(w.inflight) for w in self._workers)
+        if lost:
+            logger.warning(f"⚠️ {lost} update(s) were not processed before shutdown")
+        logger.info("Update workers stopped")
+
+    def dispatch(self, update):
+        """Route one raw update (a dict as sent by Telegram) to its worker"""
+        worker = self._workers[partition(update, len(self._workers))]
+        line = _encode({"op": "update", "update": update})
+        worker.inflight[update["update_id"]] = line
+        worker.dispatched += 1
+        self.dispatched += 1
+        if len(worker.inflight) == self.max_inflight:
+            logger.warning(f"⚠️ Worker {worker.index} has {self.max_inflight} unfinished updates")
+        if worker.writer is not None:
+            worker.writer.write(line)
+
+    def broadcast(self, name, exclude=None):
+        for worker in self._workers:
+            if worker.index != exclude:
+                self._write(worker, {"op": "event", "name": name})
+
+    def _write(self, worker, message):
+        if worker.writer is not None and not worker.writer.is_closing():
+            worker.writer.write(_encode(message))
+
+    async def _supervise(self, worker):
+        """Keep one worker process running, restarting it with backoff"""
+        while not self._stopping:
+            worker.started_at = worker.last_seen = time.monotonic()
+            worker.process = await asyncio.create_subprocess_exec(
+                *self.command(worker.index, self.socket_path),
+                # Ctrl-C goes to the receiver, which stops the workers itself
+                start_new_session=True
+            )
+            code = await worker.process.wait()
+            worker.writer = None
+            if self._stopping:
+                return
+            # Quick repeated crashes back off; a worker that ran for a while restarts at once
+            if time.monotonic() - worker.started_at < 60:
+                worker.failures += 1
+            else:
+                worker.failures = 0
+            delay = min(self.max_backoff, 2 ** worker.failures - 1)
+            worker.restarts += 1
+            logger.error(
+                f"❌ Worker {worker.index} exited with code {code}; restarting in {delay}s "
+                f"({len(worker.inflight)} update(s) will be redelivered)"
+            )
+            await asyncio.sleep(delay)
+
+    async def _watchdog(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_timeout / 3)
+            now = time.monotonic()
+            for worker in self._workers:
+                process = worker.process
+                if process is None or process.returncode is not None:
+                    continue
+                if now - worker.last_seen > self.heartbeat_timeout:
+                    logger.error(
+                        f"❌ Worker {worker.index} silent for {now - worker.last_seen:.0f}s, killing it"
+                    )
+                    process.kill()
+
+    async def _serve(self, reader, writer):
+        worker = None
+        try:
+            hello = json.loads(await reader.readline())
+            worker = self._workers[hello["worker"]]
+            worker.writer = writer
+            worker.last_seen = time.monotonic()
+            writer.write(_encode({"op": "config", "config": asdict(self.config)}))
+            for line in worker.inflight.values():
+                writer.write(line)
+            logger.info(f"🔗 Worker {worker.index} connected (pid {hello.get('pid')})")
+
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                worker.last_seen = time.monotonic()
+                op = message.get("op")
+                if op == "done":
+                    worker.inflight.pop(message["update_id"], None)
+                elif op == "heartbeat":
+                    worker.health = message.get("health", {})
+                    worker.metrics = message.get("metrics", {})
+                elif op == "event":
+                    self.broadcast(message["name"], exclude=worker.index)
+                    if self.on_event:
+                        self.on_event(message["name"])
+        except Exception as e:
+            logger.error(f"❌ Worker connection error: {e}")
+        finally:
+            if worker is not None and worker.writer is writer:
+                worker.writer = None
+            writer.close()
+
+    def metric_snapshots(self):
+        return [w.metrics for w in self._workers if w.metrics]
+
+    def stats(self):
+        now = time.monotonic()
+        return [
+            {
+                "worker": w.index,
+                "pid": w.process.pid if w.process else None,
+                "alive": bool(w.process and w.process.returncode is None and w.writer is not None),
+                "restarts": w.restarts,
+                "updates": w.dispatched,
+                "unfinished_updates": len(w.inflight),
+                "last_seen_seconds": round(now - w.last_seen, 1),
+                **w.health,
+            }
+            for w in self._workers
+        ]
+
+
+class _Tail:
+    """The updates of a chat that later updates of that chat must wait for"""
+
+    __slots__ = ("group", "after", "tasks")
+
+    def __init__(self, group, after):
+        self.group = group
+        self.after = after
+        self.tasks = []
+
+
+class WorkerLink:
+    """Worker side of the receiver connection.
+
+    Updates of one chat are handled strictly one after another; parts of
+    the same album run side by side so AlbumMiddleware can merge them.
+    """
+
+    def __init__(self, socket_path, index, heartbeat_interval=5.0):
+        self.socket_path = socket_path
+        self.index = index
+        self.heartbeat_interval = heartbeat_interval
+        self._reader = None
+        self._writer = None
+        self._tails = {}
+        self._receiving = None
+        self._stopping = False
+        self.handled = 0
+
+    async def connect(self):
+        """Connect to the receiver and return its config as a dict"""
+        self._reader, self._writer = await asyncio.open_unix_connection(self.socket_path, limit=2 ** 24)
+        self._send({"op": "hello", "worker": self.index, "pid": os.getpid()})
+        message = json.loads(await self._reader.readline())
+        return message["config"]
+
+    def publish(self, name):
+        """Tell the receiver and the other workers about a committed change"""
+        self._send({"op": "event", "name": name})
+
+    def _send(self, message):
+        if self._writer is not None and not self._writer.is_closing():
+            self._writer.write(_encode(message))
+
+    def stop(self):
+        """Stop taking updates (e.g. on SIGTERM); serve() finishes the ones it
+        has started and returns. The receiver redelivers the rest."""
+        self._stopping = True
+        if self._receiving is not None:
+            self._receiving.cancel()
+
+    async def serve(self, feed, on_event=None, health=None, metrics=None, drain_timeout=10.0):
+        """Handle updates until the receiver says stop, goes away or stop() is called"""
+        heartbeat = asyncio.create_task(self._heartbeat(health, metrics))
+        self._receiving = asyncio.create_task(self._receive(feed, on_event))
+        try:
+            try:
+                await self._receiving
+            except asyncio.CancelledError:
+                if not self._stopping:
+                    raise
+            pending = [task for tail in self._tails.values() for task in tail.tasks]
+            if pending:
+                await asyncio.wait(pending, timeout=drain_timeout)
+        finally:
+            heartbeat.cancel()
+            await asyncio.gather(heartbeat, return_exceptions=True)
+            self._writer.close()
+
+    async def _receive(self, feed, on_event):
+        while not self._stopping:
+            line = await self._reader.readline()
+            if not line:
+                logger.warning("Receiver connection closed")
+                return
+            message = json.loads(line)
+            op = message.get("op")
+            if op == "update":
+                self._schedule(message["update"], feed)
+            elif op == "event" and on_event:
+                on_event(message["name"])
+            elif op == "stop":
+                return
+
+    def _schedule(self, update, feed):
+        chat = update_chat_id(update)
+        group = media_group_id(update)
+        tail = self._tails.get(chat)
+        if tail is None or not group or tail.group != group:
+            tail = self._tails[chat] = _Tail(group, tail.tasks if tail else [])
+        task = asyncio.create_task(self._handle(update, feed, tail.after))
+        tail.tasks.append(task)
+        task.add_done_callback(lambda _: self._release(chat, tail))
+
+    def _release(self, chat, tail):
+        if self._tails.get(chat) is tail and all(task.done() for task in tail.tasks):
+            del self._tails[chat]
+
+    async def _handle(self, update, feed, after):
+        if after:
+            await asyncio.wait(after)
+        try:
+            await feed(update)
+        except Exception as e:
+            logger.error(f"❌ Update {update.get('update_id')} failed: {e}", exc_info=True)
+        finally:
+            self.handled += 1
+            self._send({"op": "done", "update_id": update["update_id"]})
+
+    async def _heartbeat(self, health, metrics):
+        while True:
+            message = {"op": "heartbeat", "health": {"handled": self.handled, "chats": len(self._tails)}}
+            try:
+                if health:
+                    message["health"].update(health())
+                if metrics:
+                    message["metrics"] = metrics()
+            except Exception as e:
+                logger.warning(f"Heartbeat data failed: {e}")
+            self._send(message)
+            await asyncio.sleep(self.heartbeat_interval)
+
+
+async def poll_updates(url, dispatch, allowed_updates=None, timeout=30):
+    """Long-poll getUpdates at `url` and hand each raw update to dispatch()
+
+    Unlike Dispatcher.start_polling this never builds Update objects; the
+    workers parse the updates they are given.
+    """
+    offset = None
+    backoff = 1.0
+    async with aiohttp.ClientSession(json_serialize=json.dumps) as session:
+        while True:
+            params = {"timeout": timeout, "allowed_updates": allowed_updates or []}
+            if offset is not None:
+                params["offset"] = offset
+            try:
+                async with session.post(
+                    url, json=params, timeout=aiohttp.ClientTimeout(total=timeout + 10)
+                ) as response:
+                    payload = await response.json(content_type=None)
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                logger.warning(f"getUpdates failed: {e}; retrying in {backoff:.0f}s")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            if not payload.get("ok"):
+                retry = payload.get("parameters", {}).get("retry_after", backoff)
+                logger.warning(f"getUpdates error: {payload.get('description')}; retrying in {retry}s")
+                await asyncio.sleep(retry)
+                backoff = min(backoff * 2, 30.0)
+                continue
+            backoff = 1.0
+            for update in payload["result"]:
+                dispatch(update)
+                offset = update["update_id"] + 1
+
+
+def webhook_receiver(dispatch, secret=None):
+    """aiohttp handler passing webhook updates to dispatch() without parsing them"""
+    async def receive(request):
+        if secret and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != secret:
+            return web.Response(status=401)
+        dispatch(await request.json())
+        return web.Response()
+    return receive
+
+
+def worker_command(script):
+    """Command line that starts worker `index` of `script` (bot.py)"""
+    def command(index, socket_path):
+        return [sys.executable, script, "--worker", str(index), "--socket", socket_path]
+    return command
@@ -0,0 +1,153 @@
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+
+logger = logging.getLogger(__name__)
+
+# ====================
+# CONFIGURATION
+# ====================
+# Everything the bot reads from the environment, in one place. Reading the
+# config has no side effects; create_app() in bot.py builds the services
+# from it, and validate() is called only when the bot is actually started.
+
+DEFAULT_THROTTLE_LIMITS = {
+    "wizard": [20, 60, 10],
+    "photo": [30, 60, 10],
+    "stats": [5, 60, 3],
+    "search": [10, 60, 5],
+    "default": [20, 60, 10],
+}
+
+DEFAULT_AD_EXPIRY_DAYS = {"sale": 60, "rental": 30}
+
+
+class ConfigError(ValueError):
+    """The configuration cannot start the bot"""
+
+
+def get_env_list(env_name, default, environ=os.environ):
+    """Safely get a JSON value (list or object) from environment variable"""
+    env_value = environ.get(env_name)
+    if env_value:
+        try:
+            return json.loads(env_value)
+        except json.JSONDecodeError:
+            logger.warning(f"{env_name} has invalid JSON format, using default")
+            return default
+    return default
+
+
+def get_env_value(env_name, default, environ=os.environ):
+    """Safely get value from environment variable"""
+    return environ.get(env_name, default)
+
+
+@dataclass
+class Config:
+    bot_token: str = ""
+    admin_channel: str = "@AddisCarHub"
+    admin_ids: list = field(default_factory=list)
+    broker_phones: list = field(default_factory=lambda: ["0911564697", "0913550415"])
+    broker_name: str = "Addis Car Hub"
+
+    # Update delivery: "polling" (default) or "webhook"
+    bot_mode: str = "polling"
+    port: int = 3000
+    webhook_url: str = ""
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    # Discard the updates Telegram queued while the bot was down (e.g. during
+    # a deploy) instead of handling them on start
+    drop_pending_updates: bool = False
+    # Update-handling processes; above 1 a receiver routes updates by chat
+    # to this many worker processes (see cluster.py)
+    workers: int = 1
+
+    db_path: str = "car_broker.db"
+    db_readers: int = 2
+    db_cache_mb: float = 16
+    db_mmap_mb: float = 256
+    # How long the writer keeps a group commit open for more callers once
+    # its queue is empty; 0 commits as soon as nobody else is waiting
+    db_commit_window_ms: float = 0
+    # Half-filled CarForm drafts are evicted after this many hours
+    fsm_ttl_hours: float = 24
+
+    admin_notify_concurrency: int = 5
+    outbox_workers: int = 2
+    alert_notify_concurrency: int = 10
+    max_alerts_per_user: int = 10
+    # A seller re-posting their own car within this many days is blocked
+    duplicate_repost_days: float = 30
+    # Active ads expire after this many days per car_type (0 = never);
+    # expired, sold and rented ads are moved to cars_archive
+    ad_expiry_days: dict = field(default_factory=lambda: dict(DEFAULT_AD_EXPIRY_DAYS))
+    archive_interval_minutes: float = 60
+    # Per-user limits as {class: [rate, per_seconds, burst]}
+    throttle_limits: dict = field(default_factory=lambda: dict(DEFAULT_THROTTLE_LIMITS))
+
+    log_level: str = "INFO"
+    log_file: str = "bot.log"
+    log_format: str = "text"
+    log_max_bytes: int = 10 * 1024 * 1024
+    log_backup_count: int = 5
+    log_rotate_hours: float = 24
+    # Fraction of updates whose DEBUG lines are kept when LOG_LEVEL=DEBUG
+    log_sample_rate: float = 0.01
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        def value(name, default):
+            return get_env_value(name, default, environ)
+
+        def json_value(name, default):
+            return get_env_list(name, default, environ)
+
+        defaults = cls()
+        return cls(
+            bot_token=value("BOT_TOKEN", ""),
+            admin_channel=value("ADMIN_CHANNEL", defaults.admin_channel),
+            # Telegram ids arrive as ints; .env files often quote them
+            admin_ids=[int(i) if str(i).lstrip("-").isdigit() else i for i in json_value("ADMIN_IDS", [])],
+            broker_phones=json_value("BROKER_PHONES", defaults.broker_phones),
+            broker_name=value("BROKER_NAME", defaults.broker_name),
+            bot_mode=value("BOT_MODE", defaults.bot_mode).strip().lower(),
+            port=int(value("PORT", defaults.port)),
+            webhook_url=value("WEBHOOK_URL", "").rstrip("/"),
+            webhook_path=value("WEBHOOK_PATH", defaults.webhook_path),
+            webhook_secret=value("WEBHOOK_SECRET", ""),
+            drop_pending_updates=str(value("DROP_PENDING_UPDATES", "false")).strip().lower() in ("1", "true", "yes"),
+            workers=int(value("WORKERS", defaults.workers)),
+            db_path=value("DB_PATH", defaults.db_path),
+            db_readers=int(value("DB_READERS", defaults.db_readers)),
+            db_cache_mb=float(value("DB_CACHE_MB", defaults.db_cache_mb)),
+            db_mmap_mb=float(value("DB_MMAP_MB", defaults.db_mmap_mb)),
+            db_commit_window_ms=float(value("DB_COMMIT_WINDOW_MS", defaults.db_commit_window_ms)),
+            fsm_ttl_hours=float(value("FSM_TTL_HOURS", defaults.fsm_ttl_hours)),
+            admin_notify_concurrency=int(value("ADMIN_NOTIFY_CONCURRENCY", defaults.admin_notify_concurrency)),
+            outbox_workers=int(value("OUTBOX_WORKERS", defaults.outbox_workers)),
+            alert_notify_concurrency=int(value("ALERT_NOTIFY_CONCURRENCY", defaults.alert_notify_concurrency)),
+            max_alerts_per_user=int(value("MAX_ALERTS_PER_USER", defaults.max_alerts_per_user)),
+            duplicate_repost_days=float(value("DUPLICATE_REPOST_DAYS", defaults.duplicate_repost_days)),
+            ad_expiry_days={**DEFAULT_AD_EXPIRY_DAYS, **json_value("AD_EXPIRY_DAYS", {})},
+            archive_interval_minutes=float(value("ARCHIVE_INTERVAL_MINUTES", defaults.archive_interval_minutes)),
+            throttle_limits={**DEFAULT_THROTTLE_LIMITS, **json_value("THROTTLE_LIMITS", {})},
+            log_level=value("LOG_LEVEL", defaults.log_level).upper(),
+            log_file=value("LOG_FILE", defaults.log_file),
+            log_format=value("LOG_FORMAT", defaults.log_format).lower(),
+            log_max_bytes=int(value("LOG_MAX_BYTES", defaults.log_max_bytes)),
+            log_backup_count=int(value("LOG_BACKUP_COUNT", defaults.log_backup_count)),
+            log_rotate_hours=float(value("LOG_ROTATE_HOURS", defaults.log_rotate_hours)),
+            log_sample_rate=float(value("LOG_SAMPLE_RATE", defaults.log_sample_rate)),
+        )
+
+    def validate(self):
+        """Raise ConfigError if the bot cannot start with these settings"""
+        if not self.bot_token:
+            raise ConfigError("BOT_TOKEN environment variable is not set!")
+        if self.bot_mode not in ("polling", "webhook"):
+            raise ConfigError(f"BOT_MODE must be 'polling' or 'webhook', not {self.bot_mode!r}")
+        if self.bot_mode == "webhook" and not self.webhook_url:
+            raise ConfigError("WEBHOOK_URL must be set when BOT_MODE=webhook")
@@ -0,0 +1,276 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+
+import aiosqlite
+from aiosqlite.context import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class TimedConnection:
+    """aiosqlite connection proxy passing each statement's duration to
+    observe(sql, seconds); everything else goes to the real connection"""
+
+    def __init__(self, conn, observe):
+        self._conn = conn
+        self._observe = observe
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    # Like aiosqlite, execute() can be awaited or used with `async with`
+    @contextmanager
+    async def execute(self, sql, parameters=None):
+        start = time.perf_counter()
+        try:
+            return await self._conn.execute(sql, parameters)
+        finally:
+            self._observe(sql, time.perf_counter() - start)
+
+    @contextmanager
+    async def executemany(self, sql, parameters):
+        start = time.perf_counter()
+        try:
+            return await self._conn.executemany(sql, parameters)
+        finally:
+            self._observe(sql, time.perf_counter() - start)
+
+    async def commit(self):
+        start = time.perf_counter()
+        try:
+            return await self._conn.commit()
+        finally:
+            self._observe("COMMIT", time.perf_counter() - start)
+
+
+class Database:
+    """Long-lived aiosqlite connections shared by every handler.
+
+    All writes go through one writer connection driven by a single task
+    with group commit: callers queue up, each caller's `writer()` block runs
+    inside its own SAVEPOINT of a shared transaction, and the transaction is
+    committed once the queue is empty (or after `max_batch` callers). A
+    caller whose block raises only loses its own changes; every caller
+    returns from `writer()` only after the shared COMMIT has landed.
+
+    The database runs in WAL mode, so a small pool of reader connections
+    serves queries such as stats while writes are in progress. If `observe`
+    is given, every statement's duration is reported to it (see
+    TimedConnection).
+    """
+
+    def __init__(
+        self, path, readers=2, observe=None, cache_mb=16, mmap_mb=256,
+        commit_window=0.0, max_batch=200, busy_timeout=5.0
+    ):
+        self.path = path
+        self.reader_count = max(1, readers)
+        self.observe = observe
+        self.cache_mb = cache_mb
+        self.mmap_mb = mmap_mb
+        # Seconds to keep a batch open for more callers once the queue is empty
+        self.commit_window = commit_window
+        self.max_batch = max_batch
+        self.busy_timeout = busy_timeout
+        self._writer = None
+        self._requests = None
+        self._write_task = None
+        self._readers = None
+        self._all_readers = []
+        self.batches = 0
+        self.writes = 0
+
+    @property
+    def is_open(self):
+        return self._writer is not None
+
+    async def open(self):
+        """Open the writer and reader connections and start the writer task"""
+        if self.is_open:
+            return
+        # The writer manages its own transactions (BEGIN IMMEDIATE ... COMMIT)
+        self._writer = await self._connect(isolation_level=None)
+        # Lets the ad archiver hand freed pages back with PRAGMA
+        # incremental_vacuum. Immediate on a new database; an existing one
+        # is converted once, before any other connection is opened
+        await self._writer.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        async with self._writer.execute("PRAGMA auto_vacuum") as cursor:
+            (auto_vacuum,) = await cursor.fetchone()
+        if auto_vacuum != 2:
+            await self._vacuum_to_incremental()
+        async with self._writer.execute("PRAGMA journal_mode = WAL") as cursor:
+            (journal_mode,) = await cursor.fetchone()
+        self._readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect()
+            self._all_readers.append(conn)
+            self._readers.put_nowait(conn)
+        self._requests = asyncio.Queue()
+        self._write_task = asyncio.create_task(self._write_loop())
+        logger.info(
+            f"✅ Database pool opened ({self.reader_count} readers + 1 writer, "
+            f"journal_mode={journal_mode})"
+        )
+
+    async def _vacuum_to_incremental(self):
+        # The new auto_vacuum mode only lands with a full VACUUM, which
+        # rewrites the file and briefly needs as much free disk again
+        logger.info("🧹 Switching the database to incremental auto_vacuum (one-off VACUUM)...")
+        started = time.perf_counter()
+        try:
+            await self._writer.execute("VACUUM")
+        except Exception as e:
+            logger.warning(f"⚠️ VACUUM failed; archived ads' pages will be reused but not released: {e}")
+            return
+        logger.info(f"✅ Database vacuumed in {time.perf_counter() - started:.1f}s")
+
+    async def _connect(self, **kwargs):
+        conn = await aiosqlite.connect(self.path, timeout=self.busy_timeout, **kwargs)
+        # NORMAL is durable across application crashes in WAL mode; only an
+        # OS crash or power loss can drop the last commits
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA cache_size = {-int(self.cache_mb * 1024)}")
+        await conn.execute(f"PRAGMA mmap_size = {int(self.mmap_mb * 1024 * 1024)}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        return TimedConnection(conn, self.observe) if self.observe else conn
+
+    async def close(self):
+        """Finish queued writes, then close every pooled connection"""
+        if not self.is_open:
+            return
+        self._requests.put_nowait(None)
+        await self._write_task
+        self._write_task = None
+        for conn in self._all_readers:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.warning(f"Error closing reader connection: {e}")
+        self._all_readers = []
+        self._readers = None
+        try:
+            await self._writer.close()
+        finally:
+            self._writer = None
+        logger.info("Database pool closed")
+
+    def stats(self):
+        return {
+            "write_batches": self.batches,
+            "writes": self.writes,
+            "avg_batch": round(self.writes / self.batches, 2) if self.batches else 0,
+            "queued_writes": self._requests.qsize() if self._requests else 0,
+        }
+
+    @asynccontextmanager
+    async def reader(self):
+        """Borrow a read-only connection from the pool"""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open")
+        conn = await self._readers.get()
+        try:
+            yield conn
+        finally:
+            self._readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def writer(self):
+        """Run the block on the writer connection as part of the next group
+        commit; returns once committed, rolls back only this block on error"""
+        if not self.is_open:
+            raise RuntimeError("Database pool is not open")
+        loop = asyncio.get_running_loop()
+        granted, finished, committed = loop.create_future(), loop.create_future(), loop.create_future()
+        self._requests.put_nowait((granted, finished, committed))
+        try:
+            conn = await granted
+        except asyncio.CancelledError:
+            # Granted just as we were cancelled: give the savepoint back
+            if granted.done() and not granted.cancelled():
+                finished.set_result(False)
+            raise
+        try:
+            yield conn
+        except BaseException:
+            finished.set_result(False)
+            raise
+        finished.set_result(True)
+        # Shielded: cancelling the caller here must not cancel the future
+        # the writer task resolves after COMMIT
+        await asyncio.shield(committed)
+
+    async def _write_loop(self):
+        conn = self._writer
+        request = await self._requests.get()
+        while request is not None:
+            batch = []
+            try:
+                await conn.execute("BEGIN IMMEDIATE")
+                while True:
+                    await self._run_request(conn, request, batch)
+                    if len(batch) >= self.max_batch:
+                        request = False
+                    else:
+                        request = await self._next_request()
+                    if not request:
+                        break
+                await conn.execute("COMMIT")
+            except Exception as e:
+                logger.error(f"❌ Write batch of {len(batch)} failed: {e}")
+                try:
+                    await conn.execute("ROLLBACK")
+                except Exception:
+                    pass
+                for future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                # The caller in hand fails with the batch if it was not let in yet
+                if request:
+                    if not request[0].done():
+                        request[0].set_exception(e)
+                    request = False
+            else:
+                for future in batch:
+                    if not future.done():
+                        future.set_result(None)
+                self.batches += 1
+                self.writes += len(batch)
+            # False: committed, wait for the next caller; None: closing
+            if request is False:
+                request = await self._requests.get()
+
+    async def _next_request(self):
+        """The next queued caller, None on close, or False when the batch should commit"""
+        if not self._requests.empty():
+            return self._requests.get_nowait()
+        if self.commit_window <= 0:
+            return False
+        try:
+            return await asyncio.wait_for(self._requests.get(), timeout=self.commit_window)
+        except asyncio.TimeoutError:
+            return False
+
+    async def _run_request(self, conn, request, batch):
+        granted, finished, committed = request
+        if granted.cancelled():
+            return
+        await conn.execute("SAVEPOINT write")
+        granted.set_result(conn)
+        if await finished:
+            batch.append(committed)
+            await conn.execute("RELEASE write")
+        else:
+            await conn.execute("ROLLBACK TO write")
+            await conn.execute("RELEASE write")
+
+    async def fetchone(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchone()
+
+    async def fetchall(self, sql, params=()):
+        async with self.reader() as conn:
+            async with conn.execute(sql, params) as cursor:
+                return await cursor.fetchall()
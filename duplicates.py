@@ -0,0 +1,73 @@
+import re
+
+from alerts import parse_year, split_name
+
+# ====================
+# DUPLICATE / REPOST DETECTION
+# ====================
+# Two fingerprints point at the most recent ad that used them:
+# photo_fingerprints is keyed by Telegram's file_unique_id (the same photo
+# keeps it across re-uploads and users), and plate_fingerprints by the
+# normalized (plate_code, plate_full, make, model, year) of a sale ad. Both
+# are primary-key lookups, so the check costs the same at any table size.
+# Only live ads count: a sold or expired car may be listed again.
+
+_PLATE_RE = re.compile(r"[^0-9A-Z]")
+
+
+def plate_fingerprint(data):
+    """Normalized plate/car fingerprint for a CarForm draft or cars row.
+
+    Returns None when there is no plate number (rental ads only ask for the
+    plate code, which on its own would flag every car of the same model).
+    """
+    plate_full = _PLATE_RE.sub("", str(data.get('plate_full') or '').upper())
+    if not plate_full.strip("X"):
+        return None
+    make, model = split_name(data.get('make'), data.get('model'))
+    year = parse_year(data.get('year'))
+    return "|".join((
+        str(data.get('plate_code') or '').strip(),
+        plate_full,
+        (make or '').replace("-", ""),
+        (model or '').replace(" ", "").replace("-", ""),
+        str(year or ''),
+    ))
+
+
+async def find_duplicate(database, fingerprint, photo_uids):
+    """Return (car_id, user_id, make, model, year, created_at, age_days, reason)
+    of the latest ad sharing the plate fingerprint or any photo, or None"""
+    lookups = []
+    params = []
+    if fingerprint:
+        lookups.append("SELECT car_id, 'plate' AS reason FROM plate_fingerprints WHERE fingerprint = ?")
+        params.append(fingerprint)
+    if photo_uids:
+        marks = ", ".join("?" * len(photo_uids))
+        lookups.append(f"SELECT car_id, 'photo' AS reason FROM photo_fingerprints WHERE file_unique_id IN ({marks})")
+        params.extend(photo_uids)
+    if not lookups:
+        return None
+    return await database.fetchone(
+        f'''SELECT c.id, c.user_id, c.make, c.model, c.year, c.created_at,
+                   julianday('now') - julianday(c.created_at), f.reason
+            FROM ({" UNION ALL ".join(lookups)}) f JOIN cars c ON c.id = f.car_id
+            WHERE c.status = 'active'
+            ORDER BY c.id DESC LIMIT 1''',
+        params
+    )
+
+
+async def record_fingerprints(db, car_id, fingerprint, photo_uids):
+    """Point both fingerprints at car_id inside the ad's write transaction"""
+    if fingerprint:
+        await db.execute(
+            "INSERT OR REPLACE INTO plate_fingerprints (fingerprint, car_id) VALUES (?, ?)",
+            (fingerprint, car_id)
+        )
+    if photo_uids:
+        await db.executemany(
+            "INSERT OR REPLACE INTO photo_fingerprints (file_unique_id, car_id) VALUES (?, ?)",
+            [(uid, car_id) for uid in photo_uids]
+        )
@@ -0,0 +1,157 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import re
+import tempfile
+from datetime import date, timedelta
+
+# ====================
+# LISTING EXPORT (admins)
+# ====================
+# Rows are read in id order one page at a time (keyset pagination, each page
+# on a briefly borrowed reader connection) and appended to a gzip file from
+# a worker thread, so memory stays at one page whatever the table size and
+# compression never blocks the event loop.
+
+EXPORT_COLUMNS = (
+    "id", "created_at", "car_type", "status", "make", "model", "year", "color",
+    "plate_code", "plate_full", "plate_region", "price", "price_birr",
+    "price_currency", "price_period", "condition", "rental_advanced",
+    "rental_warranty", "rental_purpose", "rental_region",
+    "user_id", "user_name", "user_phone",
+)
+
+EXPORT_FORMATS = ("csv", "jsonl")
+
+# Telegram bots cannot upload documents larger than this
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+_STATUS_RE = re.compile(r"^[a-z_]{1,20}$")
+
+# json.dumps() with options builds a new encoder per call
+_encode_json = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+
+def parse_export_args(text):
+    """Parse "/export [csv|jsonl] [sale|rental] [archive] [status=..] [from=YYYY-MM-DD] [to=YYYY-MM-DD]"
+
+    Returns a dict of filters, or raises ValueError naming the bad argument.
+    """
+    filters = {"format": "csv", "car_type": None, "status": None, "since": None, "until": None, "archive": False}
+    for token in (text or "").lower().split():
+        key, _, value = token.partition("=")
+        if not value and key in EXPORT_FORMATS:
+            filters["format"] = key
+        elif not value and key in ("sale", "rental"):
+            filters["car_type"] = key
+        elif not value and key == "archive":
+            # Expired, sold and rented ads the archiver moved out of cars
+            filters["archive"] = True
+        elif key == "type" and value in ("sale", "rental"):
+            filters["car_type"] = value
+        elif key == "status" and _STATUS_RE.match(value):
+            filters["status"] = value
+        elif key in ("from", "to"):
+            try:
+                day = date.fromisoformat(value)
+            except ValueError:
+                raise ValueError(f"{key}= needs a date like 2024-01-31, not {value!r}")
+            filters["since" if key == "from" else "until"] = day
+        else:
+            raise ValueError(f"Unknown export option {token!r}")
+    if filters["since"] and filters["until"] and filters["since"] > filters["until"]:
+        raise ValueError("from= is after to=")
+    return filters
+
+
+def _where(filters):
+    clauses, params = [], []
+    if filters.get("car_type"):
+        clauses.append("car_type = ?")
+        params.append(filters["car_type"])
+    if filters.get("status"):
+        clauses.append("status = ?")
+        params.append(filters["status"])
+    if filters.get("since"):
+        clauses.append("created_at >= ?")
+        params.append(filters["since"].isoformat())
+    if filters.get("until"):
+        # created_at is "YYYY-MM-DD HH:MM:SS"; include the whole last day
+        clauses.append("created_at < ?")
+        params.append((filters["until"] + timedelta(days=1)).isoformat())
+    return "".join(f" AND {clause}" for clause in clauses), params
+
+
+async def iter_car_pages(database, filters, page_size=1000):
+    """Yield pages (lists of row tuples in EXPORT_COLUMNS order) in id order"""
+    where, params = _where(filters)
+    table = "cars_archive" if filters.get("archive") else "cars"
+    sql = (
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM {table} WHERE id > ?{where} "
+        f"ORDER BY id LIMIT ?"
+    )
+    last_id = 0
+    while True:
+        rows = await database.fetchall(sql, (last_id, *params, page_size))
+        if not rows:
+            return
+        yield rows
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
+
+
+def _encode_page(rows, fmt):
+    if fmt == "jsonl":
+        return "".join(_encode_json(dict(zip(EXPORT_COLUMNS, row))) + "\n" for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+async def write_export(database, filters, directory=None, page_size=1000):
+    """Write the matching ads to a gzip-compressed temp file.
+
+    Returns (path, row_count); the caller deletes the file.
+    """
+    fmt = filters.get("format", "csv")
+    fd, path = tempfile.mkstemp(prefix="cars-export-", suffix=f".{fmt}.gz", dir=directory)
+    os.close(fd)
+    # utf-8-sig lets spreadsheet apps detect UTF-8 (Amharic names, emoji)
+    out = gzip.open(path, "wt", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="")
+    count = 0
+    try:
+        if fmt == "csv":
+            await asyncio.to_thread(out.write, _encode_page([EXPORT_COLUMNS], fmt))
+        async for rows in iter_car_pages(database, filters, page_size):
+            await asyncio.to_thread(lambda rows=rows: out.write(_encode_page(rows, fmt)))
+            count += len(rows)
+        await asyncio.to_thread(out.close)
+    except BaseException:
+        out.close()
+        os.remove(path)
+        raise
+    return path, count
+
+
+def export_filename(filters, today=None):
+    parts = ["cars-archive" if filters.get("archive") else "cars"]
+    for key in ("car_type", "status"):
+        if filters.get(key):
+            parts.append(filters[key])
+    if filters.get("since"):
+        parts.append(f"from-{filters['since'].isoformat()}")
+    if filters.get("until"):
+        parts.append(f"to-{filters['until'].isoformat()}")
+    parts.append((today or date.today()).isoformat())
+    return f"{'-'.join(parts)}.{filters.get('format', 'csv')}.gz"
+
+
+def describe_filters(filters):
+    described = [f"{key}={filters[key]}" for key in ("car_type", "status", "since", "until") if filters.get(key)]
+    if filters.get("archive"):
+        return ", ".join(["archived ads", *described])
+    return ", ".join(described) or "all ads"
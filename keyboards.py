@@ -0,0 +1,75 @@
+from pydantic import ConfigDict
+from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+
+# ====================
+# KEYBOARDS
+# ====================
+# Built once at import and shared by every handler. They are frozen so a
+# handler cannot accidentally change the markup every other user receives.
+
+
+class FrozenReplyKeyboard(ReplyKeyboardMarkup):
+    model_config = ConfigDict(frozen=True)
+
+
+class FrozenReplyKeyboardRemove(ReplyKeyboardRemove):
+    model_config = ConfigDict(frozen=True)
+
+
+def _keyboard(rows, one_time=False):
+    return FrozenReplyKeyboard(
+        keyboard=[[KeyboardButton(text=text) for text in row] for row in rows],
+        resize_keyboard=True,
+        one_time_keyboard=one_time or None
+    )
+
+
+MAIN_MENU_KEYBOARD = _keyboard([
+    ["🚗 Car for Sale", "🏢 Car for Rental"],
+    ["📊 My Statistics", "ℹ️ How It Works"],
+    ["📞 Contact Agents"],
+])
+
+CANCEL_MENU_KEYBOARD = _keyboard([
+    ["🚗 Car for Sale", "🏢 Car for Rental"],
+    ["📞 Contact Agents"],
+])
+
+START_ONLY_KEYBOARD = _keyboard([["/start"]])
+
+PLATE_CODE_KEYBOARD = _keyboard([
+    ["1 - Taxi"],
+    ["2 - Private vehicle"],
+    ["3 - Commercial/Enterprise"],
+], one_time=True)
+
+RENTAL_ADVANCED_KEYBOARD = _keyboard([
+    ["One month"],
+    ["Two months"],
+    ["Three months"],
+], one_time=True)
+
+RENTAL_WARRANTY_KEYBOARD = _keyboard([
+    ["Yes, it's necessary"],
+    ["No, it's not necessary"],
+], one_time=True)
+
+RENTAL_PURPOSE_KEYBOARD = _keyboard([
+    ["For personal use"],
+    ["For enterprise"],
+    ["For taxi service (Ride)"],
+    ["For tour"],
+], one_time=True)
+
+PHOTO_ACTIONS_KEYBOARD = _keyboard([
+    ["📸 Done - Finish Adding Photos"],
+    ["⏩ Skip - No Photos"],
+], one_time=True)
+
+CONFIRMATION_KEYBOARD = _keyboard([
+    ["✅ Confirm & Post"],
+    ["✏️ Edit Details"],
+    ["❌ Cancel"],
+], one_time=True)
+
+REMOVE_KEYBOARD = FrozenReplyKeyboardRemove()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# ====================
+# AD LIFECYCLE & ARCHIVAL
+# ====================
+# An ad is 'active' from the moment it is posted until the seller or an
+# admin closes it ('sold' / 'rented') or it outlives its car_type's expiry
+# ('expired'). Only active ads are live: search and duplicate checks filter
+# on status = 'active', and a background archiver moves every other row
+# out of cars into cars_archive in small transactions, so the hot table and
+# its indexes only ever hold live listings.
+
+AD_STATES = ("active", "sold", "rented", "expired")
+LIVE_STATUS = "active"
+# The status a seller closes each car_type with
+CLOSED_STATUS = {"sale": "sold", "rental": "rented"}
+
+# Every cars column except status; cars_archive (migration 11) has these
+# plus status and archived_at. A migration adding a cars column must add it
+# here and to cars_archive as well.
+ARCHIVE_COLUMNS = (
+    "id", "user_id", "user_name", "user_phone", "make", "model", "year",
+    "color", "plate_code", "plate_partial", "plate_full", "plate_region",
+    "price", "condition", "car_type", "photos", "rental_advanced",
+    "rental_warranty", "rental_purpose", "rental_region", "created_at",
+    "price_birr", "price_currency", "price_period",
+)
+
+
+async def fetch_ad(database, car_id):
+    """Return the ad as a dict of its columns, live or archived, or None"""
+    columns = ", ".join((*ARCHIVE_COLUMNS, "status"))
+    row = await database.fetchone(
+        f'''SELECT {columns} FROM cars WHERE id = ?
+        UNION ALL SELECT {columns} FROM cars_archive WHERE id = ? LIMIT 1''',
+        (car_id, car_id)
+    )
+    return dict(zip((*ARCHIVE_COLUMNS, "status"), row)) if row else None
+
+
+async def set_status(db, car_id, status, user_id=None):
+    """Move a live ad to `status` inside the caller's transaction.
+
+    With user_id, only that seller's ad is changed. Returns True when a
+    live ad was updated.
+    """
+    if status not in AD_STATES:
+        raise ValueError(f"Unknown ad status {status!r}")
+    sql = "UPDATE cars SET status = ? WHERE id = ? AND status = ?"
+    params = [status, car_id, LIVE_STATUS]
+    if user_id is not None:
+        sql += " AND user_id = ?"
+        params.append(user_id)
+    cursor = await db.execute(sql, params)
+    return cursor.rowcount > 0
+
+
+class AdArchiver:
+    """Background task that expires and archives ads.
+
+    Every `interval` seconds it marks active ads older than their car_type's
+    expiry as 'expired', then moves all non-active ads to cars_archive in
+    batches of `batch_size`, each batch its own short write transaction,
+    and finally returns up to `vacuum_pages` free pages to the filesystem
+    with PRAGMA incremental_vacuum.
+    """
+
+    def __init__(
+        self, database, expiry_days, interval=3600, batch_size=500,
+        vacuum_pages=2000, pause=0.05
+    ):
+        self.database = database
+        self.expiry_days = dict(expiry_days)
+        self.interval = interval
+        self.batch_size = batch_size
+        self.vacuum_pages = vacuum_pages
+        self.pause = pause
+        self.expired = 0
+        self.archived = 0
+        self.last_run = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        terms = ", ".join(f"{car_type} {days:g}d" for car_type, days in self.expiry_days.items())
+        logger.info(f"✅ Ad archiver started (expiry: {terms or 'never'})")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+
+    def stats(self):
+        return {"expired": self.expired, "archived": self.archived, "last_run": self.last_run}
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"❌ Ad archiver failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self):
+        """Expire, archive and vacuum once; returns (expired, archived)"""
+        expired = 0
+        for car_type, days in self.expiry_days.items():
+            if days and days > 0:
+                expired += await self._expire(car_type, days)
+        archived = 0
+        while True:
+            moved = await self._archive_batch()
+            archived += moved
+            if moved < self.batch_size:
+                break
+            # Let queued writers (ad inserts, FSM flushes) in between batches
+            await asyncio.sleep(self.pause)
+        if archived and self.vacuum_pages:
+            async with self.database.writer() as db:
+                async with db.execute("PRAGMA auto_vacuum") as cursor:
+                    (auto_vacuum,) = await cursor.fetchone()
+                async with db.execute("PRAGMA freelist_count") as cursor:
+                    (free_pages,) = await cursor.fetchone()
+                # Database.open converts to INCREMENTAL (2); if its VACUUM
+                # failed the freed pages just stay in the file for reuse.
+                # Python's sqlite3 steps a PRAGMA incremental_vacuum(N) only
+                # once, releasing a single page, hence one call per page
+                pages = min(free_pages, int(self.vacuum_pages))
+                if auto_vacuum == 2 and pages:
+                    await db.executemany("PRAGMA incremental_vacuum(1)", [()] * pages)
+        self.expired += expired
+        self.archived += archived
+        self.last_run = time.time()
+        if expired or archived:
+            logger.info(f"🗄️ Expired {expired} and archived {archived} ads")
+        return expired, archived
+
+    async def _expire(self, car_type, days):
+        # Served by idx_cars_type_status_created
+        expired = 0
+        while True:
+            async with self.database.writer() as db:
+                cursor = await db.execute(
+                    '''UPDATE cars SET status = 'expired' WHERE id IN (
+                        SELECT id FROM cars WHERE car_type = ? AND status = ?
+                          AND created_at < datetime('now', ?)
+                        LIMIT ?)''',
+                    (car_type, LIVE_STATUS, f"-{float(days)} days", self.batch_size)
+                )
+                count = cursor.rowcount
+            expired += count
+            if count < self.batch_size:
+                return expired
+            await asyncio.sleep(self.pause)
+
+    async def _archive_batch(self):
+        columns = ", ".join(ARCHIVE_COLUMNS)
+        async with self.database.writer() as db:
+            # The partial index idx_cars_closed holds only these rows; without
+            # ANALYZE statistics the planner would scan a full-table index
+            async with db.execute(
+                "SELECT id FROM cars INDEXED BY idx_cars_closed WHERE status != 'active' LIMIT ?",
+                (self.batch_size,)
+            ) as cursor:
+                ids = [row[0] for row in await cursor.fetchall()]
+            if not ids:
+                return 0
+            marks = ", ".join("?" * len(ids))
+            await db.execute(
+                f'''INSERT OR REPLACE INTO cars_archive ({columns}, status)
+                SELECT {columns}, status FROM cars WHERE id IN ({marks})''',
+                ids
+            )
+            # The FTS delete trigger drops the ads from the search index too
+            await db.execute(f"DELETE FROM cars WHERE id IN ({marks})", ids)
+        return len(ids)
@@ -0,0 +1,150 @@
+import atexit
+import contextvars
+import copy
+import gzip
+import json
+import logging
+import os
+import queue
+import shutil
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# ====================
+# LOGGING PIPELINE
+# ====================
+# Handlers on the event loop only put records on a bounded queue; a
+# QueueListener thread formats them and does the stdout and file I/O, so a
+# slow disk never stalls a coroutine. The log file rotates by size and by
+# age, and rolled files are gzipped by the listener thread.
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# False while handling an update that was not picked for debug logging
+log_sampled = contextvars.ContextVar("log_sampled", default=True)
+
+_queue_handler = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class SampledDebugFilter(logging.Filter):
+    """Drop DEBUG records of updates that were not sampled (see log_sampled)"""
+
+    def filter(self, record):
+        return record.levelno > logging.DEBUG or log_sampled.get()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Only merge the arguments here; the listener thread formats the
+        # record (and any traceback), so the event loop does not pay for it
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _gzip_rotator(source, dest):
+    if not os.path.exists(source):
+        return
+    if os.path.getsize(source) == 0:
+        os.remove(source)
+        return
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Roll over after `max_bytes` or every `interval` seconds, whichever is
+    first, keeping `backup_count` gzipped files (bot.log.1.gz, ...)"""
+
+    def __init__(self, filename, max_bytes=0, backup_count=5, interval=0, encoding="utf-8"):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count,
+                         encoding=encoding, delay=True)
+        self.interval = interval
+        self.rollover_at = time.time() + interval if interval else None
+        self.namer = lambda name: name + ".gz"
+        self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record):
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        return super().shouldRollover(record)
+
+    def doRollover(self):
+        super().doRollover()
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+def setup_logging(level="INFO", log_file="bot.log", json_format=False,
+                  max_bytes=10 * 1024 * 1024, backup_count=5, rotate_seconds=86400,
+                  queue_size=10000):
+    """Route all logging through a queue to stdout and a rotating file.
+
+    Returns the started QueueListener; it is also stopped (and the queue
+    flushed) at interpreter exit.
+    """
+    global _queue_handler
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler(sys.stdout)]
+    if log_file:
+        handlers.append(CompressingRotatingFileHandler(
+            log_file, max_bytes=max_bytes, backup_count=backup_count, interval=rotate_seconds
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(queue_size)
+    _queue_handler = DroppingQueueHandler(log_queue)
+    _queue_handler.addFilter(SampledDebugFilter())
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
+
+
+def stop_logging(listener):
+    """Flush the queue and stop the listener thread (safe to call twice)"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def dropped_records():
+    """Records discarded because the log queue was full"""
+    return _queue_handler.dropped if _queue_handler else 0
@@ -0,0 +1,220 @@
+import bisect
+import logging
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+logger = logging.getLogger(__name__)
+
+# ====================
+# METRICS (Prometheus text format)
+# ====================
+# Histograms and counters kept in plain dicts of lists, keyed by a tuple of
+# label values. An observation is one dict lookup, one bisect and two list
+# updates; buckets are only made cumulative when /metrics is scraped.
+# In multi-process mode each worker sends Registry.snapshot() to the
+# receiver, which adds the snapshots in when rendering.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+
+    def inc(self, labels=(), amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        return [[list(labels), value] for labels, value in self._values.items()]
+
+    def render(self, remote=()):
+        values = dict(self._values)
+        for snapshot in remote:
+            for labels, value in snapshot.get(self.name, ()):
+                labels = tuple(labels)
+                values[labels] = values.get(labels, 0) + value
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(values.items()):
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self.bounds = tuple(sorted(buckets))
+        # labels -> [count per bucket..., count above the last bound, sum]
+        self._children = {}
+
+    def observe(self, value, labels=()):
+        child = self._children.get(labels)
+        if child is None:
+            child = self._children[labels] = [0] * (len(self.bounds) + 1) + [0.0]
+        child[bisect.bisect_left(self.bounds, value)] += 1
+        child[-1] += value
+
+    def snapshot(self):
+        return [[list(labels), child] for labels, child in self._children.items()]
+
+    def render(self, remote=()):
+        children = {labels: list(child) for labels, child in self._children.items()}
+        for snapshot in remote:
+            for labels, child in snapshot.get(self.name, ()):
+                mine = children.get(tuple(labels))
+                if mine is None:
+                    children[tuple(labels)] = list(child)
+                else:
+                    for i, value in enumerate(child):
+                        mine[i] += value
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, child in sorted(children.items()):
+            total = 0
+            for bound, count in zip(self.bounds + ("+Inf",), child):
+                total += count
+                le = f'le="{bound}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, labels, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, labels)} {_number(child[-1])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, labels)} {total}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time"""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self, remote=()):
+        # Gauges describe this process only
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"Gauge {self.name} failed: {e}")
+            return []
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge", f"{self.name} {_number(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, read):
+        return self._add(Gauge(name, help, read))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def snapshot(self):
+        """Counter and histogram values as JSON-friendly lists"""
+        return {m.name: m.snapshot() for m in self._metrics if hasattr(m, "snapshot")}
+
+    def render(self, remote=()):
+        """Exposition text; `remote` snapshots from other processes are added in"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render(remote))
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HANDLER_SECONDS = REGISTRY.histogram(
+    "bot_handler_duration_seconds", "Time spent in update handlers", ("event", "state", "handler")
+)
+HANDLER_ERRORS = REGISTRY.counter(
+    "bot_handler_errors_total", "Handlers that raised", ("event", "state", "handler")
+)
+DB_QUERY_SECONDS = REGISTRY.histogram(
+    "bot_db_query_duration_seconds", "SQLite statement execution time", ("statement",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+API_SECONDS = REGISTRY.histogram(
+    "bot_api_request_duration_seconds", "Telegram Bot API request time", ("method",)
+)
+API_ERRORS = REGISTRY.counter(
+    "bot_api_request_errors_total", "Failed Telegram Bot API requests", ("method", "error")
+)
+
+
+# Statement verb per SQL text; queries are mostly constants, so this stays small
+_statement_labels = {}
+
+
+def observe_query(sql, seconds):
+    """Database observer: record one statement under its leading keyword"""
+    labels = _statement_labels.get(sql)
+    if labels is None:
+        labels = (sql.split(None, 1)[0].upper() if sql.strip() else "EMPTY",)
+        if len(_statement_labels) < 1000:
+            _statement_labels[sql] = labels
+    DB_QUERY_SECONDS.observe(seconds, labels)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Time every handler call, labelled by event type, FSM state and handler"""
+
+    def __init__(self, event_type):
+        self.event_type = event_type
+
+    async def __call__(self, handler, event, data):
+        handler_object = data.get("handler")
+        labels = (
+            self.event_type,
+            data.get("raw_state") or "none",
+            handler_object.callback.__name__ if handler_object else "unknown",
+        )
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(labels)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, labels)
+
+
+class APIMetricsMiddleware(BaseRequestMiddleware):
+    """Time every Bot API request (register after the send scheduler so
+    queueing time is not counted and each retry is timed separately)"""
+
+    async def __call__(self, make_request, bot, method):
+        labels = (method.__api_method__,)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            API_ERRORS.inc((labels[0], type(e).__name__))
+            raise
+        finally:
+            API_SECONDS.observe(time.perf_counter() - start, labels)
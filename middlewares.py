@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import random
+import time
+import weakref
+from collections import OrderedDict
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+
+from logging_setup import log_sampled
+
+logger = logging.getLogger(__name__)
+
+
+class AlbumMiddleware(BaseMiddleware):
+    """Collect the messages of a Telegram album into one handler call.
+
+    Telegram delivers an album as separate messages sharing a
+    media_group_id. The first message waits until no new part has arrived
+    for `latency` seconds (at most `max_wait`), then reaches the handler with
+    every part in data["album"]. The other parts stop here.
+    """
+
+    def __init__(self, latency=0.6, max_wait=3.0):
+        self.latency = latency
+        self.max_wait = max_wait
+        self._albums = {}
+
+    async def __call__(self, handler, event, data):
+        group_id = getattr(event, "media_group_id", None)
+        if not group_id:
+            return await handler(event, data)
+
+        key = (event.chat.id, group_id)
+        album = self._albums.get(key)
+        if album is not None:
+            album.append(event)
+            return None
+
+        album = self._albums[key] = [event]
+        try:
+            waited = 0.0
+            seen = 0
+            while len(album) != seen and waited < self.max_wait:
+                seen = len(album)
+                await asyncio.sleep(self.latency)
+                waited += self.latency
+        finally:
+            self._albums.pop(key, None)
+
+        album.sort(key=lambda m: m.message_id)
+        data["album"] = album
+        return await handler(album[0], data)
+
+
+class KeyedLocks:
+    """asyncio locks per key that disappear once nobody holds a reference"""
+
+    def __init__(self):
+        self._locks = weakref.WeakValueDictionary()
+
+    def __call__(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._locks[key] = lock
+        return lock
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Per-user token buckets, one per handler class, with bounded memory.
+
+    The class comes from the handler's "throttling" flag, e.g.
+    @dp.message(..., flags={"throttling": "stats"}); any other handler
+    reached while the user is inside an FSM form counts as "wizard", the
+    rest as "default". `limits` maps a class to (rate, per) or
+    (rate, per, burst). Buckets live in an LRU of at most `max_entries`
+    (user, class) pairs, so memory stays flat however many users write.
+    Over-limit updates are dropped; the user is told to slow down at most
+    once per `warn_interval` seconds.
+    """
+
+    def __init__(self, limits, max_entries=50000, warn_interval=10.0, exempt=(),
+                 warning="⏳ You're sending messages too fast. Please slow down."):
+        self.limits = {}
+        for name, limit in limits.items():
+            rate, per, *burst = limit
+            self.limits[name] = (rate / per, float(burst[0] if burst else rate))
+        self.max_entries = max_entries
+        self.warn_interval = warn_interval
+        self.exempt = frozenset(exempt)
+        self.warning = warning
+        self.throttled = 0
+        # (user_id, class) -> [tokens, updated, warned_at]
+        self._buckets = OrderedDict()
+
+    def classify(self, data):
+        name = get_flag(data, "throttling")
+        if name:
+            return name
+        return "wizard" if data.get("raw_state") else "default"
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        if user is None or user.id in self.exempt:
+            return await handler(event, data)
+        name = self.classify(data)
+        limit = self.limits.get(name) or self.limits.get("default")
+        if limit is None:
+            return await handler(event, data)
+
+        fill_rate, capacity = limit
+        now = time.monotonic()
+        key = (user.id, name)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [capacity, now, 0.0]
+            if len(self._buckets) > self.max_entries:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * fill_rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return await handler(event, data)
+
+        self.throttled += 1
+        if now - bucket[2] >= self.warn_interval:
+            bucket[2] = now
+            logger.info(f"⏳ Throttling user {user.id} ({name})")
+            try:
+                # Message.answer replies in chat, CallbackQuery.answer shows a toast
+                await event.answer(self.warning)
+            except Exception as e:
+                logger.debug(f"Could not send throttling warning to {user.id}: {e}")
+        return None
+
+    def stats(self):
+        return {"tracked": len(self._buckets), "throttled": self.throttled}
+
+
+class UpdateSamplingMiddleware(BaseMiddleware):
+    """Pick a `rate` fraction of updates for DEBUG logging.
+
+    Registered as an update outer middleware: DEBUG records emitted while a
+    non-sampled update is handled are dropped before they reach the log
+    queue, and each sampled update gets one summary line with its timing.
+    """
+
+    def __init__(self, rate=0.01):
+        self.rate = rate
+
+    async def __call__(self, handler, event, data):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return await handler(event, data)
+        sampled = random.random() < self.rate
+        token = log_sampled.set(sampled)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            if sampled:
+                logger.debug(
+                    f"Update {event.update_id} ({event.event_type}) handled in "
+                    f"{(time.perf_counter() - start) * 1000:.1f} ms"
+                )
+            log_sampled.reset(token)
@@ -0,0 +1,414 @@
+import asyncio
+import json
+import logging
+
+from prices import parse_listing_price, price_columns
+from duplicates import plate_fingerprint
+
+logger = logging.getLogger(__name__)
+
+# Each migration is (version, description, steps). A step is either a SQL
+# string or an async callable taking the writer connection. Migrations run in
+# order inside their own transaction, and PRAGMA user_version is bumped in
+# that same transaction so a crash never leaves a half-applied version.
+MIGRATIONS = [
+    (1, "baseline schema", [
+        '''
+        CREATE TABLE IF NOT EXISTS cars (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            user_name TEXT,
+            user_phone TEXT,
+            make TEXT,
+            model TEXT,
+            year TEXT,
+            color TEXT,
+            plate_code TEXT,
+            plate_partial TEXT,
+            plate_full TEXT,
+            plate_region TEXT,
+            price TEXT,
+            condition TEXT,
+            car_type TEXT,
+            photos TEXT,
+            rental_advanced TEXT,
+            rental_warranty TEXT,
+            rental_purpose TEXT,
+            rental_region TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'pending'
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            phone TEXT,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ads_posted INTEGER DEFAULT 0
+        )
+        ''',
+    ]),
+    (2, "indexes on cars", [
+        "CREATE INDEX IF NOT EXISTS idx_cars_user_created ON cars (user_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_type_status_created ON cars (car_type, status, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_cars_make_model ON cars (make, model)",
+    ]),
+    (3, "incremental ad counters", [
+        '''
+        CREATE TABLE IF NOT EXISTS counters (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # Backfill one users row per seller that has posted before
+        '''
+        INSERT INTO users (user_id, full_name, phone, registered_at, ads_posted)
+        SELECT user_id, MAX(user_name), MAX(user_phone), MIN(created_at), COUNT(*)
+        FROM cars WHERE user_id IS NOT NULL GROUP BY user_id
+        ON CONFLICT(user_id) DO UPDATE SET ads_posted = excluded.ads_posted
+        ''',
+        '''
+        INSERT INTO counters (name, value) SELECT 'total_ads', COUNT(*) FROM cars WHERE true
+        ON CONFLICT(name) DO UPDATE SET value = excluded.value
+        ''',
+    ]),
+    (4, "transactional outbox", [
+        '''
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            car_id INTEGER,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL,
+            locked_until REAL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            processed_at REAL,
+            UNIQUE (car_id, kind)
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_outbox_status_available ON outbox (status, available_at)",
+    ]),
+    (5, "persistent FSM storage", [
+        '''
+        CREATE TABLE IF NOT EXISTS fsm_storage (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data TEXT,
+            updated_at REAL NOT NULL
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated ON fsm_storage (updated_at)",
+    ]),
+    (6, "full-text search over listings", [
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS cars_fts USING fts5(
+            make, model, color, condition, plate_region, rental_region,
+            content='cars', content_rowid='id'
+        )
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_insert AFTER INSERT ON cars BEGIN
+            INSERT INTO cars_fts (rowid, make, model, color, condition, plate_region, rental_region)
+            VALUES (new.id, new.make, new.model, new.color, new.condition, new.plate_region, new.rental_region);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_delete AFTER DELETE ON cars BEGIN
+            INSERT INTO cars_fts (cars_fts, rowid, make, model, color, condition, plate_region, rental_region)
+            VALUES ('delete', old.id, old.make, old.model, old.color, old.condition, old.plate_region, old.rental_region);
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS cars_fts_update
+        AFTER UPDATE OF make, model, color, condition, plate_region, rental_region ON cars BEGIN
+            INSERT INTO cars_fts (cars_fts, rowid, make, model, color, condition, plate_region, rental_region)
+            VALUES ('delete', old.id, old.make, old.model, old.color, old.condition, old.plate_region, old.rental_region);
+            INSERT INTO cars_fts (rowid, make, model, color, condition, plate_region, rental_region)
+            VALUES (new.id, new.make, new.model, new.color, new.condition, new.plate_region, new.rental_region);
+        END
+        ''',
+        # Index the ads that already exist
+        "INSERT INTO cars_fts (cars_fts) VALUES ('rebuild')",
+    ]),
+    (7, "numeric price columns", [
+        "ALTER TABLE cars ADD COLUMN price_birr INTEGER",
+        "ALTER TABLE cars ADD COLUMN price_currency TEXT",
+        "ALTER TABLE cars ADD COLUMN price_period TEXT",
+        "CREATE INDEX IF NOT EXISTS idx_cars_type_price ON cars (car_type, price_birr)",
+        '''
+        CREATE TABLE IF NOT EXISTS migration_progress (
+            name TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            done INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    ]),
+    (8, "saved-search alerts", [
+        '''
+        CREATE TABLE IF NOT EXISTS saved_searches (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            query TEXT NOT NULL,
+            make TEXT,
+            model TEXT,
+            car_type TEXT,
+            min_price INTEGER,
+            max_price INTEGER,
+            min_year INTEGER,
+            max_year INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_saved_searches_user ON saved_searches (user_id)",
+    ]),
+    (9, "duplicate ad fingerprints", [
+        '''
+        CREATE TABLE IF NOT EXISTS plate_fingerprints (
+            fingerprint TEXT PRIMARY KEY,
+            car_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS photo_fingerprints (
+            file_unique_id TEXT PRIMARY KEY,
+            car_id INTEGER NOT NULL
+        ) WITHOUT ROWID
+        ''',
+    ]),
+    (10, "normalized car photos", [
+        # One row per photo in posting order. The primary key serves the
+        # per-ad lookup; file_unique_id is indexed for dedup and counting.
+        '''
+        CREATE TABLE IF NOT EXISTS car_photos (
+            car_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (car_id, position)
+        ) WITHOUT ROWID
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_car_photos_unique_id ON car_photos (file_unique_id)",
+        # Compatibility view for the old cars.photos JSON column; ads that
+        # have not been backfilled yet still read their JSON
+        '''
+        CREATE VIEW IF NOT EXISTS cars_photos_json (car_id, photos) AS
+        SELECT c.id, COALESCE(
+            NULLIF((SELECT json_group_array(file_id) FROM
+                (SELECT file_id FROM car_photos WHERE car_id = c.id ORDER BY position)), '[]'),
+            c.photos, '[]')
+        FROM cars c
+        ''',
+    ]),
+    (11, "ad lifecycle and archive", [
+        # 'pending' was the old default and never changed; those ads are live
+        "UPDATE cars SET status = 'active' WHERE status IS NULL OR status = 'pending'",
+        # Same columns as cars (see lifecycle.ARCHIVE_COLUMNS), without the
+        # AUTOINCREMENT so archived ads keep their ids
+        '''
+        CREATE TABLE IF NOT EXISTS cars_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            user_name TEXT,
+            user_phone TEXT,
+            make TEXT,
+            model TEXT,
+            year TEXT,
+            color TEXT,
+            plate_code TEXT,
+            plate_partial TEXT,
+            plate_full TEXT,
+            plate_region TEXT,
+            price TEXT,
+            condition TEXT,
+            car_type TEXT,
+            photos TEXT,
+            rental_advanced TEXT,
+            rental_warranty TEXT,
+            rental_purpose TEXT,
+            rental_region TEXT,
+            created_at TIMESTAMP,
+            status TEXT NOT NULL,
+            price_birr INTEGER,
+            price_currency TEXT,
+            price_period TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        "CREATE INDEX IF NOT EXISTS idx_cars_archive_user ON cars_archive (user_id, created_at)",
+        # Closed ads waiting for the archiver; stays near-empty
+        "CREATE INDEX IF NOT EXISTS idx_cars_closed ON cars (id) WHERE status != 'active'",
+    ]),
+    (12, "channel message ids", [
+        # The channel message holding each ad's text (the first, captioned
+        # message of an album), so status and price changes edit it in place
+        '''
+        CREATE TABLE IF NOT EXISTS channel_posts (
+            car_id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            has_media INTEGER NOT NULL DEFAULT 0,
+            posted_price TEXT,
+            posted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            edited_at TIMESTAMP
+        )
+        ''',
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+async def get_schema_version(db):
+    async with db.execute("PRAGMA user_version") as cursor:
+        row = await cursor.fetchone()
+    return row[0] if row else 0
+
+
+async def run_migrations(database, migrations=MIGRATIONS):
+    """Bring the database up to the latest schema version in place"""
+    async with database.writer() as db:
+        current = await get_schema_version(db)
+
+    pending = [m for m in migrations if m[0] > current]
+    if not pending:
+        logger.info(f"✅ Database schema is up to date (version {current})")
+        return current
+
+    for version, description, steps in pending:
+        # Writer transactions begin IMMEDIATE, taking the write lock up front;
+        # readers keep working against the old schema until the commit lands
+        async with database.writer() as db:
+            for step in steps:
+                if callable(step):
+                    await step(db)
+                else:
+                    await db.execute(step)
+            await db.execute(f"PRAGMA user_version = {int(version)}")
+        logger.info(f"✅ Applied migration {version}: {description}")
+        current = version
+
+    return current
+
+
+# ====================
+# BATCHED BACKFILLS
+# ====================
+# Data migrations over existing rows run after the schema migrations as a
+# background task. Each batch is its own short transaction keyed on
+# cars.id, and the last id is stored in migration_progress, so the bot
+# keeps serving while they run and a restart resumes where it stopped.
+
+async def backfill_prices(db, rows):
+    # The same checks new ads get: a phone number, a decimal slip or a
+    # monthly rental leaves the columns NULL, so it never reaches the price
+    # sort, search or alerts. Rows are read outside this transaction, so a
+    # price changed since (/price) is left alone.
+    await db.executemany(
+        '''UPDATE cars SET price_birr = ?, price_currency = ?, price_period = ?
+        WHERE id = ? AND price IS ?''',
+        [(*price_columns(parse_listing_price(price, car_type)), car_id, price)
+         for car_id, price, car_type in rows]
+    )
+
+async def backfill_plate_fingerprints(db, rows):
+    # Photos of older ads were stored without file_unique_id, so only
+    # plates can be fingerprinted retroactively
+    fingerprints = []
+    for car_id, plate_code, plate_full, make, model, year in rows:
+        fingerprint = plate_fingerprint({
+            'plate_code': plate_code, 'plate_full': plate_full,
+            'make': make, 'model': model, 'year': year,
+        })
+        if fingerprint:
+            fingerprints.append((fingerprint, car_id))
+    if fingerprints:
+        # Rows come in id order, so the newest ad ends up owning the fingerprint
+        await db.executemany(
+            "INSERT OR REPLACE INTO plate_fingerprints (fingerprint, car_id) VALUES (?, ?)",
+            fingerprints
+        )
+
+async def backfill_car_photos(db, rows):
+    # Older ads stored only file_ids, so file_unique_id stays NULL for them
+    photos, migrated = [], []
+    for car_id, blob in rows:
+        try:
+            file_ids = json.loads(blob)
+            if not isinstance(file_ids, list):
+                raise ValueError("not a list")
+        except ValueError:
+            logger.warning(f"⚠️ Ad #{car_id} has unreadable photos JSON, leaving it in place")
+            continue
+        migrated.append((car_id,))
+        photos.extend(
+            (car_id, position, file_id)
+            for position, file_id in enumerate(file_ids) if file_id
+        )
+    if photos:
+        await db.executemany(
+            "INSERT OR IGNORE INTO car_photos (car_id, position, file_id) VALUES (?, ?, ?)",
+            photos
+        )
+    # The rows now live in car_photos; drop the blobs to reclaim their pages
+    await db.executemany("UPDATE cars SET photos = NULL WHERE id = ?", migrated)
+
+# (name, select taking (last_id, limit) whose first column is the id, apply)
+BACKFILLS = [
+    ("cars.price_birr",
+     "SELECT id, price, car_type FROM cars WHERE id > ? AND price_currency IS NULL ORDER BY id LIMIT ?",
+     backfill_prices),
+    # Rows filled in before the backfill applied PRICE_BOUNDS are re-parsed
+    ("cars.price_birr bounds",
+     "SELECT id, price, car_type FROM cars WHERE id > ? AND price_currency IS NOT NULL ORDER BY id LIMIT ?",
+     backfill_prices),
+    ("plate_fingerprints",
+     "SELECT id, plate_code, plate_full, make, model, year FROM cars WHERE id > ? ORDER BY id LIMIT ?",
+     backfill_plate_fingerprints),
+    ("car_photos",
+     "SELECT id, photos FROM cars WHERE id > ? AND photos IS NOT NULL ORDER BY id LIMIT ?",
+     backfill_car_photos),
+]
+
+
+async def run_backfill(database, name, select_sql, apply_batch, batch_size=500, pause=0.05):
+    row = await database.fetchone(
+        "SELECT last_id, done FROM migration_progress WHERE name = ?", (name,)
+    )
+    last_id, done = row if row else (0, 0)
+    if done:
+        return 0
+
+    processed = 0
+    while True:
+        rows = await database.fetchall(select_sql, (last_id, batch_size))
+        async with database.writer() as db:
+            if rows:
+                await apply_batch(db, rows)
+                last_id = rows[-1][0]
+            await db.execute(
+                '''INSERT INTO migration_progress (name, last_id, done) VALUES (?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id, done = excluded.done''',
+                (name, last_id, 0 if rows else 1)
+            )
+        if not rows:
+            break
+        processed += len(rows)
+        # Give queued writers (ad inserts, FSM flushes) a turn between batches
+        await asyncio.sleep(pause)
+
+    logger.info(f"✅ Backfill {name} finished ({processed} rows)")
+    return processed
+
+
+async def run_backfills(database, backfills=BACKFILLS):
+    """Run every unfinished backfill in order; safe to call on every start"""
+    for name, select_sql, apply_batch in backfills:
+        try:
+            await run_backfill(database, name, select_sql, apply_batch)
+        except Exception as e:
+            logger.error(f"❌ Backfill {name} stopped at an error and will resume on next start: {e}")
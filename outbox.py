@@ -0,0 +1,158 @@
+import asyncio
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class PartialDelivery(Exception):
+    """Raised by a handler that delivered some of a row's targets.
+
+    The row is retried with `remaining` as its new payload, so targets that
+    already received the message are not sent it again.
+    """
+
+    def __init__(self, remaining, failures):
+        super().__init__(f"{len(failures)} target(s) failed")
+        self.remaining = remaining
+        self.failures = failures
+
+
+async def enqueue(db, kind, payload, car_id=None):
+    """Add an outbox row inside the caller's transaction"""
+    await db.execute(
+        '''INSERT OR IGNORE INTO outbox (car_id, kind, payload, available_at)
+        VALUES (?, ?, ?, ?)''',
+        (car_id, kind, json.dumps(payload), time.time())
+    )
+
+
+class OutboxWorker:
+    """Background pool that drains the outbox table.
+
+    Each worker claims one row at a time with a lease, so a row whose worker
+    crashed becomes available again once the lease expires, and no row sits
+    in a worker's hands waiting behind others while its lease runs out. A
+    row is marked done only after its handler returns; failures are retried
+    with backoff up to max_attempts, after which the row is parked as
+    'failed'.
+    """
+
+    def __init__(
+        self, database, handlers, workers=2,
+        poll_interval=5.0, lease_seconds=120, max_attempts=8, max_backoff=600
+    ):
+        self.database = database
+        self.handlers = handlers
+        self.worker_count = max(1, workers)
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._tasks = []
+
+    def notify(self):
+        """Wake the workers right after a transaction that enqueued rows commits"""
+        self._wakeup.set()
+
+    def start(self):
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._run(i)) for i in range(self.worker_count)
+        ]
+        logger.info(f"✅ Outbox worker pool started ({self.worker_count} workers)")
+
+    async def stop(self, timeout=10.0):
+        """Finish the rows in hand, then stop"""
+        self._stopping = True
+        self._wakeup.set()
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        logger.info("Outbox worker pool stopped")
+
+    async def _run(self, index):
+        while not self._stopping:
+            # Clear before claiming so a notify() that lands mid-claim is kept
+            self._wakeup.clear()
+            try:
+                row = await self._claim()
+                if row is not None:
+                    await self._process(*row)
+            except Exception as e:
+                # A failed claim or status write must not end the worker; an
+                # unfinished row is picked up again when its lease expires
+                logger.error(f"❌ Outbox worker {index} failed: {e}")
+                await asyncio.sleep(self.poll_interval)
+                continue
+
+            if row is not None or self._stopping:
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _claim(self):
+        now = time.time()
+        # Writer transactions begin IMMEDIATE, so the write lock is held
+        # before the SELECT and processes sharing the database never claim
+        # the same row
+        async with self.database.writer() as db:
+            async with db.execute(
+                '''SELECT id, kind, payload, attempts FROM outbox
+                WHERE (status = 'pending' AND available_at <= ?)
+                   OR (status = 'processing' AND locked_until < ?)
+                ORDER BY id LIMIT 1''',
+                (now, now)
+            ) as cursor:
+                row = await cursor.fetchone()
+            if row is not None:
+                await db.execute(
+                    '''UPDATE outbox SET status = 'processing', locked_until = ?,
+                    attempts = attempts + 1 WHERE id = ?''',
+                    (now + self.lease_seconds, row[0])
+                )
+        return row
+
+    async def _process(self, row_id, kind, payload, attempts):
+        handler = self.handlers.get(kind)
+        try:
+            if handler is None:
+                raise LookupError(f"No outbox handler for kind {kind!r}")
+            await handler(json.loads(payload))
+        except PartialDelivery as e:
+            details = "; ".join(f"{target}: {err}" for target, err in e.failures)
+            await self._fail(row_id, attempts + 1, f"partial: {details}", json.dumps(e.remaining))
+        except Exception as e:
+            await self._fail(row_id, attempts + 1, str(e))
+        else:
+            async with self.database.writer() as db:
+                await db.execute(
+                    '''UPDATE outbox SET status = 'done', processed_at = ?, last_error = NULL
+                    WHERE id = ? AND status = 'processing' ''',
+                    (time.time(), row_id)
+                )
+
+    async def _fail(self, row_id, attempts, error, payload=None):
+        if attempts >= self.max_attempts:
+            status, available_at = 'failed', time.time()
+            logger.error(f"❌ Outbox row {row_id} failed permanently: {error}")
+        else:
+            delay = min(self.max_backoff, 2 ** attempts)
+            status, available_at = 'pending', time.time() + delay
+            logger.warning(f"⚠️ Outbox row {row_id} failed ({error}), retrying in {delay}s")
+        async with self.database.writer() as db:
+            await db.execute(
+                '''UPDATE outbox SET status = ?, available_at = ?, locked_until = NULL,
+                last_error = ?, payload = COALESCE(?, payload)
+                WHERE id = ? AND status = 'processing' ''',
+                (status, available_at, error[:1000], payload, row_id)
+            )
@@ -0,0 +1,131 @@
+import re
+
+# ====================
+# PRICE NORMALIZATION
+# ====================
+# Sellers type prices as free text ("1.2M", "1,200,000", "1500/day").
+# parse_price turns that into an integer amount plus currency and rental
+# period, which is what the price_birr / price_currency / price_period
+# columns store and what range queries use.
+
+_MULTIPLIERS = {
+    "k": 1_000, "thousand": 1_000,
+    "m": 1_000_000, "mil": 1_000_000, "million": 1_000_000, "mln": 1_000_000,
+}
+
+# An amount with optional thousands separators and multiplier; also used
+# by alerts.py to find the amounts in saved searches
+NUMBER_PATTERN = (
+    r"(\d{1,3}(?:[,.\s]\d{3})+(?:[.,]\d+)?|\d+(?:[.,]\d+)?)"
+    r"\s*(k|thousand|million|mil|mln|m)?(?![a-z])"
+)
+_NUMBER_RE = re.compile(NUMBER_PATTERN)
+
+_PERIODS = (
+    (re.compile(r"(/|\bper\b|\ba\b)\s*(day|d)\b|\bdaily\b|\bday\b"), "day"),
+    (re.compile(r"(/|\bper\b|\ba\b)\s*(week|wk|w)\b|\bweekly\b|\bweek\b"), "week"),
+    (re.compile(r"(/|\bper\b|\ba\b)\s*(month|mo|mth)\b|\bmonthly\b|\bmonth\b"), "month"),
+)
+
+_USD_RE = re.compile(r"\$|\busd\b|\bdollars?\b")
+_BIRR_RE = re.compile(r"\bbirr\b|\bbr\b|\betb\b|ብር")
+
+MAX_PRICE = 10_000_000_000
+
+# Plausible listing prices in Birr per car_type (rentals per day). Outside
+# these a value is almost always a decimal slip ("1.5", "12,5") or a phone
+# number typed into the price step.
+PRICE_BOUNDS = {
+    "sale": (50_000, 200_000_000),
+    "rental": (100, 100_000),
+}
+
+
+def _to_number(digits):
+    digits = re.sub(r"\s+", "", digits).rstrip(".,")
+    if not digits:
+        return None
+    if "," in digits and "." in digits:
+        # 1,200,000.50 or 1.200.000,50: the last separator is the decimal one
+        if digits.rfind(",") > digits.rfind("."):
+            digits = digits.replace(".", "").replace(",", ".")
+        else:
+            digits = digits.replace(",", "")
+    elif "," in digits:
+        head, _, tail = digits.rpartition(",")
+        if digits.count(",") == 1 and len(tail) != 3:
+            digits = f"{head}.{tail}"
+        else:
+            digits = digits.replace(",", "")
+    elif digits.count(".") > 1:
+        digits = digits.replace(".", "")
+    try:
+        return float(digits)
+    except ValueError:
+        return None
+
+
+def parse_price(text, default_period=None):
+    """Parse a price typed by a seller.
+
+    Returns (amount, currency, period) where amount is an int, currency is
+    'ETB' or 'USD' and period is 'day', 'week', 'month' or default_period.
+    Returns None when no sensible price can be found.
+    """
+    if not text:
+        return None
+    lowered = text.lower().strip()
+
+    match = _NUMBER_RE.search(lowered)
+    if not match:
+        return None
+    value = _to_number(match.group(1))
+    if value is None:
+        return None
+    multiplier = _MULTIPLIERS.get(match.group(2) or "", 1)
+    # "1.500" without a multiplier is one thousand five hundred, not 1.5
+    if multiplier == 1 and re.fullmatch(r"\d{1,3}\.\d{3}", match.group(1).strip()):
+        value *= 1000
+    amount = int(round(value * multiplier))
+    if amount <= 0 or amount >= MAX_PRICE:
+        return None
+
+    currency = "USD" if _USD_RE.search(lowered) and not _BIRR_RE.search(lowered) else "ETB"
+
+    rest = lowered[:match.start()] + " " + lowered[match.end():]
+    period = default_period
+    for pattern, name in _PERIODS:
+        if pattern.search(rest):
+            period = name
+            break
+    return amount, currency, period
+
+
+def parse_listing_price(text, car_type):
+    """Parse a seller's price for a `car_type` ad.
+
+    Only Birr amounts within PRICE_BOUNDS are accepted; rental prices must
+    be per day, as the rental ad shows "Birr/Day". Returns the parse_price
+    result, or None when the seller should be asked again.
+    """
+    default_period = "day" if car_type == "rental" else None
+    parsed = parse_price(text, default_period)
+    if parsed is None:
+        return None
+    amount, currency, period = parsed
+    low, high = PRICE_BOUNDS.get(car_type, PRICE_BOUNDS["sale"])
+    if currency != "ETB" or period != default_period or not low <= amount <= high:
+        return None
+    return parsed
+
+
+def price_columns(parsed):
+    """Map a parse_price result onto (price_birr, price_currency, price_period)
+
+    Ads and the backfill both go through parse_listing_price, which only
+    accepts Birr; a USD amount would keep a NULL price_birr.
+    """
+    if parsed is None:
+        return None, None, None
+    amount, currency, period = parsed
+    return (amount if currency == "ETB" else None), currency, period
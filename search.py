@@ -0,0 +1,87 @@
+import re
+import secrets
+from collections import OrderedDict
+
+# ====================
+# LISTING SEARCH (SQLite FTS5)
+# ====================
+# cars_fts is an external-content FTS5 index over cars, kept in sync by
+# triggers (see migration 6). Results are ordered by bm25 rank and paged
+# with a (rank, id) keyset, so deep pages cost the same as the first one.
+# Only live ads are returned; archived ads are already gone from the index.
+
+SEARCH_PAGE_SIZE = 5
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_fts_query(text, max_terms=8):
+    """Turn free text into a safe FTS5 query: every word must prefix-match"""
+    terms = _TOKEN_RE.findall(text or "")[:max_terms]
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+
+async def search_cars(database, fts_query, after=None, limit=SEARCH_PAGE_SIZE):
+    """Return up to `limit` ranked matches after the (rank, id) cursor `after`.
+
+    Each row is (id, make, model, year, price, car_type, rank). One extra row
+    is fetched so the caller knows whether a next page exists.
+    """
+    # Rank and page inside the FTS index first, then join only the page. Sold
+    # or expired ads waiting for the archiver are skipped while paging, so
+    # pages stay full.
+    live = "AND EXISTS (SELECT 1 FROM cars WHERE id = cars_fts.rowid AND status = 'active')"
+    if after is None:
+        page = f'''SELECT rowid, rank FROM cars_fts WHERE cars_fts MATCH ? {live}
+            ORDER BY rank, rowid LIMIT ?'''
+        params = (fts_query, limit + 1)
+    else:
+        last_rank, last_id = after
+        page = f'''SELECT rowid, rank FROM cars_fts WHERE cars_fts MATCH ? {live}
+              AND (rank > ? OR (rank = ? AND rowid > ?))
+            ORDER BY rank, rowid LIMIT ?'''
+        params = (fts_query, last_rank, last_rank, last_id, limit + 1)
+    sql = f'''SELECT c.id, c.make, c.model, c.year, c.price, c.car_type, p.rank
+        FROM ({page}) p JOIN cars c ON c.id = p.rowid
+        ORDER BY p.rank, p.rowid'''
+    rows = await database.fetchall(sql, params)
+    return rows[:limit], len(rows) > limit
+
+
+class SearchSessions:
+    """Bounded map of short tokens to queries for "next page" buttons.
+
+    Telegram limits callback data to 64 bytes, so the button carries a token
+    and the keyset cursor instead of the query text itself.
+    """
+
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._queries = OrderedDict()
+
+    def add(self, query, fts_query):
+        token = secrets.token_urlsafe(6)
+        self._queries[token] = (query, fts_query)
+        if len(self._queries) > self.max_size:
+            self._queries.popitem(last=False)
+        return token
+
+    def get(self, token):
+        """Return (query, fts_query) for token, or None once it has expired"""
+        entry = self._queries.get(token)
+        if entry is not None:
+            self._queries.move_to_end(token)
+        return entry
+
+
+def encode_cursor(token, rank, car_id):
+    return f"search:{token}:{rank!r}:{car_id}"
+
+
+def decode_cursor(data):
+    """Parse callback data from encode_cursor; returns None when malformed"""
+    try:
+        _, token, rank, car_id = data.split(":", 3)
+        return token, float(rank), int(car_id)
+    except ValueError:
+        return None
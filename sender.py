@@ -0,0 +1,263 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import (
+    TelegramEntityTooLarge,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bot API methods that post or change messages in a chat and therefore count
+# against Telegram's flood limits. Everything else (getUpdates, setWebhook,
+# getMe, ...) bypasses the scheduler.
+RATE_LIMITED_PREFIXES = ("send", "copy", "forward", "edit")
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens every `per` seconds, up to `burst`"""
+
+    def __init__(self, rate, per, burst=None):
+        self.capacity = float(burst if burst is not None else rate)
+        self.fill_rate = rate / per
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.fill_rate)
+        self.updated = now
+
+    def delay(self, cost=1):
+        """Take `cost` tokens and return 0, or return how long to wait for them"""
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.fill_rate
+
+    async def acquire(self, cost=1):
+        while True:
+            wait = self.delay(cost)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    def pause(self, seconds):
+        """Block the bucket entirely, e.g. after Telegram answered 429"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+    def is_idle(self):
+        now = time.monotonic()
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
+
+
+def is_group_chat(chat_id):
+    """Channels and groups have negative ids or @usernames"""
+    if isinstance(chat_id, str):
+        return chat_id.startswith("@") or chat_id.startswith("-")
+    return chat_id < 0
+
+
+def method_cost(method):
+    media = getattr(method, "media", None)
+    if isinstance(media, list):
+        return max(1, len(media))
+    return 1
+
+
+class SendScheduler:
+    """Central outbound queue for Bot API sends.
+
+    Each chat gets its own FIFO lane drained by one task, so messages to a
+    chat stay ordered while a slow channel never holds up private replies.
+    Every send takes a token from its chat's bucket and from the global
+    bucket. RetryAfter pauses both buckets for the time Telegram asks for,
+    and network/5xx errors are retried with capped exponential backoff.
+    """
+
+    def __init__(
+        self,
+        global_rate=30, global_per=1.0,
+        group_rate=20, group_per=60.0,
+        private_rate=1, private_per=1.0, private_burst=5,
+        max_retries=5, base_backoff=0.5, max_backoff=30.0,
+        max_idle_buckets=10000
+    ):
+        self.global_bucket = TokenBucket(global_rate, global_per)
+        self.group_limits = (group_rate, group_per, None)
+        self.private_limits = (private_rate, private_per, private_burst)
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.max_idle_buckets = max_idle_buckets
+        self._buckets = {}
+        self._lanes = {}
+        self._tasks = {}
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+
+    @property
+    def queue_depth(self):
+        """Number of sends waiting or in flight across all chats"""
+        return sum(len(lane) for lane in self._lanes.values())
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "active_chats": len(self._lanes),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+        }
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.max_idle_buckets:
+                self._prune_buckets()
+            rate, per, burst = self.group_limits if is_group_chat(chat_id) else self.private_limits
+            bucket = self._buckets[chat_id] = TokenBucket(rate, per, burst)
+        return bucket
+
+    def _prune_buckets(self):
+        for chat_id in [c for c, b in self._buckets.items() if c not in self._lanes and b.is_idle()]:
+            del self._buckets[chat_id]
+
+    def submit(self, chat_id, call, cost=1):
+        """Queue `call` (a zero-argument coroutine factory) for chat_id"""
+        future = asyncio.get_running_loop().create_future()
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            lane = self._lanes[chat_id] = deque()
+        lane.append((call, cost, future))
+        if chat_id not in self._tasks:
+            self._tasks[chat_id] = asyncio.create_task(self._drain(chat_id))
+        return future
+
+    async def send(self, chat_id, call, cost=1):
+        return await self.submit(chat_id, call, cost)
+
+    async def _drain(self, chat_id):
+        lane = self._lanes[chat_id]
+        try:
+            while lane:
+                call, cost, future = lane[0]
+                if not future.cancelled():
+                    try:
+                        result = await self._execute(chat_id, call, cost)
+                    except Exception as e:
+                        if not future.done():
+                            future.set_exception(e)
+                    else:
+                        if not future.done():
+                            future.set_result(result)
+                lane.popleft()
+        finally:
+            # Cancelled (on close): nobody will send the rest, so release
+            # the callers waiting on them
+            for _, _, future in lane:
+                if not future.done():
+                    future.cancel()
+            self._lanes.pop(chat_id, None)
+            self._tasks.pop(chat_id, None)
+
+    async def _execute(self, chat_id, call, cost):
+        bucket = self._bucket(chat_id)
+        attempt = 0
+        while True:
+            await bucket.acquire(cost)
+            await self.global_bucket.acquire(cost)
+            try:
+                result = await call()
+                self.sent += 1
+                return result
+            except TelegramEntityTooLarge:
+                self.failed += 1
+                raise
+            except TelegramRetryAfter as e:
+                error = e
+                wait = e.retry_after
+                # A 429 does not say which limit was hit. The chat buckets
+                # already keep each chat under its own limit, so treat it as
+                # the bot-wide one too and hold every lane, not just this one
+                bucket.pause(wait)
+                self.global_bucket.pause(wait)
+                logger.warning(f"⏳ Flood limit in chat {chat_id}, retrying in {wait}s")
+            except (TelegramNetworkError, TelegramServerError) as e:
+                error = e
+                wait = min(self.max_backoff, self.base_backoff * (2 ** attempt))
+                wait += random.uniform(0, wait / 2)
+                logger.warning(f"⚠️ Send to {chat_id} failed ({e}), retrying in {wait:.1f}s")
+            except Exception:
+                self.failed += 1
+                raise
+
+            attempt += 1
+            if attempt > self.max_retries:
+                self.failed += 1
+                logger.error(f"❌ Giving up on send to {chat_id} after {attempt} attempts")
+                raise error
+            self.retried += 1
+            await asyncio.sleep(wait)
+
+    async def close(self, timeout=10.0):
+        """Let queued sends finish, cancelling whatever is left after timeout"""
+        tasks = list(self._tasks.values())
+        if not tasks:
+            return
+        logger.info(f"Draining {self.queue_depth} queued send(s)...")
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Dropped sends for {len(pending)} chat(s) on shutdown")
+
+
+async def fan_out(targets, send, concurrency=5):
+    """Run send(target) for every target with at most `concurrency` in flight.
+
+    Returns a list of (target, exception) for the sends that failed, so the
+    caller can report them together instead of one by one.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(target):
+        async with semaphore:
+            await send(target)
+
+    targets = list(targets)
+    results = await asyncio.gather(*(run(t) for t in targets), return_exceptions=True)
+    return [(t, r) for t, r in zip(targets, results) if isinstance(r, BaseException)]
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """Route every rate-limited Bot API call through a SendScheduler"""
+
+    def __init__(self, scheduler):
+        self.scheduler = scheduler
+
+    async def __call__(self, make_request, bot, method):
+        chat_id = getattr(method, "chat_id", None)
+        api_method = getattr(method, "__api_method__", "")
+        if chat_id is None or not api_method.startswith(RATE_LIMITED_PREFIXES):
+            return await make_request(bot, method)
+        return await self.scheduler.send(
+            chat_id,
+            lambda: make_request(bot, method),
+            cost=method_cost(method)
+        )
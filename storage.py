@@ -0,0 +1,175 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage
+
+logger = logging.getLogger(__name__)
+
+
+def key_to_str(key):
+    return f"{key.bot_id}:{key.chat_id}:{key.user_id}:{key.thread_id or ''}:{key.destiny}"
+
+
+class _Record:
+    __slots__ = ("state", "data", "touched")
+
+    def __init__(self, state=None, data=None, touched=None):
+        self.state = state
+        self.data = data if data is not None else {}
+        self.touched = touched if touched is not None else time.time()
+
+
+class SQLiteStorage(BaseStorage):
+    """Persistent FSM storage on the shared SQLite database.
+
+    Recently used drafts are cached in memory. Writes only mark a record
+    dirty, and a flusher task writes every dirty record in one transaction
+    every `flush_interval` seconds, so the several update_data calls a wizard
+    step makes become one row write. Records idle longer than
+    `cache_seconds` are dropped from memory (they stay on disk), and a
+    sweeper deletes drafts idle for longer than `ttl` seconds.
+    """
+
+    def __init__(
+        self, database, ttl=24 * 3600, flush_interval=0.5,
+        cache_seconds=300, sweep_interval=600
+    ):
+        self.database = database
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.cache_seconds = cache_seconds
+        self.sweep_interval = sweep_interval
+        self._cache = {}
+        self._dirty = set()
+        self._load_locks = {}
+        self._tasks = []
+
+    def start(self):
+        self._tasks = [
+            asyncio.create_task(self._flush_loop()),
+            asyncio.create_task(self._sweep_loop()),
+        ]
+        logger.info(f"✅ FSM storage started (draft TTL {self.ttl}s)")
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.database.is_open:
+            await self.flush()
+
+    async def _record(self, key):
+        skey = key_to_str(key)
+        record = self._cache.get(skey)
+        if record is not None:
+            return skey, record
+        # Only one coroutine loads a given key from disk
+        lock = self._load_locks.setdefault(skey, asyncio.Lock())
+        async with lock:
+            record = self._cache.get(skey)
+            if record is None:
+                row = await self.database.fetchone(
+                    "SELECT state, data, updated_at FROM fsm_storage WHERE key = ?",
+                    (skey,)
+                )
+                if row and row[2] >= time.time() - self.ttl:
+                    record = _Record(row[0], json.loads(row[1]) if row[1] else {}, row[2])
+                else:
+                    record = _Record()
+                self._cache[skey] = record
+        self._load_locks.pop(skey, None)
+        return skey, record
+
+    def _touch(self, skey, record):
+        record.touched = time.time()
+        self._dirty.add(skey)
+
+    async def set_state(self, key, state=None):
+        skey, record = await self._record(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._touch(skey, record)
+
+    async def get_state(self, key):
+        _, record = await self._record(key)
+        return record.state
+
+    async def set_data(self, key, data):
+        skey, record = await self._record(key)
+        record.data = data.copy()
+        self._touch(skey, record)
+
+    async def get_data(self, key):
+        _, record = await self._record(key)
+        return record.data.copy()
+
+    async def flush(self):
+        """Write every dirty record in a single transaction"""
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+        upserts, deletes = [], []
+        for skey in dirty:
+            record = self._cache.get(skey)
+            if record is None:
+                continue
+            if record.state is None and not record.data:
+                deletes.append((skey,))
+            else:
+                upserts.append((skey, record.state, json.dumps(record.data), record.touched))
+        try:
+            async with self.database.writer() as db:
+                if upserts:
+                    await db.executemany(
+                        '''INSERT INTO fsm_storage (key, state, data, updated_at)
+                        VALUES (?, ?, ?, ?)
+                        ON CONFLICT(key) DO UPDATE SET
+                            state = excluded.state,
+                            data = excluded.data,
+                            updated_at = excluded.updated_at''',
+                        upserts
+                    )
+                if deletes:
+                    await db.executemany("DELETE FROM fsm_storage WHERE key = ?", deletes)
+        except Exception:
+            # Keep the records dirty so the next flush retries them
+            self._dirty |= dirty
+            raise
+
+    def _evict_idle(self):
+        cutoff = time.time() - self.cache_seconds
+        for skey in [k for k, r in self._cache.items() if r.touched < cutoff and k not in self._dirty]:
+            del self._cache[skey]
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+                self._evict_idle()
+            except Exception as e:
+                logger.error(f"❌ FSM storage flush failed: {e}")
+
+    async def sweep(self):
+        """Delete drafts that have been idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        for skey in [k for k, r in self._cache.items() if r.touched < cutoff]:
+            self._cache.pop(skey, None)
+            self._dirty.discard(skey)
+        async with self.database.writer() as db:
+            cursor = await db.execute("DELETE FROM fsm_storage WHERE updated_at < ?", (cutoff,))
+            removed = cursor.rowcount
+        if removed:
+            logger.info(f"🧹 Evicted {removed} abandoned draft(s)")
+        return removed
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                logger.error(f"❌ FSM storage sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
@@ -0,0 +1,474 @@
+import string
+from datetime import datetime
+from operator import itemgetter
+
+# ====================
+# MESSAGE TEMPLATES
+# ====================
+# Every message is compiled once at startup: the static parts (channel,
+# broker name, agent phone block) are merged into the literal text, leaving
+# a list of literals with a slot between each two for a per-ad field.
+# Rendering copies that list, drops the field values into the slots and
+# joins it, so the template text is never parsed again.
+
+
+def compile_template(text, **static):
+    """Compile `text` into a function taking its remaining {fields} as keywords.
+
+    Fields that are not passed render as an empty string.
+    """
+    parts = [""]
+    names = []
+    for literal, field, spec, conversion in string.Formatter().parse(text):
+        parts[-1] += literal
+        if field is None:
+            continue
+        if spec or conversion:
+            raise ValueError(f"Unsupported template field {{{field}}}")
+        if field in static:
+            parts[-1] += str(static[field])
+        else:
+            if not field.isidentifier():
+                raise ValueError(f"Invalid template field {{{field}}}")
+            names.append(field)
+            parts += [None, ""]
+    if not names:
+        rendered = parts[0]
+        return lambda: rendered
+
+    if len(names) == 1:
+        name = names[0]
+        values = lambda fields: (fields[name],)
+    else:
+        values = itemgetter(*names)
+
+    def render(**fields):
+        filled = parts.copy()
+        try:
+            filled[1::2] = values(fields)
+        except KeyError:
+            filled[1::2] = [fields.get(name, "") for name in names]
+        # The values live on in `filled`; freeing the keyword dict first keeps
+        # it and the rendered message from being allocated at the same time
+        del fields
+        try:
+            return "".join(filled)
+        except TypeError:
+            # Only non-str values (year, car_id, counts) pay for str()
+            filled[1::2] = map(str, filled[1::2])
+            return "".join(filled)
+    return render
+
+
+def format_broker_phones(phones):
+    """Return formatted broker phones with agent labels and hotline"""
+    formatted = [f"• Agent #{i + 1} - {phone}" for i, phone in enumerate(phones)]
+    formatted.append("• Hotline/Call Center - 5555 (Coming Soon)")
+    return "\n".join(formatted)
+
+
+WELCOME = """🏎️ *Welcome to Addis Car Hub!* 🤝
+
+We are reliable and efficient car brokers operating in Addis Ababa!
+
+*Why choose us?*
+✅ Accurate and verified cars only
+✅ Secure brokerage service
+✅ 2-10% commission (based on prior agreement)
+✅ All communications through us
+✅ Dedicated hotline coming soon!
+
+*Post your car in 2 minutes:*
+1. Choose for sale or rental
+2. Enter your car details
+3. Add photos
+4. It will be listed on @AddisCarHub channel!
+
+*User privacy:* We protect your personal information. All inquiries come through us.
+
+*Need help?* Call our agents or use our hotline!
+
+Choose from the options below:"""
+
+HOW_IT_WORKS = """*🤝 How Addis Ababa Car Rental & Sales Hub Works*
+
+1. *You enter your car details* through this bot
+2. *We verify* and post it on @AddisCarHub
+3. *Buyers/renters* contact us (not directly with you)
+4. *We connect you* with serious buyers
+5. *The transaction completes* with our brokerage service
+
+*Commission:*
+• Sale: 2% of sale price
+• Rental: 10% of rental price
+
+*Benefits:*
+✅ Your privacy is protected
+✅ Verified buyers only
+✅ Assistance with price negotiation
+✅ Assistance with paperwork
+
+*Contact Options:*
+• Call our agents directly
+• Use our hotline (coming soon)
+• Message us on Telegram
+
+🚗 Start by listing your car for sale or 🏢 for rental!"""
+
+CONTACT = """*📞 Contact Our Team*
+
+{broker_name}
+*Agents & Hotline:*
+{broker_phones}
+
+*Working Hours:* 9:00 AM - 6:00 PM
+*Services:* Car brokerage, verification, negotiation
+
+*For urgent matters:* Call agents directly
+
+*Note:* Hotline/Call Center (5555) coming soon!
+
+*Channel:* {channel}
+*Bot:* @AddisCarHubBot"""
+
+STATS = """📊 *Your Statistics*
+
+• Ads posted: {ads}
+• Total ads in system: {total}
+• Member since: {since}
+
+*Contact Information:*
+• Channel: {channel}
+• Agent #1: 0911564697
+• Agent #2: 0913550415
+• Hotline: 5555 (Coming Soon)
+
+Keep posting! Every ad increases your sales/rental chances."""
+
+NO_STATS = "You haven't posted any ads yet. To start, use 🚗 Car for Sale or 🏢 Car for Rental!"
+
+SALE_AD = """🚗 *For Sale - {make} {model} {year}*
+
+📋 *Details:*
+• Make: {make}
+• Model: {model}
+• Year: {year}
+• Color: {color}
+• Plate: {plate}
+• Price: *{price} Birr*
+
+🔧 *Condition:*
+{condition}
+
+🤝 *Brokerage Service:*
+• Verified details
+• Seller protection
+• Price negotiation assistance
+• Paperwork verification
+
+📞 *Contact Our Agents:*
+{broker_phones}
+*Telegram:* @AddisCarHubBot
+
+⚠️ *Note:* All communications through agents only.
+
+#{make_tag} #{model_tag}
+#CarSale #Automobile #AddisCarHub
+
+*Want to sell your car?* Use @AddisCarHubBot"""
+
+RENTAL_AD = """🏢 *For Rental - {make} {model} {year}*
+
+📋 *Rental Details:*
+• Make: {make}
+• Model: {model}
+• Year: {year}
+• Plate Code: {plate_code}
+• Daily Price: *{price} Birr/Day*
+• Advance Payment: {rental_advanced}
+• Warranty Required: {rental_warranty}
+• Rental Purpose: {rental_purpose}
+• Available Region: {rental_region}
+
+🔧 *Condition and Terms:*
+{condition}
+
+🤝 *Brokerage Service:*
+• Verified rental
+• Contract assistance
+• Security deposit management
+• Maintenance guidance
+
+📞 *Contact Our Agents:*
+{broker_phones}
+*Telegram:* @AddisCarHubBot
+
+⚠️ *Note:* All rental arrangements through agents only.
+
+#{make_tag} #{model_tag}
+#CarRental #Rental #AddisCarHub
+
+*Need to rent a car?* Use @AddisCarHubBot"""
+
+THANK_YOU = """🎉 *Thank you for using Addis Car Hub!* 🚗
+
+✅ Your {make} {model} has been posted on @AddisCarHub channel (ad #{car_id}).
+
+*What happens next?*
+1. Our agents verify the details
+2. Interested {parties} contact us
+3. We connect you with serious interested parties
+4. We assist with negotiation and paperwork
+
+*Your privacy is protected:*
+• Your phone number is confidential
+• All communications go through us
+• We verify all parties
+
+*Commission:* {commission}
+
+*{closed_question}*
+Send /{closed} {car_id}, or /price {car_id} followed by the new price, and we update the channel post.
+
+*Share with friends and family:*
+🤖 Bot: @AddisCarHubBot
+📢 Channel: @AddisCarHub
+
+*Need help?* Contact our agents:
+• Agent #1 - 0911564697
+• Agent #2 - 0913550415
+• Hotline - 5555 (Coming Soon)
+
+Thank you for trusting Addis Car Hub! 🙏"""
+
+ADMIN_NOTIFICATION = """🔔 New car advertisement added!
+
+👤 User Information:
+• Name: {full_name}
+• Telegram ID: @{username}
+• Phone Number: {user_phone}
+
+🚗 Car Information:
+• Type: {type_label}
+• Make: {make}
+• Model: {model}
+• Year: {year}
+• Price: {price} Birr
+• Condition: {condition}...
+
+⏰ Time: {time}
+
+📢 Advertisement has been posted on channel: {channel}
+
+📞 Contact Information:
+{broker_phones}
+
+🔗 Bot: @AddisCarHubBot
+🔗 Channel: {channel}
+"""
+
+SEARCH_USAGE = """🔎 *Search listings*
+
+Send /search followed by what you are looking for.
+Example: /search toyota vitz white"""
+
+SEARCH_HEADER = "🔎 Results for \"{query}\":\n"
+
+SEARCH_RESULT = "#{car_id} • {make} {model} {year} • {price} Birr{suffix}"
+
+SEARCH_EMPTY = "🔎 No listings match your search. Try fewer or different words."
+
+ALERT_USAGE = """🔔 *Saved search alerts*
+
+Get a message as soon as a matching car is posted.
+Example: /alert toyota vitz under 1.5M 2015+
+Also: rental, over 500k, 2012-2016, before 2018
+
+/alerts lists your alerts, /unalert <number> removes one."""
+
+ALERT_SAVED = "🔔 Alert #{alert_id} saved: {criteria}\nWe will message you when a matching car is posted."
+
+ALERT_UNKNOWN_MAKE = """⚠️ "{make}" is not a make we know, so this alert may never match. Alerts start with the make, for example: /alert toyota vitz"""
+
+ALERT_LIMIT = "You already have {limit} alerts. Remove one with /unalert <number> first."
+
+ALERT_LIST_EMPTY = "You have no alerts. Create one with /alert, for example: /alert toyota vitz under 1.5M"
+
+ALERT_MATCH = """🔔 A new car matches your alert!
+
+{make} {model} {year} • {price} Birr{suffix}
+
+See the full ad on {channel} and call {primary_contact} to arrange a viewing."""
+
+
+EXPORT_USAGE = """📤 Export ads as a compressed spreadsheet (admins only)
+
+/export [csv|jsonl] [sale|rental] [archive] [status=active] [from=2024-01-01] [to=2024-12-31]
+Example: /export sale from=2024-06-01
+Add "archive" for expired, sold and rented ads"""
+
+
+AD_UPDATE_USAGE = """✏️ *Update your ad*
+
+/sold 123 - mark a sale ad as sold
+/rented 123 - mark a rental ad as rented
+/price 123 1.5M - lower the price
+
+Use the ad number from your confirmation message. The channel post is edited in place."""
+
+# Put above the ad in its channel post once the status or price changes
+STATUS_BANNERS = {
+    "sold": "✅ *SOLD*",
+    "rented": "✅ *RENTED*",
+}
+
+PRICE_DROP_BANNER = "📉 *Price reduced!* Was {old_price} Birr{period}"
+
+
+class Templates:
+    """All bot messages, compiled once for the configured broker and channel"""
+
+    def __init__(self, broker_name, broker_phones, channel):
+        static = {
+            "broker_name": broker_name,
+            "broker_phones": format_broker_phones(broker_phones),
+            "channel": channel,
+        }
+        self.broker_phones = static["broker_phones"]
+        self.welcome = WELCOME
+        self.how_it_works = HOW_IT_WORKS
+        self.contact = compile_template(CONTACT, **static)()
+        self.no_stats = NO_STATS
+        self._stats = compile_template(STATS, **static)
+        self._sale_ad = compile_template(SALE_AD, **static)
+        self._rental_ad = compile_template(RENTAL_AD, **static)
+        self._thank_you = {
+            "sale": compile_template(THANK_YOU, parties="buyers", commission="2% of sale price",
+                                     closed="sold", closed_question="Sold it or lowering the price?"),
+            "rental": compile_template(THANK_YOU, parties="renters", commission="10% of rental price",
+                                       closed="rented", closed_question="Rented it out or lowering the price?"),
+        }
+        self._admin_notification = compile_template(ADMIN_NOTIFICATION, **static)
+        self.search_usage = SEARCH_USAGE
+        self.search_empty = SEARCH_EMPTY
+        self._search_header = compile_template(SEARCH_HEADER)
+        self._search_result = compile_template(SEARCH_RESULT)
+        self.alert_usage = ALERT_USAGE
+        self.alert_list_empty = ALERT_LIST_EMPTY
+        self.export_usage = EXPORT_USAGE
+        self.ad_update_usage = AD_UPDATE_USAGE
+        self._price_drop = compile_template(PRICE_DROP_BANNER)
+        self._alert_saved = compile_template(ALERT_SAVED)
+        self._alert_limit = compile_template(ALERT_LIMIT)
+        self._alert_unknown_make = compile_template(ALERT_UNKNOWN_MAKE)
+        self._alert_match = compile_template(
+            ALERT_MATCH,
+            channel=channel,
+            primary_contact=broker_phones[0] if broker_phones else "0911564697"
+        )
+
+    def stats(self, ads, total, registered_at):
+        return self._stats(
+            ads=ads,
+            total=total,
+            since=registered_at[:10] if registered_at else 'today'
+        )
+
+    def ad(self, data):
+        """Channel post for a completed CarForm draft"""
+        make, model = data['make'], data['model']
+        if data.get('car_type', 'sale') == 'sale':
+            return self._sale_ad(
+                make=make,
+                model=model,
+                year=data['year'],
+                color=data['color'],
+                plate=f"{data['plate_code']} {data.get('plate_full', '')} {data.get('plate_region', '')}",
+                price=data['price'],
+                condition=data['condition'],
+                make_tag=make.replace(" ", ""),
+                model_tag=model.replace(" ", "")
+            )
+        return self._rental_ad(
+            make=make,
+            model=model,
+            year=data['year'],
+            plate_code=data.get('plate_code', ''),
+            price=data['price'],
+            rental_advanced=data.get('rental_advanced', ''),
+            rental_warranty=data.get('rental_warranty', ''),
+            rental_purpose=data.get('rental_purpose', ''),
+            rental_region=data.get('rental_region', ''),
+            condition=data['condition'],
+            make_tag=make.replace(" ", ""),
+            model_tag=model.replace(" ", "")
+        )
+
+    def channel_post(self, data, posted_price=None):
+        """Channel post for a cars row, with a banner once it is sold, rented
+        or cheaper than the price it was posted at"""
+        text = self.ad(data)
+        banner = STATUS_BANNERS.get(data.get('status'))
+        if banner is None and posted_price and data['price'] != posted_price:
+            banner = self._price_drop(
+                old_price=posted_price,
+                period='/Day' if data.get('car_type') == 'rental' else ''
+            )
+        return f"{banner}\n\n{text}" if banner else text
+
+    def thank_you(self, car_type, make, model, car_id):
+        return self._thank_you['sale' if car_type == 'sale' else 'rental'](make=make, model=model, car_id=car_id)
+
+    def admin_notification(self, user_data, ad_data, car_type):
+        return self._admin_notification(
+            full_name=user_data.get('full_name', 'N/A'),
+            username=user_data.get('username', 'N/A'),
+            user_phone=ad_data.get('user_phone', 'N/A'),
+            type_label='Sale' if car_type == 'sale' else 'Rental',
+            make=ad_data.get('make', 'N/A'),
+            model=ad_data.get('model', 'N/A'),
+            year=ad_data.get('year', 'N/A'),
+            price=ad_data.get('price', 'N/A'),
+            condition=ad_data.get('condition', 'N/A')[:100],
+            time=datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+
+    def search_results(self, query, rows):
+        """Plain-text page of search results (user text is not Markdown-safe)"""
+        lines = [self._search_header(query=query)]
+        for car_id, make, model, year, price, car_type, _ in rows:
+            lines.append(self._search_result(
+                car_id=car_id,
+                make=make,
+                model=model,
+                year=year,
+                price=price,
+                suffix='/Day (Rental)' if car_type == 'rental' else ' (Sale)'
+            ))
+        return "\n".join(lines)
+
+    def alert_saved(self, alert_id, criteria, unknown_make=None):
+        text = self._alert_saved(alert_id=alert_id, criteria=criteria)
+        if unknown_make:
+            text += "\n\n" + self._alert_unknown_make(make=unknown_make.title())
+        return text
+
+    def alert_limit(self, limit):
+        return self._alert_limit(limit=limit)
+
+    def alert_list(self, alerts):
+        """Plain-text list of (id, query) rows"""
+        lines = ["🔔 Your alerts:"]
+        lines.extend(f"#{alert_id} • {query}" for alert_id, query in alerts)
+        lines.append("\nRemove one with /unalert <number>.")
+        return "\n".join(lines)
+
+    def alert_match(self, data):
+        """Plain-text alert for a completed CarForm draft"""
+        return self._alert_match(
+            make=data['make'],
+            model=data['model'],
+            year=data['year'],
+            price=data['price'],
+            suffix='/Day (Rental)' if data.get('car_type') == 'rental' else ' (Sale)'
+        )
@@ -0,0 +1,146 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from alerts import Alert, AlertIndex, describe_alert, known_make, parse_alert, save_alert  # noqa: E402
+from database import Database  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+def alert(alert_id, query):
+    fields = parse_alert(query)
+    return Alert(alert_id, 1, query, fields["make"], fields["model"], fields["car_type"],
+                 fields["min_price"], fields["max_price"], fields["min_year"], fields["max_year"])
+
+
+def test_parse_full_alert():
+    assert parse_alert("Toyota Vitz under 1,500,000 birr 2015+") == {
+        "make": "toyota", "model": "vitz", "car_type": "sale",
+        "min_price": None, "max_price": 1_500_000, "min_year": 2015, "max_year": None,
+    }
+
+
+@pytest.mark.parametrize("query, car_type, max_price", [
+    ("toyota vitz under 1.5M", "sale", 1_500_000),
+    ("toyota under 900 2015", "rental", 900),
+    ("rental under 3000", "rental", 3000),
+    ("sale under 80k", "sale", 80_000),
+])
+def test_car_type_follows_the_price(query, car_type, max_price):
+    fields = parse_alert(query)
+    assert (fields["car_type"], fields["max_price"]) == (car_type, max_price)
+
+
+@pytest.mark.parametrize("query", [
+    "toyota under 80k",                 # either a sale or a daily rental price
+    "sale toyota under 900",            # too cheap for a sale
+    "rental under 1.5M",                # too dear for a day's rent
+    "toyota under 1,500,000 over 500",  # one sale and one rental bound
+    "toyota over 2M under 1M",
+    "yaris 1500000",                    # a price without under/over
+    "yaris 1.5m",
+    "toyota 2012 2015",
+])
+def test_rejected_alerts(query):
+    with pytest.raises(ValueError):
+        parse_alert(query)
+
+
+@pytest.mark.parametrize("query, fields", [
+    ("vitz from 2015", {"make": "vitz", "min_year": 2015, "max_year": None}),
+    ("toyota from 500k", {"min_price": 500_000, "min_year": None}),
+    ("bmw 3 series 2012-2016", {"model": "3 series", "min_year": 2012, "max_year": 2016}),
+    ("peugeot 308 before 2018", {"model": "308", "max_year": 2017}),
+    ("hyundai 2015", {"min_year": 2015, "max_year": 2015}),
+])
+def test_parse_names_and_years(query, fields):
+    parsed = parse_alert(query)
+    assert {name: parsed[name] for name in fields} == fields
+
+
+def test_parse_without_criteria():
+    assert parse_alert("") is None
+    assert parse_alert("!!!") is None
+
+
+def test_describe_alert():
+    assert describe_alert(parse_alert("rental corolla under 3000 2015+")) == (
+        "Corolla, for rent, up to 3,000 Birr/day, 2015 or newer"
+    )
+
+
+def test_known_make():
+    assert known_make("toyota")
+    assert not known_make("vitz")
+
+
+def test_match_by_make_model_prefix():
+    index = AlertIndex()
+    index.add(alert(1, "toyota"))
+    index.add(alert(2, "toyota land"))
+    index.add(alert(3, "toyota vitz"))
+    index.add(alert(4, "nissan"))
+    matched = index.match("Toyota", "Land Cruiser", "sale", price=5_000_000, year=2012)
+    assert sorted(a.id for a in matched) == [1, 2]
+
+
+def test_match_price_and_year_bounds():
+    index = AlertIndex()
+    index.add(alert(1, "toyota under 1.5M 2015+"))
+    index.add(alert(2, "toyota over 1M"))
+    index.add(alert(3, "toyota before 2015"))
+    assert [a.id for a in index.match("Toyota", "Vitz", "sale", 1_200_000, 2016)] == [1, 2]
+    assert [a.id for a in index.match("Toyota", "Vitz", "sale", 2_000_000, 2014)] == [2, 3]
+    # Without a price or year only the alerts that bound neither match
+    assert index.match("Toyota", "Vitz", "sale") == []
+
+
+def test_sale_price_alert_skips_rentals():
+    index = AlertIndex()
+    index.add(alert(1, "toyota vitz under 1.5M 2015+"))
+    assert index.match("Toyota", "Vitz", "rental", price=2000, year=2016) == []
+    assert [a.id for a in index.match("Toyota", "Vitz", "sale", 1_400_000, 2016)] == [1]
+
+
+def test_untyped_price_alerts_saved_before_inference():
+    index = AlertIndex()
+    index.add(Alert(1, 1, "toyota under 3000", "toyota", None, None, None, 3000, None, None))
+    index.add(Alert(2, 1, "toyota under 80k", "toyota", None, None, None, 80_000, None, None))
+    assert [a.id for a in index.match("Toyota", "Vitz", "rental", 2500, 2016)] == [1]
+    assert [a.id for a in index.match("Toyota", "Vitz", "sale", 70_000, 2016)] == [2]
+
+
+def test_remove():
+    index = AlertIndex()
+    index.add(alert(1, "toyota"))
+    index.add(alert(2, "toyota"))
+    assert index.remove(1).id == 1
+    assert index.remove(1) is None
+    assert [a.id for a in index.match("Toyota", "Vitz", "sale")] == [2]
+    assert len(index) == 1
+
+
+def test_refresh_applies_one_alert():
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(prefix="test_alerts_"), "test.db")
+        database = Database(path)
+        await database.open()
+        await run_migrations(database)
+        index = AlertIndex()
+        # Saved by another process: only the id arrives here
+        async with database.writer() as db:
+            saved = await save_alert(db, 1, "toyota", parse_alert("toyota"))
+        await index.refresh(database, saved.id)
+        added = [a.id for a in index.match("Toyota", "Vitz", "sale")]
+        async with database.writer() as db:
+            await db.execute("DELETE FROM saved_searches WHERE id = ?", (saved.id,))
+        await index.refresh(database, saved.id)
+        await database.close()
+        return added, len(index)
+
+    assert asyncio.run(run()) == ([1], 0)
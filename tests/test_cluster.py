@@ -0,0 +1,93 @@
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from cluster import Supervisor  # noqa: E402
+from config import Config  # noqa: E402
+
+# A worker that takes 0.2s per update and appends each update_id it handled
+# to a file, stopping on SIGTERM the way bot.run_worker does
+WORKER = """
+import asyncio, signal, sys
+sys.path.insert(0, {root!r})
+from cluster import WorkerLink
+
+async def main(index, socket_path, out):
+    link = WorkerLink(socket_path, index)
+    await link.connect()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, link.stop)
+
+    async def feed(update):
+        await asyncio.sleep(0.2)
+        with open(out, "a") as f:
+            f.write(f"{{update['update_id']}}\\n")
+
+    await link.serve(feed)
+
+asyncio.run(main(int(sys.argv[1]), sys.argv[2], sys.argv[3]))
+"""
+
+
+def update(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "message": {"message_id": update_id, "date": 0, "chat": {"id": chat_id, "type": "private"}},
+    }
+
+
+async def start_supervisor(out):
+    script = WORKER.format(root=ROOT)
+
+    def command(index, socket_path):
+        return [sys.executable, "-c", script, str(index), socket_path, out]
+
+    supervisor = Supervisor(1, command, Config(), max_backoff=0)
+    await supervisor.start()
+    while not supervisor.stats()[0]["alive"]:
+        await asyncio.sleep(0.01)
+    return supervisor
+
+
+def handled(out):
+    with open(out) as f:
+        return sorted(int(line) for line in f)
+
+
+def test_stop_waits_for_unfinished_updates():
+    out = os.path.join(tempfile.mkdtemp(prefix="test_cluster_"), "handled")
+
+    async def run():
+        supervisor = await start_supervisor(out)
+        for i in range(1, 6):
+            supervisor.dispatch(update(i, chat_id=42))
+        await supervisor.stop()
+        return supervisor.stats()[0]["unfinished_updates"]
+
+    assert asyncio.run(run()) == 0
+    assert handled(out) == [1, 2, 3, 4, 5]
+
+
+def test_sigterm_worker_finishes_its_updates():
+    out = os.path.join(tempfile.mkdtemp(prefix="test_cluster_"), "handled")
+
+    async def run():
+        supervisor = await start_supervisor(out)
+        worker = supervisor._workers[0]
+        for i in range(1, 4):
+            supervisor.dispatch(update(i, chat_id=42))
+        await asyncio.sleep(0.05)
+        worker.process.send_signal(signal.SIGTERM)
+        code = await worker.process.wait()
+        unfinished = len(worker.inflight)
+        await supervisor.stop()
+        return code, unfinished
+
+    code, unfinished = asyncio.run(run())
+    assert code == 0
+    assert unfinished == 0
+    assert handled(out) == [1, 2, 3]
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+
+
+async def _open(commit_window=0.0):
+    path = os.path.join(tempfile.mkdtemp(prefix="test_database_"), "test.db")
+    database = Database(path, commit_window=commit_window)
+    await database.open()
+    async with database.writer() as db:
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    return database
+
+
+def test_caller_cancelled_during_group_commit():
+    """A caller cancelled while waiting for COMMIT must not kill the writer"""
+    async def run():
+        database = await _open(commit_window=0.05)
+        ran = asyncio.Event()
+
+        async def write(value):
+            async with database.writer() as db:
+                await db.execute("INSERT INTO t (v) VALUES (?)", (value,))
+                ran.set()
+
+        task = asyncio.create_task(write("cancelled"))
+        await ran.wait()
+        # The block has run; the batch is still open for the commit window
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        await asyncio.wait_for(write("after"), timeout=5)
+        rows = await database.fetchall("SELECT v FROM t ORDER BY id")
+        await asyncio.wait_for(database.close(), timeout=5)
+        return [v for (v,) in rows]
+
+    # The cancelled caller's block was part of the batch, so it is committed
+    assert asyncio.run(run()) == ["cancelled", "after"]
+
+
+def test_failed_block_rolls_back_only_itself():
+    async def run():
+        database = await _open(commit_window=0.05)
+
+        async def write(value, fail=False):
+            async with database.writer() as db:
+                await db.execute("INSERT INTO t (v) VALUES (?)", (value,))
+                if fail:
+                    raise ValueError(value)
+
+        results = await asyncio.gather(
+            write("a"), write("b", fail=True), write("c"), return_exceptions=True
+        )
+        rows = await database.fetchall("SELECT v FROM t ORDER BY id")
+        await database.close()
+        return results, [v for (v,) in rows]
+
+    results, rows = asyncio.run(run())
+    assert isinstance(results[1], ValueError)
+    assert rows == ["a", "c"]
+
+
+def test_open_converts_existing_database_to_incremental_vacuum():
+    path = os.path.join(tempfile.mkdtemp(prefix="test_database_"), "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    conn.executemany("INSERT INTO t (v) VALUES (?)", [("x" * 100,)] * 100)
+    conn.commit()
+    assert conn.execute("PRAGMA auto_vacuum").fetchone() == (0,)
+    conn.close()
+
+    async def run():
+        database = Database(path)
+        await database.open()
+        auto_vacuum = await database.fetchone("PRAGMA auto_vacuum")
+        count = await database.fetchone("SELECT COUNT(*) FROM t")
+        await database.close()
+        return auto_vacuum, count
+
+    assert asyncio.run(run()) == ((2,), (100,))
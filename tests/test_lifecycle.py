@@ -0,0 +1,37 @@
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database  # noqa: E402
+from lifecycle import AdArchiver  # noqa: E402
+from migrations import run_migrations  # noqa: E402
+
+
+def test_archiver_moves_closed_ads_and_releases_pages():
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(prefix="test_lifecycle_"), "test.db")
+        database = Database(path)
+        await database.open()
+        await run_migrations(database)
+        async with database.writer() as db:
+            await db.executemany(
+                "INSERT INTO cars (make, condition, car_type, status) VALUES ('Toyota', ?, 'sale', ?)",
+                [("x" * 2000, "sold" if i % 2 else "active") for i in range(1000)]
+            )
+        archiver = AdArchiver(database, {}, batch_size=100, pause=0)
+        result = await archiver.run_once()
+        live = await database.fetchone("SELECT COUNT(*) FROM cars")
+        archived = await database.fetchone("SELECT COUNT(*) FROM cars_archive WHERE status = 'sold'")
+        (free_pages,) = await database.fetchone("PRAGMA freelist_count")
+        await database.close()
+        return result, live, archived, free_pages
+
+    result, live, archived, free_pages = asyncio.run(run())
+    assert result == (0, 500)
+    assert live == (500,)
+    assert archived == (500,)
+    # The 500 deleted rows' pages went back to the filesystem
+    assert free_pages == 0
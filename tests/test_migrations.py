@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bot  # noqa: E402
+from database import Database  # noqa: E402
+from migrations import run_backfills, run_migrations  # noqa: E402
+
+
+def test_price_backfill_applies_listing_checks():
+    async def run():
+        path = os.path.join(tempfile.mkdtemp(prefix="test_migrations_"), "test.db")
+        database = Database(path)
+        await database.open()
+        await run_migrations(database)
+        async with database.writer() as db:
+            await db.executemany(
+                "INSERT INTO cars (id, price, car_type) VALUES (?, ?, ?)",
+                [(1, "1,200,000", "sale"), (2, "0911564697", "rental"),
+                 (3, "1.5", "sale"), (4, "3000 per month", "rental"), (5, "2500", "rental")]
+            )
+            # Filled in by an earlier backfill that skipped the bounds
+            await db.execute(
+                '''INSERT INTO cars (id, price, car_type, price_birr, price_currency, price_period)
+                VALUES (6, '0911564697', 'sale', 911564697, 'ETB', NULL)'''
+            )
+        await run_backfills(database)
+        rows = await database.fetchall(
+            "SELECT id, price_birr, price_currency, price_period FROM cars ORDER BY id"
+        )
+        await database.close()
+        return rows
+
+    assert asyncio.run(run()) == [
+        (1, 1_200_000, "ETB", None),
+        (2, None, None, None),
+        (3, None, None, None),
+        (4, None, None, None),
+        (5, 2_500, "ETB", "day"),
+        (6, None, None, None),
+    ]
+
+
+def test_failed_migration_stops_startup(monkeypatch):
+    async def broken(database):
+        raise sqlite3.OperationalError("duplicate column name: status")
+
+    monkeypatch.setattr(bot, "run_migrations", broken)
+    with pytest.raises(sqlite3.OperationalError):
+        asyncio.run(bot.init_db())
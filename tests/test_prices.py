@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prices import parse_listing_price, parse_price, price_columns  # noqa: E402
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("1,200,000", (1_200_000, "ETB", None)),
+    ("1.2M", (1_200_000, "ETB", None)),
+    ("1.2 million birr", (1_200_000, "ETB", None)),
+    ("900k", (900_000, "ETB", None)),
+    ("1.500", (1_500, "ETB", None)),
+    ("1.200.000,50", (1_200_000, "ETB", None)),
+    ("12,5", (12, "ETB", None)),
+    ("$15,000", (15_000, "USD", None)),
+    ("2500/day", (2_500, "ETB", "day")),
+    ("3000 per month", (3_000, "ETB", "month")),
+    ("20000 weekly", (20_000, "ETB", "week")),
+])
+def test_parse_price(text, expected):
+    assert parse_price(text) == expected
+
+
+def test_parse_price_default_period():
+    assert parse_price("2,500", "day") == (2_500, "ETB", "day")
+    assert parse_price("2,500 a week", "day") == (2_500, "ETB", "week")
+
+
+@pytest.mark.parametrize("text", ["", None, "negotiable", "0", "99999999999"])
+def test_parse_price_without_a_price(text):
+    assert parse_price(text) is None
+
+
+@pytest.mark.parametrize("text, car_type, expected", [
+    ("1,200,000", "sale", (1_200_000, "ETB", None)),
+    ("1.2M birr", "sale", (1_200_000, "ETB", None)),
+    ("2,500", "rental", (2_500, "ETB", "day")),
+    ("2500 per day", "rental", (2_500, "ETB", "day")),
+])
+def test_parse_listing_price(text, car_type, expected):
+    assert parse_listing_price(text, car_type) == expected
+
+
+@pytest.mark.parametrize("text, car_type", [
+    ("0911564697", "sale"),       # a phone number
+    ("0911564697", "rental"),
+    ("1.5", "sale"),              # a decimal slip
+    ("40,000", "sale"),
+    ("250,000", "rental"),
+    ("50", "rental"),
+    ("3000 per month", "rental"), # rental ads are priced per day
+    ("1.2M per day", "sale"),
+    ("$15,000", "sale"),          # Birr only
+])
+def test_parse_listing_price_rejects(text, car_type):
+    assert parse_listing_price(text, car_type) is None
+
+
+def test_price_columns():
+    assert price_columns((2_500, "ETB", "day")) == (2_500, "ETB", "day")
+    assert price_columns((15_000, "USD", None)) == (None, "USD", None)
+    assert price_columns(None) == (None, None, None)
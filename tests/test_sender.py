@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram.exceptions import TelegramRetryAfter  # noqa: E402
+from aiogram.methods import SendMessage  # noqa: E402
+
+from sender import SendScheduler  # noqa: E402
+
+
+def test_close_cancels_queued_sends():
+    """Callers waiting on sends dropped at shutdown must not hang"""
+    async def run():
+        scheduler = SendScheduler()
+        release = asyncio.Event()
+
+        async def slow():
+            await release.wait()
+
+        async def fast():
+            return "sent"
+
+        futures = [scheduler.submit(1, slow), scheduler.submit(1, fast), scheduler.submit(2, slow)]
+        await asyncio.sleep(0)
+        await scheduler.close(timeout=0.05)
+        return await asyncio.wait_for(
+            asyncio.gather(*futures, return_exceptions=True), timeout=5
+        )
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, asyncio.CancelledError) for r in results)
+
+
+def test_retry_after_pauses_every_chat():
+    async def run():
+        scheduler = SendScheduler(private_burst=5)
+        calls = []
+
+        async def flooded():
+            calls.append("flooded")
+            if len(calls) == 1:
+                raise TelegramRetryAfter(SendMessage(chat_id=1, text="x"), "Flood", 1)
+            return "ok"
+
+        async def other():
+            calls.append("other")
+            return "ok"
+
+        first = scheduler.submit(1, flooded)
+        await asyncio.sleep(0.05)
+        # Chat 2 has its own full bucket but must wait out the 429 as well
+        second = scheduler.submit(2, other)
+        await asyncio.sleep(0.3)
+        waiting = calls.copy()
+        await asyncio.wait_for(asyncio.gather(first, second), timeout=5)
+        await scheduler.close()
+        return waiting
+
+    assert asyncio.run(run()) == ["flooded"]
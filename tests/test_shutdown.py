@@ -0,0 +1,64 @@
+import asyncio
+import os
+import signal
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+
+import bot  # noqa: E402
+from config import Config  # noqa: E402
+
+
+async def fake_bot_api():
+    """Bot API that answers every method with True (setWebhook, deleteWebhook...)"""
+    async def handle(request):
+        return web.json_response({"ok": True, "result": True})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+def test_sigterm_runs_webhook_shutdown():
+    """A deploy's SIGTERM must flush drafts and stop the outbox, not kill the bot"""
+    db_path = os.path.join(tempfile.mkdtemp(prefix="test_shutdown_"), "car_broker.db")
+    bot.create_app(Config(
+        bot_token="123456:TESTtestTEST", bot_mode="webhook", port=0,
+        webhook_url="https://example.invalid", db_path=db_path, log_file=""
+    ))
+    calls = []
+
+    def record(name, method):
+        async def wrapper(*args, **kwargs):
+            calls.append(name)
+            return await method(*args, **kwargs)
+        return wrapper
+
+    bot.fsm_storage.flush = record("flush", bot.fsm_storage.flush)
+    bot.outbox.stop = record("outbox.stop", bot.outbox.stop)
+    bot.database.close = record("database.close", bot.database.close)
+
+    async def run():
+        api_runner, base_url = await fake_bot_api()
+        bot.bot.session.api = TelegramAPIServer.from_base(base_url)
+        task = asyncio.create_task(bot.run_bot())
+        while "ready" not in bot.startup_timings:
+            await asyncio.sleep(0.01)
+        os.kill(os.getpid(), signal.SIGTERM)
+        done, _ = await asyncio.wait({task}, timeout=5)
+        await api_runner.cleanup()
+        return bool(done)
+
+    assert asyncio.run(run()), "run_bot did not stop on SIGTERM"
+    assert "outbox.stop" in calls
+    assert "flush" in calls
+    assert calls[-1] == "database.close"
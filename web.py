@@ -0,0 +1,139 @@
+import logging
+from datetime import datetime
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+# ====================
+# WEB SERVER (aiohttp, shares the bot's event loop)
+# ====================
+
+def render_home():
+    """Landing page shown at /"""
+    return """
+    <html>
+        <head>
+            <title>🚗 Addis Car Hub</title>
+            <meta name="viewport" content="width=device-width, initial-scale=1">
+            <style>
+                body {
+                    font-family: Arial, sans-serif;
+                    text-align: center;
+                    padding: 20px;
+                    background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
+                    color: white;
+                    min-height: 100vh;
+                    display: flex;
+                    align-items: center;
+                    justify-content: center;
+                }
+                .container {
+                    background: rgba(255, 255, 255, 0.95);
+                    padding: 40px;
+                    border-radius: 15px;
+                    box-shadow: 0 10px 30px rgba(0,0,0,0.3);
+                    max-width: 600px;
+                    width: 100%;
+                }
+                h1 {
+                    color: #2c3e50;
+                    margin-bottom: 10px;
+                }
+                .status {
+                    color: #27ae60;
+                    font-weight: bold;
+                    font-size: 24px;
+                    margin: 20px 0;
+                }
+                .links {
+                    margin: 30px 0;
+                }
+                .btn {
+                    display: inline-block;
+                    background: #667eea;
+                    color: white;
+                    padding: 12px 24px;
+                    text-decoration: none;
+                    border-radius: 8px;
+                    margin: 10px;
+                    transition: 0.3s;
+                }
+                .btn:hover {
+                    background: #764ba2;
+                    transform: translateY(-3px);
+                }
+                .info {
+                    color: #333;
+                    margin: 15px 0;
+                    font-size: 14px;
+                }
+            </style>
+        </head>
+        <body>
+            <div class="container">
+                <h1>🚗 Addis Car Hub</h1>
+                <p class="status">✅ Bot and Channel are operational!</p>
+                <p style="color: #666;">Reliable car sales and rental brokerage service in Addis Ababa</p>
+                
+                <div class="links">
+                    <a href="https://t.me/AddisCarHubBot" class="btn">🤖 Our Bot</a>
+                    <a href="https://t.me/AddisCarHub" class="btn">📢 Our Channel</a>
+                </div>
+                
+                <div class="info">
+                    <p>📍 Post your car for sale or rental in 2 minutes via this bot</p>
+                    <p>✅ Verified and accurate car details only</p>
+                    <p>🤝 Brokerage service with 2-10% commission</p>
+                    <p>📞 Hotline: 5555 (Coming Soon)</p>
+                    <p>📞 Agents: 0911564697, 0913550415</p>
+                </div>
+                
+                <p style="color: #888; font-size: 12px; margin-top: 30px;">
+                    Time: """ + datetime.now().strftime("%Y-%m-%d %H:%M:%S") + """<br>
+                    Service: Car Brokerage Bot v2.1
+                </p>
+            </div>
+        </body>
+    </html>
+    """
+
+async def home(request):
+    return web.Response(text=render_home(), content_type="text/html")
+
+async def health(request):
+    payload = {"status": "healthy", "service": "Addis Car Hub Bot"}
+    health_info = request.app.get("health_info")
+    if health_info:
+        payload.update(health_info())
+    return web.json_response(payload)
+
+async def metrics(request):
+    return web.Response(
+        body=request.app["metrics"]().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+    )
+
+def create_web_app(health_info=None, metrics_text=None):
+    """Build the aiohttp application serving /, /health and /metrics
+
+    health_info is an optional callable returning extra fields for /health,
+    metrics_text an optional callable returning the Prometheus exposition.
+    """
+    app = web.Application()
+    app["health_info"] = health_info
+    app["metrics"] = metrics_text
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health)
+    if metrics_text:
+        app.router.add_get("/metrics", metrics)
+    return app
+
+async def start_web_server(app, port):
+    """Start serving app on 0.0.0.0:port without blocking the event loop"""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=port)
+    await site.start()
+    logger.info(f"Web server listening on port {port}")
+    return runner